@@ -0,0 +1,216 @@
+from datetime import datetime, timezone
+from extensions import db, client, socketio, response_cache
+from models import SchoolworkAnalysis
+from routes.schoolwork import prepare_analysis, create_analysis, utf16_len, utf16_tail
+from model_router import model_router, AllModelsFailed
+from async_chat import run_db
+from stream_writer import FLUSH_BYTES, FLUSH_INTERVAL
+import asyncio
+import threading
+import time
+import os
+
+PERSIST_INTERVAL = float(os.environ.get("ANALYSIS_PERSIST_INTERVAL_MS", "1000")) / 1000
+
+# Text already sent to each in-flight analysis room on this worker. Resumes
+# read from here first, the database otherwise.
+_live = {}
+_live_lock = threading.Lock()
+
+
+class PartialStreamError(Exception):
+    # Raised once text has gone out: switching models would repeat the answer.
+    pass
+
+
+def analysis_room(analysis_id) -> str:
+    return f"analysis:{analysis_id}"
+
+
+def persist_analysis(analysis_id, content, status=None):
+    values = {SchoolworkAnalysis.content: content, SchoolworkAnalysis.updated_at: datetime.now(timezone.utc)}
+    if status:
+        values[SchoolworkAnalysis.status] = status
+    SchoolworkAnalysis.query.filter(SchoolworkAnalysis.id == analysis_id).update(values, synchronize_session=False)
+    db.session.commit()
+
+
+def load_analysis(analysis_id, user_id):
+    item = db.session.get(SchoolworkAnalysis, analysis_id)
+    if not item or item.user_id != int(user_id):
+        return None
+    return {"content": item.content, "status": item.status or "complete"}
+
+
+class AnalysisWriter:
+    def __init__(self, app, analysis_id):
+        self.app = app
+        self.analysis_id = analysis_id
+        self.room = analysis_room(analysis_id)
+        self.sent = []
+        self.sent_length = 0
+        self._buffer = []
+        self._buffered = 0
+        self._last_flush = time.monotonic()
+        self._last_persist = time.monotonic()
+
+        with _live_lock:
+            _live[analysis_id] = self
+
+    def text(self) -> str:
+        return "".join(self.sent)
+
+    async def write(self, chunk_text: str):
+        self._buffer.append(chunk_text)
+        self._buffered += len(chunk_text.encode("utf-8"))
+        if self._buffered >= FLUSH_BYTES or time.monotonic() - self._last_flush >= FLUSH_INTERVAL:
+            await self.flush()
+
+    async def flush(self):
+        if not self._buffer:
+            return
+
+        text = "".join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        self._last_flush = time.monotonic()
+
+        # Offsets are frame boundaries in UTF-16 code units (see utf16_tail), so a
+        # resume never lands mid-frame or inside a surrogate pair.
+        offset = self.sent_length
+        with _live_lock:
+            self.sent.append(text)
+            self.sent_length += utf16_len(text)
+
+        socketio.emit("schoolwork:analysis:chunk", {
+            "id": self.analysis_id,
+            "offset": offset,
+            "end": self.sent_length,
+            "chunk": text
+        }, to=self.room)
+
+        if time.monotonic() - self._last_persist >= PERSIST_INTERVAL:
+            self._last_persist = time.monotonic()
+            await run_db(self.app, persist_analysis, self.analysis_id, self.text())
+
+    async def finish(self, status: str):
+        await self.flush()
+        await run_db(self.app, persist_analysis, self.analysis_id, self.text(), status)
+        with _live_lock:
+            _live.pop(self.analysis_id, None)
+
+
+def snapshot(analysis_id):
+    with _live_lock:
+        writer = _live.get(analysis_id)
+        if writer is not None:
+            return "".join(writer.sent), "streaming"
+    return None
+
+
+async def stream_analysis(app, sid, user_id, data_in):
+    # Runs as a fire-and-forget task on the chat loop: every failure has to end
+    # up as a "failed" row and an error frame, or the client spins forever.
+    analysis_id, writer = None, None
+    try:
+        job, error = await run_db(app, prepare_analysis, user_id, data_in)
+        if error:
+            socketio.emit("schoolwork:analysis:error", error[0], to=sid)
+            return
+
+        cached, cache_status = await asyncio.to_thread(response_cache.get, *job["cache_key"], semantic=False)
+        analysis_id = await run_db(app, create_analysis, job, "", "streaming")
+
+        # Runs on the chat loop without a request context, so enter the room on the server directly.
+        socketio.server.enter_room(sid, analysis_room(analysis_id), namespace="/")
+        socketio.emit("schoolwork:analysis:start", {"id": analysis_id, "cache": cache_status}, to=sid)
+
+        writer = AnalysisWriter(app, analysis_id)
+
+        async def attempt(model_name):
+            stream = await client.aio.models.generate_content_stream(model=model_name, contents=job["contents"])
+            try:
+                async for chunk in stream:
+                    chunk_text = getattr(chunk, "text", None)
+                    if chunk_text:
+                        await writer.write(chunk_text)
+            except Exception as e:
+                if writer.sent_length or writer._buffer:
+                    raise PartialStreamError(str(e)) from e
+                raise
+
+            await writer.flush()
+            if not writer.sent_length:
+                raise ValueError("Empty response")
+            return writer.text()
+
+        if cached is not None:
+            await writer.write(cached)
+        else:
+            ai_text, _ = await model_router.acall(attempt, label="schoolwork stream", fatal=(PartialStreamError,))
+            try:
+                await asyncio.to_thread(
+                    response_cache.put, *job["cache_key"], ai_text, prompt_text=job["prompt"], semantic=False
+                )
+            except Exception as e:
+                print(f"Schoolwork stream {analysis_id}: cache store failed: {e}")
+
+        await writer.finish("complete")
+        socketio.emit("schoolwork:analysis:end", {
+            "id": analysis_id,
+            "length": writer.sent_length
+        }, to=analysis_room(analysis_id))
+
+    except Exception as e:
+        print(f"Schoolwork stream {analysis_id} failed: {e}")
+        if analysis_id is not None:
+            try:
+                if writer is not None:
+                    await writer.finish("failed")
+                else:
+                    await run_db(app, persist_analysis, analysis_id, "", "failed")
+            except Exception as persist_error:
+                print(f"Schoolwork stream {analysis_id}: could not mark as failed: {persist_error}")
+
+        error_message = "Failed to connect to AI" if isinstance(e, (AllModelsFailed, PartialStreamError)) else "Analysis failed"
+        socketio.emit("schoolwork:analysis:error", {
+            "id": analysis_id,
+            "error": error_message,
+            "length": writer.sent_length if writer is not None else 0
+        }, to=analysis_room(analysis_id) if analysis_id is not None else sid)
+
+    finally:
+        if analysis_id is not None:
+            with _live_lock:
+                _live.pop(analysis_id, None)
+
+
+def resume_analysis(app, sid, user_id, analysis_id, offset):
+    # Join first, then read: anything emitted after the join reaches the client live,
+    # anything before it is in the snapshot, and the client drops frames whose end it has already seen.
+    room = analysis_room(analysis_id)
+    socketio.server.enter_room(sid, room, namespace="/")
+
+    # The in-process copy is read before the database one: if the writer finishes in
+    # between, the snapshot is still complete, while the stored row could be stale.
+    live = snapshot(analysis_id)
+    with app.app_context():
+        try:
+            stored = load_analysis(analysis_id, user_id)
+        finally:
+            db.session.remove()
+    if stored is None:
+        socketio.server.leave_room(sid, room, namespace="/")
+        return {"error": "Not found"}
+
+    content, status = live or (stored["content"] or "", stored["status"])
+    length = utf16_len(content)
+    offset = max(0, min(offset, length))
+
+    return {
+        "id": analysis_id,
+        "offset": offset,
+        "end": length,
+        "chunk": utf16_tail(content, offset),
+        "status": status
+    }
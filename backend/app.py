@@ -1,86 +1,71 @@
-try:
-    __import__('pysqlite3')
-    import sys
-    sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
-except ImportError:
-    pass
-
-from dotenv import load_dotenv
-load_dotenv()
-
-from flask import Flask
-from flask_cors import CORS
-from werkzeug.exceptions import HTTPException
-from sqlalchemy.pool import NullPool
-from datetime import timedelta
+from app_factory import create_app
+import click
 import os
 
-from extensions import db, jwt, socketio, chroma_client, sentence_transformer_ef
-from models import Event
+from extensions import db, socketio, start_warmup
+from vector_sync import reconcile_events, start_periodic_sync, SYNC_BATCH_SIZE
+from vector_outbox import drain_outbox, start_indexer
+from jobs import start_job_workers
+from migrate_db import run_migrations
 import sockets 
 
-from routes.auth import auth_bp
-from routes.calendar import calendar_bp
-from routes.chat import chat_bp
-from routes.schoolwork import schoolwork_bp
-from routes.scores import scores_bp
-
-app = Flask(__name__)
-CORS(app)
-
-app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config["JWT_SECRET_KEY"] = os.environ.get('JWT_SECRET_KEY')
-app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(days=7)
-app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
-    "poolclass": NullPool,
-    "connect_args": {
-        "prepare_threshold": None
-    }
-}
-
-db.init_app(app)
-jwt.init_app(app)
-socketio.init_app(app, cors_allowed_origins="*", async_mode="threading")
-
-app.register_blueprint(auth_bp)
-app.register_blueprint(calendar_bp)
-app.register_blueprint(chat_bp)
-app.register_blueprint(schoolwork_bp)
-app.register_blueprint(scores_bp)
-
-
-@app.errorhandler(Exception)
-def handle_exception(e):
-    if isinstance(e, HTTPException):
-        return e
-
-    print(f"SERVER CRASH: {e}")
-
-    return {"error": "An unexpected error occurred on the server"}, 500
-
-
-with app.app_context():
-    db.create_all()
-
-    collection = chroma_client.get_or_create_collection(
-        name="user_events",
-        embedding_function=sentence_transformer_ef
-    )
-
-    if collection.count() == 0:
-        print("ChromaDB is empty. Syncing from SQL...")
-        all_events = Event.query.all()
-        if all_events:
-            collection.add(
-                ids=[str(e.id) for e in all_events],
-                documents=[f"Date: {e.date}, Type: {e.type}, Task: {e.description}" for e in all_events],
-                metadatas=[{"user_id": str(e.user_id)} for e in all_events]
-            )
-            print(f"Synced {len(all_events)} events to ChromaDB.")
-    else:
-        print(f"ChromaDB already contains {collection.count()} events. Skipping sync.")
+# Schema and data migrations run in the release phase (`python migrate_db.py`),
+# not here: every gunicorn worker imports this module.
+app = create_app()
+
+
+def sync_events_to_chroma():
+    with app.app_context():
+        try:
+            reconcile_events()
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            db.session.remove()
+
+
+@app.cli.command("sync-events")
+@click.option(
+    "--full", is_flag=True,
+    help="Rescan every event and drop index entries missing from SQL. Incremental runs already pick up "
+         "new, edited (updated_at) and deleted (tombstoned) events; --full also repairs rows changed "
+         "without updating updated_at or deleted without a tombstone."
+)
+@click.option("--batch-size", default=SYNC_BATCH_SIZE, show_default=True)
+def sync_events_command(full, batch_size):
+    reconcile_events(full=full, batch_size=batch_size)
+
+
+if os.environ.get("WARMUP_ON_START", "1") == "1":
+    start_warmup(after=sync_events_to_chroma)
+
+
+@app.cli.command("drain-outbox")
+def drain_outbox_command():
+    total = 0
+    while True:
+        processed = drain_outbox()
+        total += processed
+        if not processed:
+            break
+    print(f"Indexed {total} outbox entries.")
+
+
+if os.environ.get("VECTOR_INDEXER", "1") == "1":
+    start_indexer(app, float(os.environ.get("VECTOR_INDEXER_INTERVAL", "1")))
+
+# Jobs normally run in worker.py; a single-process deployment can run them here instead.
+job_workers_in_app = int(os.environ.get("JOB_WORKERS_IN_APP", "0"))
+if job_workers_in_app > 0:
+    start_job_workers(app, job_workers_in_app)
+
+sync_interval = float(os.environ.get("EVENT_SYNC_INTERVAL", "0"))
+if sync_interval > 0:
+    start_periodic_sync(app, sync_interval)
 
 if __name__ == "__main__":
+    # The development server is a single process, so it can migrate on start.
+    run_migrations(app)
     socketio.run(app, host="0.0.0.0", port=5000, debug=True, allow_unsafe_werkzeug=True)
 
@@ -0,0 +1,94 @@
+try:
+    __import__('pysqlite3')
+    import sys
+    sys.modules['sqlite3'] = sys.modules.pop('pysqlite3')
+except ImportError:
+    pass
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from flask import Flask
+from flask_cors import CORS
+from werkzeug.exceptions import HTTPException
+from datetime import timedelta
+import socketio as socketio_server
+import os
+
+from extensions import db, jwt, socketio
+from db_pool import engine_options_from_env
+
+from routes.auth import auth_bp
+from routes.blobs import blobs_bp
+from routes.calendar import calendar_bp
+from routes.chat import chat_bp
+from routes.jobs import jobs_bp
+from routes.schoolwork import schoolwork_bp
+from routes.scores import scores_bp
+from routes.status import status_bp
+
+
+def socketio_client_manager(url):
+    # kombu's SQL transports have no fanout, so a push would reach only one
+    # process. The filesystem transport has it and needs no broker, which makes
+    # it the local/single-host option; redis:// or amqp:// go through the default path.
+    if url.startswith(("sqla+", "sqlalchemy+")):
+        raise ValueError("SOCKETIO_MESSAGE_QUEUE: kombu's SQL transport can't broadcast between workers; use filesystem://, redis:// or amqp://")
+    if not url.startswith("filesystem://"):
+        return None
+
+    folder = os.environ.get("SOCKETIO_QUEUE_PATH", "./socketio_queue")
+    control = os.path.join(folder, "control")
+    os.makedirs(control, exist_ok=True)
+    return socketio_server.KombuManager(url, channel="flask-socketio", connection_options={
+        "transport_options": {"data_folder_in": folder, "data_folder_out": folder, "control_folder": control}
+    })
+
+
+# Builds the app and binds the extensions, nothing else: schema upgrades, warm-up
+# and background threads are started by app.py for the web process only.
+def create_app():
+    app = Flask(__name__)
+    CORS(app)
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL')
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config["JWT_SECRET_KEY"] = os.environ.get('JWT_SECRET_KEY')
+    app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(days=7)
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options_from_env()
+
+    db.init_app(app)
+    jwt.init_app(app)
+    message_queue = os.environ.get("SOCKETIO_MESSAGE_QUEUE")
+    queue_options = {}
+    if message_queue:
+        client_manager = socketio_client_manager(message_queue)
+        if client_manager is not None:
+            queue_options["client_manager"] = client_manager
+    socketio.init_app(
+        app,
+        cors_allowed_origins="*",
+        async_mode="threading",
+        message_queue=message_queue,
+        **queue_options
+    )
+
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(blobs_bp)
+    app.register_blueprint(calendar_bp)
+    app.register_blueprint(chat_bp)
+    app.register_blueprint(jobs_bp)
+    app.register_blueprint(schoolwork_bp)
+    app.register_blueprint(scores_bp)
+    app.register_blueprint(status_bp)
+
+    @app.errorhandler(Exception)
+    def handle_exception(e):
+        if isinstance(e, HTTPException):
+            return e
+
+        print(f"SERVER CRASH: {e}")
+
+        return {"error": "An unexpected error occurred on the server"}, 500
+
+    return app
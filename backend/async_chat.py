@@ -0,0 +1,111 @@
+from extensions import db, client
+from routes.chat import prepare_chat_turn, save_chat_turn
+from model_router import model_router, AllModelsFailed
+from stream_writer import StreamCancelled
+import asyncio
+import inspect
+import threading
+
+
+class AsyncLoopRunner:
+    def __init__(self, name: str):
+        self.name = name
+        self._loop = None
+        self._lock = threading.Lock()
+
+    def _ensure_loop(self):
+        if self._loop is not None:
+            return self._loop
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name=self.name, daemon=True).start()
+                self._loop = loop
+        return self._loop
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+
+chat_loop = AsyncLoopRunner("chat-loop")
+
+
+async def run_db(app, fn, *args):
+    def call():
+        with app.app_context():
+            try:
+                return fn(*args)
+            finally:
+                db.session.remove()
+
+    return await asyncio.to_thread(call)
+
+
+async def deliver(stream_callback, chunk_text):
+    result = stream_callback(chunk_text)
+    if inspect.isawaitable(result):
+        await result
+
+
+async def generate_reply_async(turn: dict, stream_callback=None):
+    current_parts = turn["parts"]
+
+    async def attempt(model_name):
+        chat = client.aio.chats.create(
+            model=model_name,
+            config=turn["config"],
+            history=turn["history"]
+        )
+
+        if stream_callback is not None:
+            stream_chunks = []
+            stream = None
+            try:
+                stream = await chat.send_message_stream(message=current_parts)
+                async for chunk in stream:
+                    chunk_text = getattr(chunk, "text", None)
+                    if chunk_text:
+                        stream_chunks.append(chunk_text)
+                        await deliver(stream_callback, chunk_text)
+
+                ai_reply = "".join(stream_chunks).strip()
+                if not ai_reply:
+                    raise ValueError("Empty streamed response")
+                return ai_reply
+            except StreamCancelled:
+                # Closing the stream drops the upstream request instead of
+                # letting Gemini finish an answer nobody will read.
+                if stream is not None and hasattr(stream, "aclose"):
+                    await stream.aclose()
+                raise
+            except Exception as stream_error:
+                print(f"Streaming failed for {model_name}, falling back to non-streaming: {stream_error}")
+
+        response = await chat.send_message(message=current_parts)
+        if not response.text:
+            raise ValueError("Empty response")
+        return response.text
+
+    try:
+        ai_reply, _ = await model_router.acall(attempt, label="async chat", fatal=(StreamCancelled,))
+        return ai_reply, None
+    except AllModelsFailed as e:
+        return None, e.last_error
+
+
+async def process_chat_message_async(app, user_id: str, data_in: dict, stream_callback=None):
+    # Retrieval and SQL stay synchronous, so they run on worker threads while the
+    # event loop only holds the open Gemini streams.
+    turn, error = await run_db(app, prepare_chat_turn, user_id, data_in)
+    if error:
+        return error
+
+    try:
+        ai_reply, last_error = await generate_reply_async(turn, stream_callback)
+    except StreamCancelled as e:
+        print(f"Chat stream cancelled: {e}")
+        return {"error": "Client disconnected"}, 499
+    if not ai_reply:
+        return {"error": f"All AI models failed. Last error: {str(last_error)}"}, 500
+
+    return await run_db(app, save_chat_turn, turn, ai_reply)
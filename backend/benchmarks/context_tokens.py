@@ -0,0 +1,44 @@
+import os
+import random
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chat_context import build_conversation_context, estimate_tokens, RECENT_TURNS
+
+# Replays a synthetic session and compares history tokens per turn between the
+# old "top-10 semantic hits, whole documents" prompt and the budgeted builder.
+# Usage: python benchmarks/context_tokens.py [turns] [seed]
+TURNS = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+random.seed(int(sys.argv[2]) if len(sys.argv) > 2 else 7)
+
+
+def synthetic_message(message_id, role):
+    # Students ask short questions; answers vary from a line to a long explanation.
+    words = random.randint(5, 40) if role == "user" else random.choice([40, 120, 300, 600])
+    return {"id": message_id, "role": role, "content": " ".join("word" for _ in range(words))}
+
+
+def main():
+    transcript = []
+    old_tokens, new_tokens = [], []
+
+    for turn in range(TURNS):
+        hits = random.sample(transcript, min(10, len(transcript)))
+        old_tokens.append(sum(estimate_tokens(m["content"]) for m in hits))
+
+        recent = transcript[-RECENT_TURNS:]
+        _, used = build_conversation_context(recent, hits)
+        new_tokens.append(used)
+
+        transcript.append(synthetic_message(2 * turn + 1, "user"))
+        transcript.append(synthetic_message(2 * turn + 2, "model"))
+
+    print(f"turns: {TURNS}")
+    print(f"top-10 semantic:  mean {statistics.mean(old_tokens):.0f}, max {max(old_tokens)} history tokens/turn")
+    print(f"budgeted builder: mean {statistics.mean(new_tokens):.0f}, max {max(new_tokens)} history tokens/turn")
+
+
+if __name__ == "__main__":
+    main()
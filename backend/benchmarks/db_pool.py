@@ -0,0 +1,39 @@
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, text
+from db_pool import engine_options_from_env, pool_status
+
+# Usage: DB_POOL_MODE=queue python benchmarks/db_pool.py [threads] [queries_per_thread]
+THREADS = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+QUERIES = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+
+def main():
+    load_dotenv()
+    engine = create_engine(os.environ["DATABASE_URL"], **engine_options_from_env())
+
+    def worker(_):
+        for _ in range(QUERIES):
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(THREADS) as pool:
+        list(pool.map(worker, range(THREADS)))
+    elapsed = time.perf_counter() - start
+
+    total = THREADS * QUERIES
+    status = pool_status(engine)
+    print(f"mode: {status['mode']}  threads: {THREADS}  queries: {total}")
+    print(f"elapsed: {elapsed:.2f}s  throughput: {total / elapsed:.0f} q/s")
+    print(f"pool: {status['metrics']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# Drives real chat:send sessions against a Socket.IO server in a subprocess and
+# reports what the open streams cost that server in threads and memory. Gemini
+# is replaced by a stub that streams chunks with a delay; retrieval is stubbed
+# out so only the socket and streaming path is measured.
+# Run from the backend directory:
+#   python benchmarks/open_streams.py [streams] [chunks] [chunk_delay_ms]
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+USER_ID = "1"
+
+
+class FakeChunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeChat:
+    def __init__(self, chunks, delay):
+        self.chunks = chunks
+        self.delay = delay
+
+    async def send_message_stream(self, message):
+        async def stream():
+            for i in range(self.chunks):
+                await asyncio.sleep(self.delay)
+                yield FakeChunk(f"chunk {i} ")
+        return stream()
+
+    async def send_message(self, message):
+        await asyncio.sleep(self.delay * self.chunks)
+        return FakeChunk("reply")
+
+
+class FakeAioChats:
+    def __init__(self, chunks, delay):
+        self.chunks = chunks
+        self.delay = delay
+
+    def create(self, model, config=None, history=None):
+        return FakeChat(self.chunks, self.delay)
+
+
+class FakeAio:
+    def __init__(self, chunks, delay):
+        self.chats = FakeAioChats(chunks, delay)
+
+
+class FakeClient:
+    def __init__(self, chunks, delay):
+        self.aio = FakeAio(chunks, delay)
+
+
+class EmptyCollection:
+    def query(self, **kwargs):
+        return {"documents": [[]], "metadatas": [[]], "distances": [[]]}
+
+
+def serve(port, chunks, delay):
+    sys.path.insert(0, BACKEND_DIR)
+    from app_factory import create_app
+    from extensions import db, socketio, client, collection, chat_collection
+    from models import User
+    import retrieval
+    import sockets  # noqa: F401
+
+    object.__setattr__(client, "_target", FakeClient(chunks, delay))
+    object.__setattr__(collection, "_target", EmptyCollection())
+    object.__setattr__(chat_collection, "_target", EmptyCollection())
+    retrieval.embedding_cache = lambda texts: [[0.0] * 8 for _ in texts]
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        if db.session.get(User, int(USER_ID)) is None:
+            db.session.add(User(id=int(USER_ID), email="bench@example.com", password_hash="-"))
+            db.session.commit()
+
+    socketio.run(app, host="127.0.0.1", port=port, allow_unsafe_werkzeug=True, log_output=False)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def proc_status(pid):
+    values = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            name, _, value = line.partition(":")
+            values[name] = value.strip()
+    return int(values["Threads"]), int(values["VmRSS"].split()[0]) / 1024
+
+
+def access_token(secret):
+    from flask import Flask
+    from flask_jwt_extended import JWTManager, create_access_token
+
+    app = Flask(__name__)
+    app.config["JWT_SECRET_KEY"] = secret
+    JWTManager(app)
+    with app.app_context():
+        return create_access_token(identity=USER_ID)
+
+
+def connect_clients(url, token, count):
+    import socketio
+
+    clients, done, errors = [], [], []
+    for i in range(count):
+        sio = socketio.Client()
+        finished = threading.Event()
+
+        def on_error(data, finished=finished):
+            errors.append(data)
+            finished.set()
+
+        sio.on("chat:stream:end", lambda data, finished=finished: finished.set())
+        sio.on("chat:error", on_error)
+        sio.connect(url, transports=["polling"], auth={"token": token})
+        clients.append(sio)
+        done.append(finished)
+    return clients, done, errors
+
+
+def main(streams, chunks, delay):
+    workdir = tempfile.mkdtemp(prefix="open-streams-")
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{workdir}/bench.sqlite3",
+        JWT_SECRET_KEY=os.environ.get("JWT_SECRET_KEY", "benchmark-secret-key-long-enough-for-hs256"),
+        BLOB_STORE_PATH=f"{workdir}/blobs",
+        RESPONSE_CACHE_SEMANTIC="0"
+    )
+    env.pop("SOCKETIO_MESSAGE_QUEUE", None)
+
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--serve", str(port), str(chunks), str(delay * 1000)],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = f"http://127.0.0.1:{port}"
+    token = access_token(env["JWT_SECRET_KEY"])
+
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline or server.poll() is not None:
+                    raise RuntimeError("benchmark server did not start")
+                time.sleep(0.3)
+
+        idle_threads, _ = proc_status(server.pid)
+        clients, done, errors = connect_clients(url, token, streams)
+        time.sleep(1)
+        connected_threads, connected_rss = proc_status(server.pid)
+
+        peak = [connected_threads, connected_rss]
+        sampling = threading.Event()
+
+        def sample():
+            while not sampling.is_set():
+                threads, rss = proc_status(server.pid)
+                peak[0], peak[1] = max(peak[0], threads), max(peak[1], rss)
+                time.sleep(0.05)
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+
+        start = time.perf_counter()
+        for i, sio in enumerate(clients):
+            sio.emit("chat:send", {"session_id": f"bench-{i}", "message": "hello"})
+        finished = sum(event.wait(max(0.0, 120 - (time.perf_counter() - start))) for event in done)
+        elapsed = time.perf_counter() - start
+        sampling.set()
+        sampler.join()
+
+        print(f"streams: {streams}, chunks: {chunks}, chunk delay: {delay * 1000:.0f} ms")
+        print(f"completed {finished - len(errors)}/{streams} in {elapsed:.2f}s, {len(errors)} errors "
+              f"(one stream alone takes {chunks * delay:.2f}s)")
+        print(f"server threads: idle {idle_threads}, with {streams} sockets connected {connected_threads}, "
+              f"peak while streaming {peak[0]} (+{peak[0] - connected_threads} for the streams)")
+        print(f"server RSS: connected {connected_rss:.0f} MB, peak while streaming {peak[1]:.0f} MB")
+
+        for sio in clients:
+            sio.disconnect()
+    finally:
+        server.terminate()
+        server.wait(10)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--serve":
+        serve(int(sys.argv[2]), int(sys.argv[3]), float(sys.argv[4]) / 1000)
+    else:
+        main(
+            int(sys.argv[1]) if len(sys.argv) > 1 else 100,
+            int(sys.argv[2]) if len(sys.argv) > 2 else 20,
+            (float(sys.argv[3]) if len(sys.argv) > 3 else 50) / 1000
+        )
@@ -0,0 +1,73 @@
+import os
+import random
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("WARMUP_ON_START", "0")
+os.environ.setdefault("VECTOR_INDEXER", "0")
+
+from flask_jwt_extended import create_access_token
+from app import app
+from extensions import db
+from models import User
+
+# Saves the same term of grades one request at a time and through /scores/bulk,
+# in-process through the test client so only server-side cost is measured.
+# Usage: DB_POOL_MODE=queue python benchmarks/score_bulk.py [rows]
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+SUBJECTS = ["Math", "Математика", "Physics", "Biology", "English", "History", "Химия"]
+
+
+def make_user():
+    with app.app_context():
+        user = User(email=f"bench-{uuid.uuid4().hex[:8]}@example.com")
+        user.set_password("bench")
+        db.session.add(user)
+        db.session.commit()
+        return {"Authorization": f"Bearer {create_access_token(identity=str(user.id))}"}
+
+
+def rows():
+    return [{
+        "subject": random.choice(SUBJECTS),
+        "score": random.randint(0, 20),
+        "total": 20,
+        "date": f"2026-0{random.randint(1, 6)}-{random.randint(10, 28)}"
+    } for _ in range(ROWS)]
+
+
+def main():
+    client = app.test_client()
+    data = rows()
+
+    headers = make_user()
+    start = time.perf_counter()
+    for row in data:
+        assert client.post("/save-score", json=row, headers=headers).status_code == 201
+    single = time.perf_counter() - start
+
+    headers = make_user()
+    start = time.perf_counter()
+    response = client.post("/scores/bulk", json=data, headers=headers)
+    bulk = time.perf_counter() - start
+    assert response.status_code == 201, response.json
+
+    csv_body = "subject,score,total,date\n" + "\n".join(
+        f"{r['subject']},{r['score']},{r['total']},{r['date']}" for r in data
+    )
+    headers = make_user()
+    start = time.perf_counter()
+    response = client.post("/scores/bulk", data=csv_body.encode(), headers={**headers, "Content-Type": "text/csv"})
+    bulk_csv = time.perf_counter() - start
+    assert response.status_code == 201, response.json
+
+    print(f"rows: {ROWS}")
+    print(f"one at a time: {single:.3f}s  ({ROWS / single:.0f} rows/s)")
+    print(f"bulk json:     {bulk:.3f}s  ({ROWS / bulk:.0f} rows/s, {single / bulk:.1f}x)")
+    print(f"bulk csv:      {bulk_csv:.3f}s  ({ROWS / bulk_csv:.0f} rows/s, {single / bulk_csv:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import os
+import statistics
+import subprocess
+import sys
+
+# Run from the backend directory: python benchmarks/startup.py [runs]
+RUNS = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_ONLY = """
+import time
+start = time.perf_counter()
+import app
+print(time.perf_counter() - start)
+"""
+
+TIME_TO_READY = """
+import time
+start = time.perf_counter()
+import app
+import extensions
+imported = time.perf_counter() - start
+extensions.warm_up(after=app.sync_events_to_chroma)
+print(imported, time.perf_counter() - start)
+"""
+
+
+def run(code):
+    env = dict(os.environ, WARMUP_ON_START="0")
+    out = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout.strip().splitlines()[-1]
+    return [float(v) for v in out.split()]
+
+
+def main():
+    import_times = [run(IMPORT_ONLY)[0] for _ in range(RUNS)]
+    ready_times = [run(TIME_TO_READY) for _ in range(RUNS)]
+
+    print(f"runs: {RUNS}")
+    print(f"import app (lazy):        median {statistics.median(import_times):.3f}s")
+    print(f"import app before warm-up: median {statistics.median(t[0] for t in ready_times):.3f}s")
+    print(f"import + full warm-up:     median {statistics.median(t[1] for t in ready_times):.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+from abc import ABC, abstractmethod
+from PIL import Image, ImageOps, UnidentifiedImageError
+from image_pipeline import sniff_mime
+import hashlib
+import tempfile
+import io
+import os
+import re
+
+HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+VARIANTS = {
+    "thumb": int(os.environ.get("BLOB_THUMB_SIZE", "256"))
+}
+
+
+def blob_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def make_variant(data: bytes, variant: str):
+    # Returns None for blobs Pillow can't decode (non-images, truncated uploads).
+    size = VARIANTS[variant]
+    try:
+        image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+        image.thumbnail((size, size))
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        output = io.BytesIO()
+        image.save(output, format="JPEG", quality=80, optimize=True)
+    except (UnidentifiedImageError, OSError) as e:
+        print(f"Blob variant {variant} failed: {e}")
+        return None
+    return output.getvalue()
+
+
+class BlobStore(ABC):
+    # Blobs are immutable and addressed by the sha256 of their bytes, so any
+    # backend only needs to store and fetch opaque keys.
+    @abstractmethod
+    def _write(self, key: str, data: bytes):
+        ...
+
+    @abstractmethod
+    def _read(self, key: str):
+        ...
+
+    @abstractmethod
+    def exists(self, digest: str) -> bool:
+        ...
+
+    def put(self, data: bytes) -> str:
+        digest = blob_hash(data)
+        if not self.exists(digest):
+            self._write(digest, data)
+        return digest
+
+    def get(self, digest: str, variant: str = None):
+        if not HASH_RE.match(digest or ""):
+            return None, None
+        if variant is not None and variant not in VARIANTS:
+            return None, None
+
+        if variant is None:
+            data = self._read(digest)
+            return data, sniff_mime(data[:32]) if data else None
+
+        key = f"{digest}.{variant}"
+        data = self._read(key)
+        if data is None:
+            original = self._read(digest)
+            if original is None:
+                return None, None
+            # Variants are derived on first request and stored next to the original.
+            data = make_variant(original, variant)
+            if data is None:
+                # Not resizable: serve the original rather than failing the request.
+                return original, sniff_mime(original[:32])
+            self._write(key, data)
+        return data, "image/jpeg"
+
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key[2:4], key)
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self._path(digest))
+
+    def _write(self, key: str, data: bytes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            # Concurrent writers of the same blob write identical bytes, so the last rename wins harmlessly.
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _read(self, key: str):
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+
+def build_blob_store():
+    backend = os.environ.get("BLOB_STORE", "local")
+    if backend == "local":
+        return LocalBlobStore(os.environ.get("BLOB_STORE_PATH", "./blobs"))
+    raise ValueError(f"Unknown BLOB_STORE backend: {backend}")
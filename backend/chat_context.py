@@ -0,0 +1,56 @@
+import os
+
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CHAT_CONTEXT_TOKENS", "1500"))
+RECENT_TURNS = int(os.environ.get("CHAT_RECENT_TURNS", "6"))
+MAX_MESSAGE_TOKENS = int(os.environ.get("CHAT_MAX_MESSAGE_TOKENS", "400"))
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, (len(text or "") + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text: str, tokens: int) -> str:
+    limit = tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    return text[:limit - 1].rstrip() + "…"
+
+
+def build_conversation_context(recent, semantic, budget: int = CONTEXT_TOKEN_BUDGET,
+                               max_message_tokens: int = MAX_MESSAGE_TOKENS):
+    # recent: chronological turns from SQL; semantic: hits in relevance order.
+    # Each item is {"id", "role", "content"}. Hits indexed before message ids were
+    # stored have id None; they are deduplicated by text and predate every id.
+    selected = []
+    seen_ids, seen_texts = set(), set()
+    used = 0
+
+    def take(message, rank):
+        nonlocal used
+        text_key = (message["role"], message["content"])
+        if not message["content"] or message["id"] in seen_ids or text_key in seen_texts:
+            return True
+
+        content = truncate_to_tokens(message["content"], max_message_tokens)
+        cost = estimate_tokens(content)
+        if used + cost > budget:
+            return False
+
+        used += cost
+        if message["id"] is not None:
+            seen_ids.add(message["id"])
+        seen_texts.add(text_key)
+        selected.append({**message, "content": content, "rank": rank})
+        return True
+
+    # The newest turns go in first so follow-ups keep their immediate context.
+    for rank, message in enumerate(reversed(recent)):
+        if not take(message, rank):
+            break
+
+    for rank, message in enumerate(semantic, start=len(recent)):
+        take(message, rank)
+
+    selected.sort(key=lambda m: (m["id"] is not None, m["id"] or 0, m["rank"]))
+    return selected, used
@@ -0,0 +1,133 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from sqlalchemy import func
+from extensions import db, client
+from models import ChatSession, ChatMessage
+from chat_context import RECENT_TURNS, estimate_tokens, truncate_to_tokens
+from vector_outbox import enqueue_delete, chat_message_doc_id, notify_indexer
+from model_router import model_router, AllModelsFailed
+import threading
+import os
+
+SUMMARY_TRIGGER_TURNS = int(os.environ.get("CHAT_SUMMARY_TRIGGER_TURNS", "20"))
+SUMMARY_TRIGGER_TOKENS = int(os.environ.get("CHAT_SUMMARY_TRIGGER_TOKENS", "4000"))
+SUMMARY_MAX_TOKENS = int(os.environ.get("CHAT_SUMMARY_MAX_TOKENS", "500"))
+
+summary_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat-summary")
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+
+
+def needs_summary(chat_session) -> bool:
+    query = db.session.query(
+        func.count(ChatMessage.id),
+        func.coalesce(func.sum(func.length(ChatMessage.content)), 0)
+    ).filter(ChatMessage.session_id == chat_session.id)
+    if chat_session.summary_upto_id:
+        query = query.filter(ChatMessage.id > chat_session.summary_upto_id)
+
+    count, chars = query.one()
+    if count <= RECENT_TURNS:
+        return False
+    return count >= SUMMARY_TRIGGER_TURNS or chars / 4 >= SUMMARY_TRIGGER_TOKENS
+
+
+def schedule_summary(app, session_id):
+    chat_session = db.session.get(ChatSession, session_id)
+    if not chat_session or not needs_summary(chat_session):
+        return
+
+    with _in_flight_lock:
+        if session_id in _in_flight:
+            return
+        _in_flight.add(session_id)
+
+    summary_pool.submit(run_summary, app, session_id)
+
+
+def run_summary(app, session_id):
+    with app.app_context():
+        try:
+            summarize_session(session_id)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Summary for session {session_id} failed: {e}")
+        finally:
+            db.session.remove()
+            with _in_flight_lock:
+                _in_flight.discard(session_id)
+
+
+def summary_prompt(previous_summary, messages):
+    transcript = "\n".join(
+        f"{'Student' if m.role == 'user' else 'Assistant'}: {truncate_to_tokens(m.content or '', 300)}"
+        for m in messages
+    )
+    return f"""
+    You maintain a running summary of a tutoring conversation with a student.
+    Merge the existing summary with the new turns below into one updated summary.
+    Keep facts the assistant will need later: the student's goals, subjects, deadlines,
+    questions asked, answers given and anything left unresolved.
+    Write at most {SUMMARY_MAX_TOKENS * 3 // 4} words, in the language the student uses.
+
+    Existing summary:
+    {previous_summary or "(none)"}
+
+    New turns:
+    {transcript}
+    """
+
+
+def summarize_session(session_id):
+    chat_session = db.session.get(ChatSession, session_id)
+    if not chat_session:
+        return
+
+    previous_upto = chat_session.summary_upto_id or 0
+    pending = ChatMessage.query.filter(
+        ChatMessage.session_id == session_id,
+        ChatMessage.id > previous_upto
+    ).order_by(ChatMessage.id).all()
+
+    folded = pending[:-RECENT_TURNS] if RECENT_TURNS else pending
+    if not folded:
+        return
+
+    prompt = summary_prompt(chat_session.summary, folded)
+
+    def attempt(model_name):
+        response = client.models.generate_content(model=model_name, contents=prompt)
+        summary = (response.text or "").strip()
+        if not summary:
+            raise ValueError("Empty summary")
+        return summary
+
+    try:
+        # Background work: never hedge, the extra call would only add load.
+        summary, _ = model_router.call(attempt, hedge=False, label="chat summary")
+    except AllModelsFailed as e:
+        print(f"Summary for session {session_id} skipped: {e}")
+        return
+
+    summary = truncate_to_tokens(summary, SUMMARY_MAX_TOKENS)
+    upto_id = folded[-1].id
+
+    # Another worker may have folded the same turns meanwhile; only advance from
+    # the state this summary was built on.
+    updated = ChatSession.query.filter(
+        ChatSession.id == session_id,
+        func.coalesce(ChatSession.summary_upto_id, 0) == previous_upto
+    ).update({
+        ChatSession.summary: summary,
+        ChatSession.summary_upto_id: upto_id,
+        ChatSession.summary_updated_at: datetime.now(timezone.utc)
+    }, synchronize_session=False)
+
+    if not updated:
+        db.session.rollback()
+        return
+
+    enqueue_delete("chat_history", [chat_message_doc_id(m) for m in folded])
+    db.session.commit()
+    notify_indexer()
+    print(f"Summarized {len(folded)} turns of session {session_id} (~{estimate_tokens(summary)} tokens)")
@@ -0,0 +1,159 @@
+from collections import deque
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import NullPool, QueuePool
+import threading
+import time
+import os
+
+POOL_MODES = ("queue", "pgbouncer", "null")
+
+
+class PoolMetrics:
+    def __init__(self, samples: int = 1000):
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=samples)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.connections_opened = 0
+        self.connections_closed = 0
+
+    def record_checkout(self, seconds: float):
+        with self._lock:
+            self.checkouts += 1
+            self._waits.append(seconds)
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def record_connect(self):
+        with self._lock:
+            self.connections_opened += 1
+
+    def record_close(self):
+        with self._lock:
+            self.connections_closed += 1
+
+    def stats(self):
+        with self._lock:
+            waits = sorted(self._waits)
+            checkouts = self.checkouts
+            timeouts = self.timeouts
+            opened = self.connections_opened
+            closed = self.connections_closed
+
+        def percentile(p):
+            if not waits:
+                return 0.0
+            return round(waits[min(len(waits) - 1, int(p * len(waits)))] * 1000, 3)
+
+        return {
+            "checkouts": checkouts,
+            "timeouts": timeouts,
+            "connections_opened": opened,
+            "connections_closed": closed,
+            "connections_open": opened - closed,
+            "checkout_wait_ms": {
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "p99": percentile(0.99),
+                "max": round(waits[-1] * 1000, 3) if waits else 0.0,
+                "samples": len(waits)
+            }
+        }
+
+
+pool_metrics = PoolMetrics()
+
+
+class TimedCheckoutMixin:
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            pool_metrics.record_timeout()
+            raise
+        pool_metrics.record_checkout(time.perf_counter() - start)
+        return connection
+
+
+class TimedQueuePool(TimedCheckoutMixin, QueuePool):
+    pass
+
+
+class TimedNullPool(TimedCheckoutMixin, NullPool):
+    pass
+
+
+for pool_class in (TimedQueuePool, TimedNullPool):
+    event.listen(pool_class, "connect", lambda *args: pool_metrics.record_connect())
+    event.listen(pool_class, "close", lambda *args: pool_metrics.record_close())
+
+
+def pool_mode():
+    mode = os.environ.get("DB_POOL_MODE", "null").lower()
+    if mode not in POOL_MODES:
+        raise ValueError(f"DB_POOL_MODE must be one of {', '.join(POOL_MODES)}, got {mode!r}")
+    return mode
+
+
+def connect_args_from_env():
+    # prepare_threshold only exists in psycopg 3; psycopg2 and SQLite reject it.
+    url = os.environ.get("DATABASE_URL")
+    if url and make_url(url).drivername == "postgresql+psycopg":
+        return {"prepare_threshold": None}
+    return {}
+
+
+def engine_options_from_env():
+    mode = pool_mode()
+
+    if mode == "null":
+        return {
+            "poolclass": TimedNullPool,
+            "connect_args": connect_args_from_env()
+        }
+
+    if mode == "pgbouncer":
+        # PgBouncer in transaction mode multiplexes server connections itself and
+        # cannot keep prepared statements, so keep a small client-side pool.
+        return {
+            "poolclass": TimedQueuePool,
+            "pool_size": int(os.environ.get("DB_POOL_SIZE", "5")),
+            "max_overflow": int(os.environ.get("DB_POOL_MAX_OVERFLOW", "5")),
+            "pool_timeout": float(os.environ.get("DB_POOL_TIMEOUT", "10")),
+            "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", "300")),
+            "pool_pre_ping": True,
+            "connect_args": connect_args_from_env()
+        }
+
+    return {
+        "poolclass": TimedQueuePool,
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", "10")),
+        "max_overflow": int(os.environ.get("DB_POOL_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.environ.get("DB_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": True
+    }
+
+
+def pool_status(engine):
+    pool = engine.pool
+    status = {
+        "mode": pool_mode(),
+        "pool_class": type(pool).__name__,
+        "status": pool.status()
+    }
+    if isinstance(pool, QueuePool):
+        status.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": pool.overflow(),
+            "timeout": pool.timeout()
+        })
+    status["metrics"] = pool_metrics.stats()
+    return status
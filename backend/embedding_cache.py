@@ -0,0 +1,122 @@
+from collections import OrderedDict
+import hashlib
+import sqlite3
+import threading
+import numpy as np
+
+
+class EmbeddingCache:
+    def __init__(self, embed_fn, namespace: str, max_entries: int = 10000, disk_path: str = None):
+        self.embed_fn = embed_fn
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.disk_path = disk_path
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = None
+        self._disk_lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        if disk_path:
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+            self._disk.commit()
+
+    def key_for(self, text: str) -> str:
+        return hashlib.sha256(f"{self.namespace}\x00{text}".encode("utf-8")).hexdigest()
+
+    def __call__(self, texts):
+        keys = [self.key_for(t) for t in texts]
+        found = {}
+
+        with self._lock:
+            for key in keys:
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    found[key] = vector
+
+        pending = [k for k in dict.fromkeys(keys) if k not in found]
+        if pending and self._disk is not None:
+            for key, vector in self._disk_get(pending).items():
+                found[key] = vector
+                self._remember(key, vector)
+            with self._lock:
+                self.disk_hits += len([k for k in pending if k in found])
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in missing:
+                missing[key] = text
+
+        with self._lock:
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            computed = self.embed_fn(list(missing.values()))
+            fresh = {}
+            for key, vector in zip(missing.keys(), computed):
+                vector = np.asarray(vector, dtype=np.float32)
+                vector.setflags(write=False)
+                fresh[key] = vector
+                self._remember(key, vector)
+            found.update(fresh)
+            if self._disk is not None:
+                self._disk_put(fresh)
+
+        return [found[key] for key in keys]
+
+    def _remember(self, key, vector):
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self.evictions += 1
+
+    def _disk_get(self, keys):
+        placeholders = ",".join("?" for _ in keys)
+        with self._disk_lock:
+            rows = self._disk.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", keys
+            ).fetchall()
+
+        result = {}
+        for key, blob in rows:
+            vector = np.frombuffer(blob, dtype=np.float32)
+            vector.setflags(write=False)
+            result[key] = vector
+        return result
+
+    def _disk_put(self, vectors):
+        try:
+            with self._disk_lock:
+                self._disk.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, vector.tobytes()) for key, vector in vectors.items()]
+                )
+                self._disk.commit()
+        except sqlite3.Error as e:
+            print(f"Embedding cache disk write failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._memory),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "disk_enabled": self._disk is not None
+            }
@@ -0,0 +1,91 @@
+from concurrent.futures import Future
+import queue
+import threading
+import time
+
+
+class EmbeddingService:
+    def __init__(self, encode_fn, max_batch_size: int = 64, max_wait_ms: float = 5):
+        self.encode_fn = encode_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        self._queue = queue.Queue()
+        self._worker = None
+        self._start_lock = threading.Lock()
+
+        self.batches = 0
+        self.texts = 0
+        self.requests = 0
+
+    def submit(self, texts) -> Future:
+        future = Future()
+        texts = list(texts)
+        if not texts:
+            future.set_result([])
+            return future
+
+        self._ensure_worker()
+        self._queue.put((texts, future))
+        return future
+
+    def embed(self, texts):
+        return self.submit(texts).result()
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._start_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="embedding-worker", daemon=True)
+                self._worker.start()
+
+    def _next_batch(self):
+        pending = [self._queue.get()]
+        size = len(pending[0][0])
+        deadline = time.monotonic() + self.max_wait
+
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            pending.append(item)
+            size += len(item[0])
+        return pending
+
+    def _run(self):
+        while True:
+            pending = self._next_batch()
+            batch = [text for texts, _ in pending for text in texts]
+
+            try:
+                vectors = self.encode_fn(batch)
+            except Exception as e:
+                print(f"Embedding batch of {len(batch)} failed: {e}")
+                for _, future in pending:
+                    future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.texts += len(batch)
+            self.requests += len(pending)
+
+            offset = 0
+            for texts, future in pending:
+                future.set_result(list(vectors[offset:offset + len(texts)]))
+                offset += len(texts)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "requests": self.requests,
+            "avg_batch_size": round(self.texts / self.batches, 2) if self.batches else 0.0,
+            "queued": self._queue.qsize(),
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000
+        }
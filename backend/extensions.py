@@ -4,29 +4,165 @@ load_dotenv()
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from flask_socketio import SocketIO
-from google import genai
-import chromadb
-from chromadb.utils import embedding_functions
+from embedding_cache import EmbeddingCache
+from embedding_service import EmbeddingService
+from socket_registry import build_socket_registry, user_room
+from response_cache import build_response_cache
+from blob_store import build_blob_store
+from datetime import datetime, timezone
+import threading
 import os
 
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
 db = SQLAlchemy()
 jwt = JWTManager()
 socketio = SocketIO()
 
+blob_store = build_blob_store()
 
-active_socket_users: dict = {}
 
-chroma_client = chromadb.PersistentClient(path="./chroma_db")
-sentence_transformer_ef = embedding_functions.SentenceTransformerEmbeddingFunction(
-    model_name="all-MiniLM-L6-v2"
-)
-collection = chroma_client.get_or_create_collection(
-    name="user_events",
-    embedding_function=sentence_transformer_ef
+class LazyProxy:
+    def __init__(self, name, factory):
+        object.__setattr__(self, "_name", name)
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_target", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def _resolve(self):
+        target = self._target
+        if target is None:
+            with self._lock:
+                target = self._target
+                if target is None:
+                    print(f"Initializing {self._name}...")
+                    target = self._factory()
+                    object.__setattr__(self, "_target", target)
+        return target
+
+    @property
+    def is_loaded(self):
+        return self._target is not None
+
+    def __getattr__(self, item):
+        return getattr(self._resolve(), item)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+    def __contains__(self, item):
+        return item in self._resolve()
+
+    def __repr__(self):
+        state = "loaded" if self.is_loaded else "not loaded"
+        return f"<LazyProxy {self._name} ({state})>"
+
+
+def _create_chroma_client():
+    import chromadb
+    return chromadb.PersistentClient(path="./chroma_db")
+
+
+def _create_embedding_function():
+    from chromadb.utils import embedding_functions
+    return embedding_functions.SentenceTransformerEmbeddingFunction(
+        model_name=EMBEDDING_MODEL
+    )
+
+
+def _create_collection(name):
+    def factory():
+        return chroma_client.get_or_create_collection(
+            name=name,
+            embedding_function=sentence_transformer_ef._resolve()
+        )
+    return factory
+
+
+def _create_genai_client():
+    from google import genai
+    return genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+
+
+chroma_client = LazyProxy("chroma_client", _create_chroma_client)
+sentence_transformer_ef = LazyProxy("sentence_transformer_ef", _create_embedding_function)
+embedding_service = EmbeddingService(
+    sentence_transformer_ef,
+    max_batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "64")),
+    max_wait_ms=float(os.getenv("EMBEDDING_BATCH_WAIT_MS", "5"))
 )
-chat_collection = chroma_client.get_or_create_collection(
-    name="chat_history",
-    embedding_function=sentence_transformer_ef
+embedding_cache = EmbeddingCache(
+    embedding_service.embed,
+    namespace=EMBEDDING_MODEL,
+    max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "10000")),
+    disk_path="./embedding_cache.sqlite3" if os.getenv("EMBEDDING_CACHE_DISK") == "1" else None
 )
+response_cache = build_response_cache(embedding_cache)
+collection = LazyProxy("collection", _create_collection("user_events"))
+chat_collection = LazyProxy("chat_collection", _create_collection("chat_history"))
+
+client = LazyProxy("client", _create_genai_client)
+# With SOCKET_REGISTRY=sql this connects to the database, so it waits for the first socket.
+socket_registry = LazyProxy("socket_registry", build_socket_registry)
+
+lazy_components = {
+    "chroma_client": chroma_client,
+    "sentence_transformer_ef": sentence_transformer_ef,
+    "collection": collection,
+    "chat_collection": chat_collection,
+    "client": client
+}
+
+warmup_status = {
+    "state": "idle",
+    "error": None,
+    "after_error": None,
+    "started_at": None,
+    "finished_at": None
+}
+
+
+def warm_up(after=None):
+    warmup_status["state"] = "warming"
+    warmup_status["started_at"] = datetime.now(timezone.utc).isoformat()
+    try:
+        for proxy in lazy_components.values():
+            proxy._resolve()
+        # One encode starts the batching worker and primes the model.
+        embedding_service.embed(["warm-up"])
+        warmup_status["state"] = "ready"
+    except Exception as e:
+        print(f"Warm-up failed: {e}")
+        warmup_status["state"] = "failed"
+        warmup_status["error"] = str(e)
+        return
+    finally:
+        warmup_status["finished_at"] = datetime.now(timezone.utc).isoformat()
+
+    # Readiness only reflects the model load; a failed follow-up task (the event
+    # reconcile) is reported but doesn't take the worker out of rotation.
+    if after is not None:
+        try:
+            after()
+        except Exception as e:
+            print(f"Post-warm-up task failed: {e}")
+            warmup_status["after_error"] = str(e)
+
+
+def start_warmup(after=None):
+    thread = threading.Thread(target=warm_up, args=(after,), name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def push_to_user(user_id, event, data):
+    # With SOCKETIO_MESSAGE_QUEUE set this reaches the user's sockets on any worker.
+    socketio.emit(event, data, to=user_room(user_id))
+
 
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+def readiness():
+    return {
+        "ready": warmup_status["state"] == "ready",
+        "warmup": dict(warmup_status),
+        "components": {name: proxy.is_loaded for name, proxy in lazy_components.items()}
+    }
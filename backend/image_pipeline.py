@@ -0,0 +1,280 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from flask import request
+from PIL import Image, ImageOps, UnidentifiedImageError
+import binascii
+import base64
+import hashlib
+import tempfile
+import threading
+import io
+import os
+
+MAX_DIMENSION = int(os.environ.get("IMAGE_MAX_DIMENSION", "1600"))
+JPEG_QUALITY = int(os.environ.get("IMAGE_JPEG_QUALITY", "85"))
+MAX_UPLOAD_BYTES = int(float(os.environ.get("IMAGE_MAX_UPLOAD_MB", "20")) * 1024 * 1024)
+CACHE_SIZE = int(os.environ.get("IMAGE_CACHE_SIZE", "64"))
+# The entry count alone doesn't bound memory: 64 normalized photos can be
+# 100+ MB per worker, so the cache is also capped by the bytes it holds.
+CACHE_MAX_BYTES = int(float(os.environ.get("IMAGE_CACHE_MB", "32")) * 1024 * 1024)
+
+READ_CHUNK = 64 * 1024
+# Multiple of 4 so every slice of a base64 string decodes on its own.
+B64_CHUNK = 256 * 1024
+SPOOL_BYTES = 1024 * 1024
+
+# Formats Gemini accepts as-is when Pillow can't re-encode them (e.g. HEIC).
+GEMINI_MIME_TYPES = ("image/jpeg", "image/png", "image/webp", "image/heic", "image/heif")
+
+Image.MAX_IMAGE_PIXELS = int(os.environ.get("IMAGE_MAX_PIXELS", str(64 * 1024 * 1024)))
+
+image_metrics = {
+    "images": 0,
+    "dedupe_hits": 0,
+    "passthrough": 0,
+    "rejected": 0,
+    "bytes_in": 0,
+    "bytes_out": 0
+}
+
+
+class ImageError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class ProcessedImage:
+    digest: str
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    original_bytes: int
+
+
+_cache = OrderedDict()
+_cache_bytes = 0
+_cache_lock = threading.Lock()
+
+
+def sniff_mime(head: bytes):
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if head.startswith(b"BM"):
+        return "image/bmp"
+    if head[4:8] == b"ftyp":
+        brand = head[8:12]
+        if brand in (b"heic", b"heix", b"hevc", b"hevx"):
+            return "image/heic"
+        if brand in (b"mif1", b"msf1", b"heif"):
+            return "image/heif"
+    return None
+
+
+def _spool_base64(value: str, spool, digest):
+    if value.startswith("data:") or "," in value[:100]:
+        value = value.split(",", 1)[1]
+
+    size = 0
+    pending = ""
+    for start in range(0, len(value), B64_CHUNK):
+        piece = pending + "".join(value[start:start + B64_CHUNK].split())
+        usable = len(piece) - len(piece) % 4
+        pending = piece[usable:]
+        try:
+            data = base64.b64decode(piece[:usable])
+        except binascii.Error as e:
+            raise ImageError(f"Invalid base64 image: {e}")
+
+        size += len(data)
+        if size > MAX_UPLOAD_BYTES:
+            raise ImageError("Image is too large")
+        digest.update(data)
+        spool.write(data)
+
+    if pending.strip("="):
+        raise ImageError("Invalid base64 image: truncated data")
+    return size
+
+
+def _spool_stream(stream, spool, digest):
+    size = 0
+    while True:
+        chunk = stream.read(READ_CHUNK)
+        if not chunk:
+            return size
+        size += len(chunk)
+        if size > MAX_UPLOAD_BYTES:
+            raise ImageError("Image is too large")
+        digest.update(chunk)
+        spool.write(chunk)
+
+
+def _flatten(image):
+    if image.mode in ("RGB", "L"):
+        return image
+    if image.mode == "P":
+        image = image.convert("RGBA")
+    if image.mode in ("RGBA", "LA"):
+        # Transparent diagrams would otherwise come out on black.
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def _downscale(spool, digest, size, mime_type):
+    try:
+        image = Image.open(spool)
+        # JPEGs can decode straight at a reduced scale instead of full resolution.
+        image.draft("RGB", (MAX_DIMENSION, MAX_DIMENSION))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((MAX_DIMENSION, MAX_DIMENSION))
+        image = _flatten(image)
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        if mime_type not in GEMINI_MIME_TYPES:
+            print(f"Image decode error: {e}")
+            raise ImageError(f"Could not decode {mime_type} image")
+        spool.seek(0)
+        image_metrics["passthrough"] += 1
+        return ProcessedImage(digest, spool.read(), mime_type, 0, 0, size)
+
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    data = output.getvalue()
+
+    # A small, already compressed upload can beat the re-encode; keep the original then.
+    if mime_type in GEMINI_MIME_TYPES and len(data) >= size and max(image.size) < MAX_DIMENSION:
+        spool.seek(0)
+        image_metrics["passthrough"] += 1
+        return ProcessedImage(digest, spool.read(), mime_type, image.width, image.height, size)
+
+    return ProcessedImage(digest, data, "image/jpeg", image.width, image.height, size)
+
+
+def load_image(source) -> ProcessedImage:
+    # Queued jobs hand back images that were already normalized at enqueue time.
+    if isinstance(source, ProcessedImage):
+        return source
+
+    digest = hashlib.sha256()
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES) as spool:
+        try:
+            if isinstance(source, str):
+                size = _spool_base64(source.strip(), spool, digest)
+            elif isinstance(source, (bytes, bytearray)):
+                size = _spool_stream(io.BytesIO(source), spool, digest)
+            else:
+                size = _spool_stream(source, spool, digest)
+        except ImageError:
+            image_metrics["rejected"] += 1
+            raise
+
+        if not size:
+            image_metrics["rejected"] += 1
+            raise ImageError("Empty image")
+
+        key = digest.hexdigest()
+        with _cache_lock:
+            cached = _cache.get(key)
+            if cached is not None:
+                _cache.move_to_end(key)
+                image_metrics["dedupe_hits"] += 1
+                return cached
+
+        spool.seek(0)
+        mime_type = sniff_mime(spool.read(32))
+        if mime_type is None:
+            image_metrics["rejected"] += 1
+            raise ImageError("Unsupported image type")
+        spool.seek(0)
+
+        processed = _downscale(spool, key, size, mime_type)
+
+    image_metrics["images"] += 1
+    image_metrics["bytes_in"] += size
+    image_metrics["bytes_out"] += len(processed.data)
+
+    cache_image(key, processed)
+    return processed
+
+
+def cache_image(key, processed):
+    global _cache_bytes
+    # One image may take at most a quarter of the budget, so a single large
+    # photo can't flush everything else out.
+    size = len(processed.data)
+    if size > CACHE_MAX_BYTES // 4:
+        return
+
+    with _cache_lock:
+        previous = _cache.pop(key, None)
+        if previous is not None:
+            _cache_bytes -= len(previous.data)
+        _cache[key] = processed
+        _cache_bytes += size
+        while len(_cache) > CACHE_SIZE or _cache_bytes > CACHE_MAX_BYTES:
+            _, evicted = _cache.popitem(last=False)
+            _cache_bytes -= len(evicted.data)
+
+
+def load_images(value, skip_invalid: bool = False):
+    sources = value if isinstance(value, (list, tuple)) else [value]
+    images, seen = [], set()
+
+    for source in sources:
+        if not source:
+            continue
+        try:
+            image = load_image(source)
+        except ImageError as e:
+            if not skip_invalid:
+                raise
+            print(f"Image decode error: {e}")
+            continue
+
+        # The same photo attached twice is only sent upstream once.
+        if image.digest in seen:
+            continue
+        seen.add(image.digest)
+        images.append(image)
+
+    return images
+
+
+def request_payload(binary_field: str = "images"):
+    # Multipart form: fields from the form, images as file streams.
+    if request.files:
+        data = request.form.to_dict()
+        for name in request.files:
+            data[name] = request.files.getlist(name)
+        return data
+
+    # Raw image body: other fields travel in the query string.
+    if request.mimetype.startswith("image/") or request.mimetype == "application/octet-stream":
+        data = request.args.to_dict()
+        data[binary_field] = [request.stream]
+        return data
+
+    return request.get_json(silent=True) or {}
+
+
+def image_stats():
+    with _cache_lock:
+        cached = len(_cache)
+        cached_bytes = _cache_bytes
+    saved = image_metrics["bytes_in"] - image_metrics["bytes_out"]
+    return {
+        **image_metrics,
+        "cached": cached,
+        "cached_bytes": cached_bytes,
+        "max_dimension": MAX_DIMENSION,
+        "bytes_saved": saved,
+        "compression_ratio": round(image_metrics["bytes_out"] / image_metrics["bytes_in"], 3) if image_metrics["bytes_in"] else None
+    }
@@ -0,0 +1,354 @@
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func, or_, and_
+from extensions import db, push_to_user
+from models import Job, User
+from image_pipeline import ProcessedImage, load_images
+from socket_registry import WORKER_ID
+from routes.chat import run_extract_events, run_generate_test
+from routes.schoolwork import run_analysis
+import threading
+import base64
+import time
+import json
+import os
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "1"))
+JOB_MAX_RUNNING_PER_USER = int(os.environ.get("JOB_MAX_RUNNING_PER_USER", "2"))
+JOB_MAX_QUEUED_PER_USER = int(os.environ.get("JOB_MAX_QUEUED_PER_USER", "20"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+# A running job whose heartbeat is older than this belonged to a worker that died;
+# it goes back in the queue.
+JOB_TIMEOUT_SECONDS = int(os.environ.get("JOB_TIMEOUT_SECONDS", "120"))
+JOB_HEARTBEAT_SECONDS = float(os.environ.get("JOB_HEARTBEAT_SECONDS", "30"))
+MAX_BACKOFF_SECONDS = 300
+
+# Higher priority is claimed first. Extraction is short and fills the calendar
+# the user is looking at; map-reduce quizzes are the longest.
+JOB_KINDS = {
+    "extract-events": {
+        "run": lambda user_id, data: run_extract_events(user_id, data),
+        "images": "image",
+        "priority": 10
+    },
+    "analyze-schoolwork": {
+        "run": lambda user_id, data: run_analysis(user_id, data)[:2],
+        "images": "images",
+        "priority": 5
+    },
+    "generate-test": {
+        "run": lambda user_id, data: run_generate_test(data)[:2],
+        "images": "images",
+        "priority": 0
+    },
+}
+
+_wake = threading.Event()
+_reap_lock = threading.Lock()
+_last_reap = 0.0
+
+
+class QueueFull(Exception):
+    pass
+
+
+def as_iso(value):
+    return value.isoformat() if value else None
+
+
+def job_json(job, with_result: bool = False):
+    data = {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "priority": job.priority,
+        "attempts": job.attempts,
+        "error": job.error,
+        "created_at": as_iso(job.created_at),
+        "started_at": as_iso(job.started_at),
+        "finished_at": as_iso(job.finished_at)
+    }
+    if with_result and job.status in ("complete", "failed"):
+        data["result"] = json.loads(job.result) if job.result else None
+        data["result_status"] = job.result_status
+    return data
+
+
+def queue_position(job):
+    if job.status != "queued":
+        return None
+    return Job.query.filter(
+        Job.status == "queued",
+        or_(Job.priority > job.priority, and_(Job.priority == job.priority, Job.id < job.id))
+    ).count()
+
+
+def store_image(image):
+    # The normalized bytes travel in the job row itself: a worker on another host
+    # has no access to the web process's local blob store.
+    return {
+        "data": base64.b64encode(image.data).decode("ascii"),
+        "digest": image.digest,
+        "mime_type": image.mime_type,
+        "width": image.width,
+        "height": image.height,
+        "original_bytes": image.original_bytes
+    }
+
+
+def restore_image(entry):
+    return ProcessedImage(
+        entry["digest"], base64.b64decode(entry["data"]), entry["mime_type"],
+        entry["width"], entry["height"], entry["original_bytes"]
+    )
+
+
+def drop_images(job):
+    # Once a job can't run again its images are dead weight in the row.
+    payload = json.loads(job.payload)
+    if payload.get("images"):
+        payload["images"] = []
+        job.payload = json.dumps(payload)
+
+
+def enqueue_job(user_id, kind: str, data: dict, priority=None):
+    spec = JOB_KINDS[kind]
+
+    pending = Job.query.filter(Job.user_id == user_id, Job.status.in_(("queued", "running"))).count()
+    if pending >= JOB_MAX_QUEUED_PER_USER:
+        raise QueueFull(f"At most {JOB_MAX_QUEUED_PER_USER} jobs can be pending")
+
+    # Images are decoded here so a bad upload is a 400 now, not a failed job later.
+    images = load_images(data.pop(spec["images"], None))
+    job = Job(
+        user_id=int(user_id),
+        kind=kind,
+        status="queued",
+        priority=spec["priority"] if priority is None else priority,
+        payload=json.dumps({"data": data, "images": [store_image(image) for image in images]})
+    )
+    db.session.add(job)
+    return job
+
+
+def notify_workers():
+    _wake.set()
+
+
+def cancel_queued_job(job_id) -> bool:
+    # Only a job no worker has claimed yet can be cancelled; a running one finishes normally.
+    cancelled = Job.query.filter(Job.id == job_id, Job.status == "queued").update({
+        Job.status: "cancelled",
+        Job.finished_at: datetime.now(timezone.utc)
+    }, synchronize_session=False)
+    if cancelled:
+        drop_images(db.session.get(Job, job_id, populate_existing=True))
+    db.session.commit()
+    return bool(cancelled)
+
+
+def claim_job(worker_id: str = WORKER_ID):
+    now = datetime.now(timezone.utc)
+    busy = {
+        user_id for user_id, running in db.session.query(Job.user_id, func.count(Job.id)).filter(
+            Job.status == "running"
+        ).group_by(Job.user_id).all()
+        if running >= JOB_MAX_RUNNING_PER_USER
+    }
+
+    for _ in range(5):
+        query = Job.query.filter(Job.status == "queued", Job.available_at <= now)
+        if busy:
+            query = query.filter(Job.user_id.notin_(busy))
+        job = query.order_by(Job.priority.desc(), Job.id).with_for_update(skip_locked=True).first()
+        if job is None:
+            db.session.commit()
+            return None
+
+        # Workers claiming for the same user queue up on the user row, so the
+        # running count below can't be raced past the limit.
+        db.session.query(User.id).filter(User.id == job.user_id).with_for_update().first()
+        running = Job.query.filter(Job.user_id == job.user_id, Job.status == "running").count()
+        if running >= JOB_MAX_RUNNING_PER_USER:
+            db.session.rollback()
+            busy.add(job.user_id)
+            continue
+
+        # Conditional on the row still being queued, so a claim stays exclusive
+        # on databases that ignore FOR UPDATE (SQLite in development).
+        # (id, attempt) identifies this claim from here on.
+        attempt = job.attempts + 1
+        claimed = Job.query.filter(
+            Job.id == job.id, Job.status == "queued", Job.attempts == job.attempts
+        ).update({
+            Job.status: "running",
+            Job.worker_id: worker_id,
+            Job.started_at: now,
+            Job.heartbeat_at: now,
+            Job.attempts: attempt
+        }, synchronize_session=False)
+        if not claimed:
+            db.session.rollback()
+            continue
+        db.session.commit()
+        return job.id, attempt
+
+    db.session.commit()
+    return None
+
+
+def retry_or_fail(job, error: str, now):
+    if job.attempts < JOB_MAX_ATTEMPTS:
+        job.status = "queued"
+        job.worker_id = None
+        job.error = error
+        job.available_at = now + timedelta(seconds=min(2 ** job.attempts, MAX_BACKOFF_SECONDS))
+        return False
+
+    job.status = "failed"
+    job.error = error
+    job.result = json.dumps({"error": error})
+    job.result_status = 500
+    job.finished_at = now
+    drop_images(job)
+    return True
+
+
+def requeue_stale():
+    now = datetime.now(timezone.utc)
+    stale = Job.query.filter(
+        Job.status == "running",
+        func.coalesce(Job.heartbeat_at, Job.started_at) < now - timedelta(seconds=JOB_TIMEOUT_SECONDS)
+    ).with_for_update(skip_locked=True).all()
+
+    failed = []
+    for job in stale:
+        print(f"Job {job.id} timed out on {job.worker_id}")
+        if retry_or_fail(job, "Job timed out", now):
+            failed.append(job)
+    db.session.commit()
+
+    for job in failed:
+        push_to_user(job.user_id, "jobs:done", job_json(job, with_result=True))
+    return len(stale)
+
+
+def finish_job(job_id, attempt: int, body, status: int, worker_id: str = WORKER_ID):
+    now = datetime.now(timezone.utc)
+    # Only the claim that is still current may finish the job: after a reclaim, a
+    # late result from the earlier attempt is dropped instead of overwriting the rerun.
+    job = Job.query.filter(
+        Job.id == job_id, Job.status == "running", Job.worker_id == worker_id, Job.attempts == attempt
+    ).with_for_update().first()
+    if job is None:
+        db.session.commit()
+        print(f"Job {job_id}: attempt {attempt} was reclaimed, dropping its result")
+        return
+
+    if status >= 500:
+        error = body.get("error") if isinstance(body, dict) else None
+        if not retry_or_fail(job, error or "Job failed", now):
+            print(f"Job {job_id} ({job.kind}) failed, retrying: {error}")
+            db.session.commit()
+            return
+    else:
+        job.status = "complete" if status < 400 else "failed"
+        job.error = body.get("error") if status >= 400 and isinstance(body, dict) else None
+        job.finished_at = now
+        drop_images(job)
+
+    job.result = json.dumps(body)
+    job.result_status = status
+    db.session.commit()
+
+    print(f"Job {job_id} ({job.kind}) {job.status} after {job.attempts} attempt(s)")
+    push_to_user(job.user_id, "jobs:done", job_json(job, with_result=True))
+
+
+def heartbeat(app, job_id, attempt: int, stop):
+    while not stop.wait(JOB_HEARTBEAT_SECONDS):
+        with app.app_context():
+            try:
+                Job.query.filter(Job.id == job_id, Job.attempts == attempt, Job.status == "running").update(
+                    {Job.heartbeat_at: datetime.now(timezone.utc)}, synchronize_session=False
+                )
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                print(f"Job {job_id} heartbeat failed: {e}")
+            finally:
+                db.session.remove()
+
+
+def run_job(app, job_id, attempt: int):
+    stop = threading.Event()
+    threading.Thread(target=heartbeat, args=(app, job_id, attempt, stop), name=f"job-heartbeat-{job_id}", daemon=True).start()
+
+    with app.app_context():
+        try:
+            job = db.session.get(Job, job_id)
+            spec = JOB_KINDS[job.kind]
+            payload = json.loads(job.payload)
+            data = payload["data"]
+            data[spec["images"]] = [restore_image(entry) for entry in payload["images"]]
+            body, status = spec["run"](str(job.user_id), data)
+        except Exception as e:
+            print(f"Job {job_id} crashed: {e}")
+            db.session.rollback()
+            body, status = {"error": "Job failed"}, 500
+
+        try:
+            finish_job(job_id, attempt, body, status)
+        except Exception as e:
+            db.session.rollback()
+            print(f"Job {job_id} could not be finished: {e}")
+        finally:
+            stop.set()
+            db.session.remove()
+
+
+def maybe_requeue_stale():
+    global _last_reap
+    with _reap_lock:
+        if time.monotonic() - _last_reap < JOB_TIMEOUT_SECONDS / 10:
+            return
+        _last_reap = time.monotonic()
+    requeue_stale()
+
+
+def start_job_workers(app, count: int = JOB_WORKERS, interval: float = JOB_POLL_INTERVAL):
+    def loop():
+        while True:
+            claim = None
+            with app.app_context():
+                try:
+                    maybe_requeue_stale()
+                    claim = claim_job()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Job claim failed: {e}")
+                finally:
+                    db.session.remove()
+
+            if claim is None:
+                _wake.wait(interval)
+                _wake.clear()
+                continue
+            run_job(app, *claim)
+
+    threads = []
+    for index in range(count):
+        thread = threading.Thread(target=loop, name=f"job-worker-{index}", daemon=True)
+        thread.start()
+        threads.append(thread)
+    return threads
+
+
+def queue_stats():
+    counts = db.session.query(Job.kind, Job.status, func.count(Job.id)).filter(
+        Job.status.in_(("queued", "running"))
+    ).group_by(Job.kind, Job.status).all()
+    stats = {}
+    for kind, status, count in counts:
+        stats.setdefault(kind, {})[status] = count
+    return stats
@@ -1,19 +1,189 @@
-import sqlite3
-import os
+from sqlalchemy import inspect, text
 
-db_path = 'instance/db.sqlite3'
-if os.path.exists(db_path):
+
+def upgrade_schema(engine, metadata):
+    # create_all() only creates missing tables; this adds columns and indexes
+    # that were introduced after a table already existed.
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    quote = engine.dialect.identifier_preparer.quote
+
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+
+            existing_columns = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing_columns:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column_type}"))
+                print(f"Added column {table.name}.{column.name}")
+
+            existing_indexes = {i["name"] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name in existing_indexes:
+                    continue
+                index.create(conn)
+                print(f"Created index {index.name}")
+
+
+def backfill_profile_pics(store, batch_size: int = 100):
+    # Moves legacy base64 pictures out of the user table into the blob store.
+    from extensions import db
+    from models import User
+    from image_pipeline import ImageError, load_image
+
+    moved = 0
+    while True:
+        users = User.query.options(db.undefer(User.profile_pic)).filter(
+            User.profile_pic.isnot(None),
+            User.profile_pic_hash.is_(None)
+        ).order_by(User.id).limit(batch_size).all()
+        if not users:
+            break
+
+        for user in users:
+            try:
+                user.profile_pic_hash = store.put(load_image(user.profile_pic).data)
+                moved += 1
+            except ImageError as e:
+                print(f"Dropping unreadable profile picture of user {user.id}: {e}")
+            user.profile_pic = None
+        db.session.commit()
+
+    if moved:
+        print(f"Moved {moved} profile pictures into the blob store")
+
+
+def ensure_trigram_index(engine):
+    # Optional fuzzy subject lookup on Postgres; the prefix index covers everything else.
+    if engine.dialect.name != "postgresql":
+        return
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute("ALTER TABLE user ADD COLUMN profile_pic TEXT;")
-        conn.commit()
-        conn.close()
-        print("Successfully added profile_pic column to user table.")
-    except sqlite3.OperationalError as e:
-        if "duplicate column name" in str(e):
-            print("Column profile_pic already exists.")
-        else:
-            print(f"Error: {e}")
-else:
-    print(f"Database not found at {db_path}")
+        with engine.begin() as conn:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_subject_alias_trgm ON subject_alias USING gin (alias_key gin_trgm_ops)"
+            ))
+    except Exception as e:
+        print(f"Trigram index unavailable: {e}")
+
+
+def backfill_subjects(include_events: bool = False, batch_size: int = 500):
+    from extensions import db
+    from models import Score, SchoolworkAnalysis, Event
+    from subjects import seed_subjects, resolve_subject, detect_subject
+
+    seed_subjects()
+
+    # One resolve per distinct (user, free-text subject), then one UPDATE per spelling.
+    mapped = {}
+    for model in (Score, SchoolworkAnalysis):
+        pairs = db.session.query(model.user_id, model.subject).filter(
+            model.subject_id.is_(None)
+        ).distinct().all()
+        for user_id, name in pairs:
+            subject = resolve_subject(name, user_id)
+            if subject is None:
+                continue
+            count = model.query.filter(
+                model.user_id == user_id, model.subject == name, model.subject_id.is_(None)
+            ).update({model.subject_id: subject.id}, synchronize_session=False)
+            mapped[model.__tablename__] = mapped.get(model.__tablename__, 0) + count
+        db.session.commit()
+
+    # Events have no subject column to map from, so they are scanned only on request.
+    if include_events:
+        last_id = 0
+        while True:
+            events = Event.query.filter(Event.id > last_id, Event.subject_id.is_(None)).order_by(
+                Event.id
+            ).limit(batch_size).all()
+            if not events:
+                break
+            for event in events:
+                event.subject_id = detect_subject(event.description, event.user_id)
+                if event.subject_id:
+                    mapped["event"] = mapped.get("event", 0) + 1
+            last_id = events[-1].id
+            db.session.commit()
+
+    if mapped:
+        print(f"Mapped subjects: {mapped}")
+    return mapped
+
+
+def scope_user_subjects():
+    # Free-text subjects used to join the shared dictionary, where every user could
+    # autocomplete and fuzzy-match them. Give each user their own copy instead.
+    from extensions import db
+    from models import Subject, SubjectAlias, Score, SchoolworkAnalysis, Event, ScoreAggregate
+    from subjects import SEED_SUBJECTS, resolve_subject
+    from score_analytics import rebuild_aggregates
+
+    legacy = Subject.query.filter(Subject.owner_id.is_(None), Subject.key.notin_(list(SEED_SUBJECTS))).all()
+    affected = set()
+    for subject in legacy:
+        users = set()
+        for model in (Score, SchoolworkAnalysis, Event, ScoreAggregate):
+            users |= {uid for (uid,) in db.session.query(model.user_id).filter(
+                model.subject_id == subject.id
+            ).distinct().all()}
+
+        # Dropped first so the re-resolve below can't find the shared copy again.
+        SubjectAlias.query.filter_by(subject_id=subject.id).delete(synchronize_session=False)
+        ScoreAggregate.query.filter_by(subject_id=subject.id).delete(synchronize_session=False)
+        for user_id in users:
+            own = resolve_subject(subject.name, user_id)
+            for model in (Score, SchoolworkAnalysis, Event):
+                model.query.filter(model.user_id == user_id, model.subject_id == subject.id).update(
+                    {model.subject_id: own.id if own else None}, synchronize_session=False
+                )
+        db.session.delete(subject)
+        affected |= users
+    db.session.commit()
+
+    for user_id in sorted(affected):
+        rebuild_aggregates(user_id)
+    if legacy:
+        print(f"Scoped {len(legacy)} shared subjects to {len(affected)} users")
+    return len(legacy)
+
+
+def aggregates_missing():
+    from models import Score, ScoreAggregate
+
+    return ScoreAggregate.query.first() is None and Score.query.first() is not None
+
+
+def backfill_score_aggregates(force: bool = False):
+    from score_analytics import rebuild_aggregates
+
+    if force or aggregates_missing():
+        print(f"Built score aggregates from {rebuild_aggregates()} scores")
+
+
+def run_migrations(app):
+    # Runs once per deploy (the Procfile release phase), never from web or worker
+    # processes at import: ALTERs and index builds from several workers would race.
+    from extensions import db, blob_store
+    from subjects import seed_subjects
+
+    with app.app_context():
+        db.create_all()
+        upgrade_schema(db.engine, db.metadata)
+        ensure_trigram_index(db.engine)
+        backfill_profile_pics(blob_store)
+        seed_subjects()
+        scope_user_subjects()
+        mapped = backfill_subjects(include_events=True)
+        backfill_score_aggregates(force=bool(mapped.get("score")))
+        print("Schema is up to date.")
+
+
+if __name__ == "__main__":
+    from app_factory import create_app
+
+    run_migrations(create_app())
@@ -0,0 +1,309 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import threading
+import time
+import os
+
+DEFAULT_MODELS = ["gemini-flash-latest", "gemini-2.5-flash", "gemini-2.5-flash-lite"]
+
+
+class AllModelsFailed(Exception):
+    def __init__(self, last_error):
+        super().__init__(f"All AI models failed. Last error: {last_error}")
+        self.last_error = last_error
+
+
+class ModelUnavailable(Exception):
+    # Another request holds the half-open trial; skip to the next model.
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_started_at = None
+
+    def allow(self, now: float) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            return now - self.opened_at >= self.cooldown
+        # Half-open lets a single trial through; a trial that never reported back
+        # frees the slot after another cooldown.
+        return self._trial_free(now)
+
+    def _trial_free(self, now: float) -> bool:
+        return self.trial_started_at is None or now - self.trial_started_at >= self.cooldown
+
+    def begin(self, now: float) -> bool:
+        # Claims the trial slot. Callers hold the router lock, so of several
+        # requests racing past an elapsed cooldown only the first gets through.
+        if self.state == "closed":
+            return True
+        if self.state == "half_open" and not self._trial_free(now):
+            return False
+        self.state = "half_open"
+        self.trial_started_at = now
+        return True
+
+    def release(self):
+        # The trial ended without telling us anything about health: free the slot
+        # for the next request, leaving the state and the failure streak alone.
+        self.trial_started_at = None
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+
+    def record_failure(self, now: float):
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = now
+
+
+class ModelStats:
+    def __init__(self, window: int):
+        self.samples = deque(maxlen=window)
+        self.calls = 0
+        self.errors = 0
+
+    def record(self, latency: float, ok: bool):
+        self.samples.append((latency, ok))
+        self.calls += 1
+        if not ok:
+            self.errors += 1
+
+    def error_rate(self) -> float:
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, ok in self.samples if not ok) / len(self.samples)
+
+    def latency_percentile(self, p: float):
+        latencies = sorted(latency for latency, ok in self.samples if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+
+
+class ModelRouter:
+    def __init__(self, models, failure_threshold: int = 3, cooldown: float = 30, window: int = 50,
+                 hedge: bool = False, hedge_percentile: float = 0.9, hedge_default_delay: float = 8.0,
+                 clock=time.monotonic):
+        self.models = list(models)
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_default_delay = hedge_default_delay
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._breakers = {m: CircuitBreaker(failure_threshold, cooldown) for m in self.models}
+        self._stats = {m: ModelStats(window) for m in self.models}
+        self._hedge_pool = None
+        self.hedges_started = 0
+        self.hedges_won = 0
+
+    def ordered_models(self):
+        now = self.clock()
+        with self._lock:
+            available = [m for m in self.models if self._breakers[m].allow(now)]
+            if not available:
+                # Everything is tripped: try the one that opened longest ago.
+                available = sorted(self.models, key=lambda m: self._breakers[m].opened_at)[:1]
+
+            def health(model):
+                # Configured order wins unless error rates differ noticeably.
+                return (
+                    self._breakers[model].state != "closed",
+                    round(self._stats[model].error_rate(), 1),
+                    self.models.index(model)
+                )
+
+            return sorted(available, key=health)
+
+    def record(self, model: str, latency: float, ok: bool):
+        now = self.clock()
+        with self._lock:
+            self._stats[model].record(latency, ok)
+            if ok:
+                self._breakers[model].record_success()
+            else:
+                self._breakers[model].record_failure(now)
+
+    def release(self, model: str):
+        with self._lock:
+            self._breakers[model].release()
+
+    def hedge_delay(self, model: str) -> float:
+        with self._lock:
+            delay = self._stats[model].latency_percentile(self.hedge_percentile)
+        return delay if delay is not None else self.hedge_default_delay
+
+    def _begin(self, model: str):
+        with self._lock:
+            if not self._breakers[model].begin(self.clock()):
+                raise ModelUnavailable(f"Model {model} is being probed by another request")
+
+    def _timed(self, fn, model, fatal=()):
+        self._begin(model)
+        start = self.clock()
+        try:
+            result = fn(model)
+        except fatal:
+            self.release(model)
+            raise
+        except ValueError:
+            # The model answered but the output didn't parse: that says nothing
+            # about its health, so only the trial slot is released.
+            self.release(model)
+            raise
+        except Exception:
+            self.record(model, self.clock() - start, False)
+            raise
+        self.record(model, self.clock() - start, True)
+        return result
+
+    def call(self, fn, hedge=None, label: str = "request", fatal=()):
+        # fn(model_name) performs one attempt and raises to fall through to the
+        # next model; exceptions listed in `fatal` stop the fallback chain.
+        hedge = self.hedge if hedge is None else hedge
+        models = self.ordered_models()
+        last_error = None
+
+        while models:
+            model = models.pop(0)
+            if hedge and models:
+                try:
+                    return self._hedged(fn, model, models.pop(0), label, fatal)
+                except fatal:
+                    raise
+                except Exception as e:
+                    last_error = e
+                    continue
+
+            try:
+                print(f"Trying {label} with model: {model}")
+                return self._timed(fn, model, fatal), model
+            except fatal:
+                raise
+            except Exception as e:
+                print(f"Model {model} failed: {e}")
+                last_error = e
+
+        raise AllModelsFailed(last_error)
+
+    def _hedged(self, fn, primary, backup, label, fatal=()):
+        with self._lock:
+            if self._hedge_pool is None:
+                self._hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="model-hedge")
+
+        print(f"Trying {label} with model: {primary} (hedge: {backup})")
+        futures = {self._hedge_pool.submit(self._timed, fn, primary, fatal): primary}
+        done, _ = wait(futures, timeout=self.hedge_delay(primary))
+
+        # Race the backup once the primary is slower than its usual latency, or
+        # fall straight to it when the primary already failed.
+        hedged = not done
+        error = None if hedged else next(iter(done)).exception()
+        # A fatal error stops the chain here too: the backup must not start.
+        if isinstance(error, fatal):
+            raise error
+        if hedged or error is not None:
+            if hedged:
+                with self._lock:
+                    self.hedges_started += 1
+            futures[self._hedge_pool.submit(self._timed, fn, backup, fatal)] = backup
+
+        last_error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except fatal:
+                    raise
+                except Exception as e:
+                    print(f"Model {futures[future]} failed: {e}")
+                    last_error = e
+                    continue
+                if hedged and futures[future] == backup:
+                    with self._lock:
+                        self.hedges_won += 1
+                return result, futures[future]
+
+        raise last_error
+
+    async def acall(self, coro_fn, label: str = "request", fatal=()):
+        models = self.ordered_models()
+        last_error = None
+
+        for model in models:
+            try:
+                self._begin(model)
+            except ModelUnavailable as e:
+                last_error = last_error or e
+                continue
+
+            start = self.clock()
+            try:
+                print(f"Trying {label} with model: {model}")
+                result = await coro_fn(model)
+            except fatal:
+                self.release(model)
+                raise
+            except ValueError as e:
+                self.release(model)
+                print(f"Model {model} failed: {e}")
+                last_error = e
+                continue
+            except Exception as e:
+                self.record(model, self.clock() - start, False)
+                print(f"Model {model} failed: {e}")
+                last_error = e
+                continue
+            self.record(model, self.clock() - start, True)
+            return result, model
+
+        raise AllModelsFailed(last_error)
+
+    def stats(self):
+        with self._lock:
+            models = {}
+            for model in self.models:
+                stats, breaker = self._stats[model], self._breakers[model]
+                p50, p95 = stats.latency_percentile(0.5), stats.latency_percentile(0.95)
+                models[model] = {
+                    "state": breaker.state,
+                    "calls": stats.calls,
+                    "errors": stats.errors,
+                    "error_rate": round(stats.error_rate(), 3),
+                    "latency_p50_ms": round(p50 * 1000) if p50 is not None else None,
+                    "latency_p95_ms": round(p95 * 1000) if p95 is not None else None
+                }
+            hedges_started, hedges_won = self.hedges_started, self.hedges_won
+        return {
+            "order": self.ordered_models(),
+            "hedging": self.hedge,
+            "hedges_started": hedges_started,
+            "hedges_won": hedges_won,
+            "models": models
+        }
+
+
+def build_router():
+    models = [m.strip() for m in os.environ.get("GEMINI_MODELS", ",".join(DEFAULT_MODELS)).split(",") if m.strip()]
+    return ModelRouter(
+        models,
+        failure_threshold=int(os.environ.get("MODEL_FAILURE_THRESHOLD", "3")),
+        cooldown=float(os.environ.get("MODEL_COOLDOWN_SECONDS", "30")),
+        hedge=os.environ.get("MODEL_HEDGING") == "1",
+        hedge_percentile=float(os.environ.get("MODEL_HEDGE_PERCENTILE", "0.9"))
+    )
+
+
+model_router = build_router()
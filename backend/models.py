@@ -3,11 +3,35 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from extensions import db
 
 
+class Subject(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    # Shared subjects use the normalized name; a user's own subjects are keyed "<owner_id>:<name>".
+    key = db.Column(db.String(100), unique=True, nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    # NULL for the shared (seeded) dictionary.
+    owner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+class SubjectAlias(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id'), nullable=False, index=True)
+    alias_key = db.Column(db.String(100), unique=True, nullable=False)
+    owner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)
+
+    __table_args__ = (
+        # Lets LIKE 'prefix%' use the index on Postgres regardless of collation.
+        db.Index('ix_subject_alias_prefix', 'alias_key', postgresql_ops={'alias_key': 'varchar_pattern_ops'}),
+    )
+
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(128), nullable=False)
-    profile_pic = db.Column(db.Text, nullable=True)
+    # Legacy inline base64 picture, moved into the blob store by backfill_profile_pics().
+    profile_pic = db.deferred(db.Column(db.Text, nullable=True))
+    profile_pic_hash = db.Column(db.String(64), nullable=True)
 
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -22,7 +46,30 @@ class Event(db.Model):
     date = db.Column(db.String(10), nullable=False)
     type = db.Column(db.String(20), nullable=False)
     description = db.Column(db.Text, nullable=False)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id'), nullable=True)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = db.Column(
+        db.DateTime,
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc)
+    )
+
+    __table_args__ = (
+        db.Index('ix_event_user_date', 'user_id', 'date'),
+        db.Index('ix_event_user_subject', 'user_id', 'subject_id'),
+    )
+
+
+class EventTombstone(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    event_id = db.Column(db.Integer, nullable=False)
+    date = db.Column(db.String(10), nullable=False)
+    deleted_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        db.Index('ix_event_tombstone_user_deleted', 'user_id', 'deleted_at'),
+    )
 
 
 class ChatSession(db.Model):
@@ -30,8 +77,15 @@ class ChatSession(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     title = db.Column(db.String(100))
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    summary = db.Column(db.Text)
+    summary_upto_id = db.Column(db.Integer)
+    summary_updated_at = db.Column(db.DateTime)
     messages = db.relationship('ChatMessage', backref='session', lazy=True, cascade="all, delete-orphan")
 
+    __table_args__ = (
+        db.Index('ix_chat_session_user_created', 'user_id', 'created_at'),
+    )
+
 
 class ChatMessage(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -39,23 +93,115 @@ class ChatMessage(db.Model):
     role = db.Column(db.String(20))
     content = db.Column(db.Text)
     has_image = db.Column(db.Boolean, default=False)
+    image_hash = db.Column(db.String(64), nullable=True)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
+    __table_args__ = (
+        db.Index('ix_chat_message_session_id', 'session_id', 'id'),
+        db.Index('ix_chat_message_image_hash', 'image_hash'),
+    )
+
 
 class Score(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     subject = db.Column(db.String(100), nullable=False)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id'), nullable=True)
     score_value = db.Column(db.Integer, nullable=False)
     total = db.Column(db.Integer, nullable=False)
     timestamp = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
 
+    __table_args__ = (
+        db.Index('ix_score_user_timestamp', 'user_id', 'timestamp'),
+        db.Index('ix_score_user_subject', 'user_id', 'subject_id', 'timestamp'),
+    )
+
+
+class ScoreAggregate(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    subject_key = db.Column(db.String(100), nullable=False)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id'), nullable=True)
+    subject = db.Column(db.String(100), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    sum_pct = db.Column(db.Float, nullable=False, default=0)
+    best_pct = db.Column(db.Float)
+    worst_pct = db.Column(db.Float)
+    # JSON list of the last few [score, total, timestamp] entries, newest last.
+    recent = db.Column(db.Text)
+    last_score_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'subject_key', name='uq_score_aggregate_user_subject'),
+    )
+
 
 class SchoolworkAnalysis(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     type = db.Column(db.String(50), nullable=False)
     subject = db.Column(db.String(100), nullable=False)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id'), nullable=True)
     topic = db.Column(db.String(200))
     content = db.Column(db.Text, nullable=False)
+    # "streaming" while an analysis is still being written; NULL on older rows means complete.
+    status = db.Column(db.String(20), default="complete")
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+    __table_args__ = (
+        db.Index('ix_schoolwork_user_subject', 'user_id', 'subject_id'),
+    )
+
+
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    kind = db.Column(db.String(30), nullable=False)
+    # queued -> running -> complete | failed
+    status = db.Column(db.String(20), nullable=False, default="queued")
+    priority = db.Column(db.Integer, nullable=False, default=0)
+    payload = db.Column(db.Text, nullable=False)
+    result = db.Column(db.Text)
+    # HTTP status the synchronous endpoint would have answered with.
+    result_status = db.Column(db.Integer)
+    error = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    worker_id = db.Column(db.String(64))
+    available_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    started_at = db.Column(db.DateTime)
+    # Refreshed while a worker is still on the job; only silent jobs are reclaimed.
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_job_claim', 'status', 'priority', 'id'),
+        db.Index('ix_job_user_status', 'user_id', 'status'),
+    )
+
+
+class SyncCheckpoint(db.Model):
+    name = db.Column(db.String(50), primary_key=True)
+    last_id = db.Column(db.Integer, nullable=False, default=0)
+    last_created_at = db.Column(db.DateTime)
+    # Incremental runs also pick up edits and deletes of older rows from these marks.
+    last_changed_at = db.Column(db.DateTime)
+    last_tombstone_id = db.Column(db.Integer)
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+
+
+class VectorOutbox(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    collection = db.Column(db.String(50), nullable=False)
+    operation = db.Column(db.String(10), nullable=False)
+    doc_id = db.Column(db.String(100), nullable=False)
+    document = db.Column(db.Text)
+    doc_metadata = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text)
+    available_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), index=True)
+    # Set once an entry has used up its attempts; it stays for inspection but is never retried.
+    dead_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
@@ -0,0 +1,217 @@
+from concurrent.futures import ThreadPoolExecutor
+from google.genai import types
+from extensions import client
+from model_router import model_router, AllModelsFailed
+from response_cache import normalize_text
+import json
+import math
+import time
+import os
+
+QUIZ_CHUNK_CHARS = int(os.environ.get("QUIZ_CHUNK_CHARS", "6000"))
+# Single-call mode stays the default for one image or a short text.
+QUIZ_MAP_REDUCE_MIN_UNITS = int(os.environ.get("QUIZ_MAP_REDUCE_MIN_UNITS", "2"))
+QUIZ_EXTRA_PER_UNIT = 2
+
+quiz_pool = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("QUIZ_MAP_WORKERS", "4")),
+    thread_name_prefix="quiz-map"
+)
+
+QUESTION_FORMAT = """
+    Each question must have:
+    - "question": the text of the question
+    - "options": an array of 4 possible answers
+    - "correct": the text of the correct answer (must match one of the options exactly)
+"""
+
+
+def chunk_text(text: str, max_chars: int = QUIZ_CHUNK_CHARS):
+    text = (text or "").strip()
+    if not text:
+        return []
+
+    chunks, current = [], ""
+    for paragraph in text.split("\n\n"):
+        while len(paragraph) > max_chars:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(paragraph[:max_chars])
+            paragraph = paragraph[max_chars:]
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current.strip():
+        chunks.append(current)
+    return chunks
+
+
+def quiz_units(context, images):
+    return [("text", chunk) for chunk in chunk_text(context)] + [("image", image) for image in images]
+
+
+def needs_map_reduce(context, images) -> bool:
+    return len(quiz_units(context, images)) >= QUIZ_MAP_REDUCE_MIN_UNITS
+
+
+def valid_question(item):
+    if not isinstance(item, dict):
+        return None
+    question = str(item.get("question") or "").strip()
+    options = item.get("options")
+    correct = str(item.get("correct") or "").strip()
+
+    if not question or not isinstance(options, list) or len(options) != 4:
+        return None
+    options = [str(o).strip() for o in options]
+    if correct not in options or len(set(options)) != 4:
+        return None
+    return {"question": question, "options": options, "correct": correct}
+
+
+def parse_json(text):
+    raw_text = (text or "").strip()
+    if raw_text.startswith("```"):
+        raw_text = raw_text.split("```")[1]
+        if raw_text.startswith("json"):
+            raw_text = raw_text[4:]
+    return json.loads(raw_text)
+
+
+def mine_unit(subject, kind, material, count):
+    source = "image" if kind == "image" else "text excerpt"
+    prompt = f"""
+    You are an expert teacher preparing a multiple-choice quiz on {subject}.
+    Use ONLY the study material in this {source}.
+
+    1. Summarize the key facts it contains in a few sentences.
+    2. Write up to {count} multiple-choice questions about it.
+    {QUESTION_FORMAT}
+    Response format:
+    {{"summary": "...", "questions": [{{"question": "...", "options": ["a", "b", "c", "d"], "correct": "a"}}]}}
+    """
+
+    contents = [types.Part.from_text(text=prompt)]
+    if kind == "image":
+        contents.append(types.Part.from_bytes(data=material.data, mime_type=material.mime_type))
+    else:
+        contents.append(types.Part.from_text(text=f"Study Material:\n{material}"))
+
+    def attempt(model_name):
+        response = client.models.generate_content(
+            model=model_name,
+            contents=contents,
+            config=types.GenerateContentConfig(response_mime_type="application/json")
+        )
+        data = parse_json(response.text)
+        if not isinstance(data, dict):
+            raise ValueError("AI returned invalid format")
+        return data
+
+    started = time.monotonic()
+    data, model = model_router.call(attempt, label=f"quiz map ({source})")
+    questions = [q for q in (valid_question(item) for item in data.get("questions") or []) if q]
+    return {
+        "summary": str(data.get("summary") or "").strip(),
+        "questions": questions,
+        "model": model,
+        "ms": round((time.monotonic() - started) * 1000)
+    }
+
+
+def top_up(subject, summaries, existing, missing):
+    asked = "\n".join(f"- {q['question']}" for q in existing)
+    prompt = f"""
+    You are an expert teacher. Write exactly {missing} more multiple-choice questions on {subject},
+    based ONLY on these notes taken from the student's study material:
+
+    {chr(10).join(f"- {s}" for s in summaries if s)}
+
+    Do not repeat any of these questions:
+    {asked or "(none)"}
+    {QUESTION_FORMAT}
+    Response format:
+    {{"questions": [{{"question": "...", "options": ["a", "b", "c", "d"], "correct": "a"}}]}}
+    """
+
+    def attempt(model_name):
+        response = client.models.generate_content(
+            model=model_name,
+            contents=prompt,
+            config=types.GenerateContentConfig(response_mime_type="application/json")
+        )
+        data = parse_json(response.text)
+        questions = [q for q in (valid_question(item) for item in data.get("questions") or []) if q]
+        if len(questions) < missing:
+            raise ValueError("AI returned too few questions")
+        return questions
+
+    questions, _ = model_router.call(attempt, label="quiz top-up")
+    return questions
+
+
+def merge_questions(unit_questions, count, seen=None):
+    # Round-robin across pages so every page is represented before any repeats.
+    seen = set() if seen is None else seen
+    merged = []
+    queues = [list(questions) for questions in unit_questions]
+    while len(merged) < count and any(queues):
+        for queue in queues:
+            while queue:
+                question = queue.pop(0)
+                key = normalize_text(question["question"])
+                if key not in seen:
+                    seen.add(key)
+                    merged.append(question)
+                    break
+            if len(merged) == count:
+                break
+    return merged
+
+
+def build_quiz_map_reduce(subject, context, images, count):
+    units = quiz_units(context, images)
+    per_unit = math.ceil(count / len(units)) + QUIZ_EXTRA_PER_UNIT
+    timings = {"units": []}
+
+    started = time.monotonic()
+    futures = [quiz_pool.submit(mine_unit, subject, kind, material, per_unit) for kind, material in units]
+
+    results, last_error = [], None
+    for index, ((kind, _), future) in enumerate(zip(units, futures)):
+        try:
+            result = future.result()
+        except Exception as e:
+            # A single unreadable page shouldn't sink the whole quiz.
+            print(f"Quiz map unit {index} ({kind}) failed: {e}")
+            last_error = e.last_error if isinstance(e, AllModelsFailed) else e
+            timings["units"].append({"unit": index, "kind": kind, "error": str(e)})
+            continue
+        results.append(result)
+        timings["units"].append({
+            "unit": index,
+            "kind": kind,
+            "ms": result["ms"],
+            "questions": len(result["questions"]),
+            "model": result["model"]
+        })
+    timings["map_ms"] = round((time.monotonic() - started) * 1000)
+
+    if not results:
+        raise AllModelsFailed(last_error)
+
+    started = time.monotonic()
+    seen = set()
+    questions = merge_questions([r["questions"] for r in results], count, seen)
+    if len(questions) < count:
+        extra = top_up(subject, [r["summary"] for r in results], questions, count - len(questions))
+        questions += merge_questions([extra], count - len(questions), seen)
+        if len(questions) < count:
+            raise AllModelsFailed(ValueError("AI returned too few questions"))
+        timings["top_up"] = True
+    timings["reduce_ms"] = round((time.monotonic() - started) * 1000)
+
+    print(f"Quiz map-reduce: {len(units)} units, map {timings['map_ms']} ms, reduce {timings['reduce_ms']} ms")
+    return {"questions": questions}, timings
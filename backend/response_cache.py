@@ -0,0 +1,148 @@
+from collections import OrderedDict
+import hashlib
+import json
+import re
+import threading
+import time
+import os
+import numpy as np
+
+CHARS_PER_TOKEN = 4
+
+
+def normalize_text(value) -> str:
+    return re.sub(r"\s+", " ", str(value or "")).strip().casefold()
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 1000, ttl: float = 86400, embed_fn=None,
+                 semantic_threshold: float = 0.95, cost_per_million_tokens: float = 0.0,
+                 clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.embed_fn = embed_fn
+        self.semantic_threshold = semantic_threshold
+        self.cost_per_million_tokens = cost_per_million_tokens
+        self.clock = clock
+
+        self._entries = OrderedDict()
+        self._groups = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+
+    def _group(self, template, subject, image_digests):
+        return (template, normalize_text(subject), tuple(sorted(image_digests or ())))
+
+    def key_for(self, template, subject, material, image_digests=()):
+        group = self._group(template, subject, image_digests)
+        raw = json.dumps([group[0], group[1], normalize_text(material), list(group[2])])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _embed(self, material):
+        if self.embed_fn is None or not normalize_text(material):
+            return None
+        vector = np.asarray(self.embed_fn([normalize_text(material)])[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            keys = self._groups.get(entry["group"])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._groups[entry["group"]]
+
+    def _hit(self, key, entry, semantic: bool):
+        self._entries.move_to_end(key)
+        if semantic:
+            self.semantic_hits += 1
+        else:
+            self.hits += 1
+        self.tokens_saved += entry["tokens"]
+        return entry["value"]
+
+    def get(self, template, subject, material, image_digests=(), semantic: bool = True, threshold=None):
+        key = self.key_for(template, subject, material, image_digests)
+        now = self.clock()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry["stored_at"] <= self.ttl:
+                    return self._hit(key, entry, semantic=False), "hit"
+                self._drop(key)
+
+        # Callers whose material is personal or differs only in numbers and names
+        # (which embeddings barely separate) opt out and get exact matches only.
+        vector = self._embed(material) if semantic else None
+        if vector is not None:
+            group = self._group(template, subject, image_digests)
+            with self._lock:
+                best_key, best_score = None, max(self.semantic_threshold, threshold or 0)
+                for candidate in list(self._groups.get(group, ())):
+                    entry = self._entries[candidate]
+                    if now - entry["stored_at"] > self.ttl:
+                        self._drop(candidate)
+                        continue
+                    if entry["vector"] is None:
+                        continue
+                    score = float(np.dot(vector, entry["vector"]))
+                    if score >= best_score:
+                        best_key, best_score = candidate, score
+                if best_key is not None:
+                    return self._hit(best_key, self._entries[best_key], semantic=True), "semantic"
+
+        with self._lock:
+            self.misses += 1
+        return None, "miss"
+
+    def put(self, template, subject, material, image_digests, value, prompt_text: str = "", semantic: bool = True):
+        key = self.key_for(template, subject, material, image_digests)
+        group = self._group(template, subject, image_digests)
+        tokens = (len(prompt_text) + len(json.dumps(value, ensure_ascii=False))) // CHARS_PER_TOKEN
+        vector = self._embed(material) if semantic else None
+
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = {
+                "value": value,
+                "group": group,
+                "vector": vector,
+                "tokens": tokens,
+                "stored_at": self.clock()
+            }
+            self._groups.setdefault(group, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.semantic_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+                "tokens_saved": self.tokens_saved,
+                "estimated_cost_saved": round(self.tokens_saved * self.cost_per_million_tokens / 1_000_000, 4)
+            }
+
+
+def build_response_cache(embed_fn):
+    semantic = os.environ.get("RESPONSE_CACHE_SEMANTIC", "1") == "1"
+    return ResponseCache(
+        max_entries=int(os.environ.get("RESPONSE_CACHE_SIZE", "1000")),
+        ttl=float(os.environ.get("RESPONSE_CACHE_TTL", "86400")),
+        embed_fn=embed_fn if semantic else None,
+        semantic_threshold=float(os.environ.get("RESPONSE_CACHE_SIMILARITY", "0.95")),
+        cost_per_million_tokens=float(os.environ.get("GEMINI_COST_PER_MTOK", "0.30"))
+    )
@@ -0,0 +1,95 @@
+from concurrent.futures import ThreadPoolExecutor
+from google.genai import types
+from extensions import collection, chat_collection, embedding_cache
+from models import ChatMessage
+from chat_context import build_conversation_context, RECENT_TURNS
+import os
+
+HISTORY_RESULTS = 10
+HISTORY_MAX_DISTANCE = 1
+CALENDAR_RESULTS = 10
+CALENDAR_MAX_DISTANCE = 1.5
+
+retrieval_pool = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("RETRIEVAL_WORKERS", "4")),
+    thread_name_prefix="retrieval"
+)
+
+
+def query_chat_history(user_id: str, session_id: str, query_embedding):
+    results = chat_collection.query(
+        query_embeddings=[query_embedding],
+        n_results=HISTORY_RESULTS,
+        where={"$and": [{"user_id": str(user_id)}, {"session_id": str(session_id)}]}
+    )
+
+    hits = []
+    if results['documents'] and results['documents'][0]:
+        for doc, meta, dist in zip(results['documents'][0], results['metadatas'][0], results['distances'][0]):
+            if dist <= HISTORY_MAX_DISTANCE:
+                hits.append({
+                    "id": meta.get("message_id"),
+                    "role": "user" if meta['role'] == "user" else "model",
+                    "content": doc
+                })
+    return hits
+
+
+def query_calendar_context(user_id: str, query_embedding):
+    results = collection.query(
+        query_embeddings=[query_embedding],
+        n_results=CALENDAR_RESULTS,
+        where={"user_id": str(user_id)}
+    )
+
+    relevant_docs = []
+    if results['documents'] and results['documents'][0]:
+        for doc, distance in zip(results['documents'][0], results['distances'][0]):
+            if distance <= CALENDAR_MAX_DISTANCE:
+                relevant_docs.append(doc)
+
+    if not relevant_docs:
+        return ""
+    return "\nUse this relevant context from your calendar:\n" + "\n".join(relevant_docs)
+
+
+def recent_turns(session_id: str, after_id=None, limit: int = RECENT_TURNS):
+    query = ChatMessage.query.filter_by(session_id=session_id)
+    if after_id:
+        query = query.filter(ChatMessage.id > after_id)
+    messages = query.order_by(
+        ChatMessage.id.desc()
+    ).limit(limit).all()
+
+    return [{
+        "id": m.id,
+        "role": "user" if m.role == "user" else "model",
+        "content": m.content
+    } for m in reversed(messages)]
+
+
+def retrieve_chat_context(user_id: str, session_id: str, user_text: str, summary_upto_id=None):
+    history_future = context_future = None
+    if user_text:
+        # One embedding feeds both lookups, which then run side by side.
+        query_embedding = embedding_cache([user_text])[0]
+        history_future = retrieval_pool.submit(query_chat_history, user_id, session_id, query_embedding)
+        context_future = retrieval_pool.submit(query_calendar_context, user_id, query_embedding)
+
+    # SQL stays on the calling thread, which owns the app context and session.
+    recent = recent_turns(session_id, summary_upto_id)
+    semantic = history_future.result() if history_future else []
+    if summary_upto_id:
+        # Folded turns are covered by the session summary; their vectors are
+        # removed by the outbox, this only hides ones not yet deleted.
+        semantic = [m for m in semantic if m["id"] is not None and m["id"] > summary_upto_id]
+    context = context_future.result() if context_future else ""
+
+    messages, tokens = build_conversation_context(recent, semantic)
+    print(f"Chat context: {len(messages)} messages, ~{tokens} tokens ({len(recent)} recent, {len(semantic)} semantic)")
+
+    history = [
+        types.Content(role=m["role"], parts=[types.Part.from_text(text=m["content"])])
+        for m in messages
+    ]
+    return history, context
@@ -1,7 +1,9 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from extensions import db
+from extensions import db, blob_store
 from models import User
+from image_pipeline import ImageError, load_images, request_payload
+from routes.blobs import blob_url
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -54,7 +56,12 @@ def get_current_user():
     if not user:
         return {"message": "User not found"}, 404
 
-    return {"id": user.id, "email": user.email, "profile_pic": user.profile_pic}
+    return {
+        "id": user.id,
+        "email": user.email,
+        "profile_pic": blob_url(user.profile_pic_hash),
+        "profile_pic_thumb": blob_url(user.profile_pic_hash, "thumb")
+    }
 
 
 @auth_bp.post("/auth/update_profile_pic")
@@ -65,13 +72,24 @@ def update_profile_pic():
     if not user:
         return {"message": "User not found"}, 404
 
-    data = request.get_json()
-    profile_pic = data.get("profile_pic")
+    data = request_payload(binary_field="profile_pic")
+    try:
+        images = load_images(data.get("profile_pic"))
+    except ImageError as e:
+        return {"message": str(e)}, 400
+
+    if not images:
+        return {"message": "No image provided"}, 400
 
-    user.profile_pic = profile_pic
+    user.profile_pic_hash = blob_store.put(images[0].data)
+    user.profile_pic = None
     db.session.commit()
 
-    return {"message": "Profile picture updated successfully"}
+    return {
+        "message": "Profile picture updated successfully",
+        "profile_pic": blob_url(user.profile_pic_hash),
+        "profile_pic_thumb": blob_url(user.profile_pic_hash, "thumb")
+    }
 
 
 @auth_bp.post("/auth/change_password")
@@ -0,0 +1,48 @@
+from flask import Blueprint, Response, request, jsonify, url_for
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from extensions import db, blob_store
+from models import User, ChatSession, ChatMessage
+
+blobs_bp = Blueprint('blobs', __name__)
+
+# Content never changes under a given hash, so clients may keep it forever.
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def blob_url(digest, variant=None):
+    if not digest:
+        return None
+    return url_for("blobs.get_blob", digest=digest, variant=variant, _external=True)
+
+
+def user_can_read(user_id, digest):
+    if db.session.query(User.id).filter(User.id == user_id, User.profile_pic_hash == digest).first():
+        return True
+    return db.session.query(ChatMessage.id).join(ChatSession, ChatSession.id == ChatMessage.session_id).filter(
+        ChatSession.user_id == user_id,
+        ChatMessage.image_hash == digest
+    ).first() is not None
+
+
+@blobs_bp.route('/blobs/<digest>', methods=['GET'])
+@jwt_required()
+def get_blob(digest):
+    user_id = int(get_jwt_identity())
+    variant = request.args.get("variant")
+    etag = f"{digest}.{variant}" if variant else digest
+
+    if not user_can_read(user_id, digest):
+        return jsonify({"error": "Not found"}), 404
+
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        data, mime_type = blob_store.get(digest, variant)
+        if data is None:
+            return jsonify({"error": "Not found"}), 404
+        response = Response(data, mimetype=mime_type or "application/octet-stream")
+
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = f"private, max-age={IMMUTABLE_MAX_AGE}, immutable"
+    return response
+
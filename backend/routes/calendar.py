@@ -1,28 +1,102 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from extensions import db, collection
-from models import Event
+from sqlalchemy import func
+from datetime import datetime, timezone
+from extensions import db
+from models import Event, EventTombstone
+from vector_outbox import enqueue_event, enqueue_delete, notify_indexer
+from subjects import detect_subject
+import hashlib
 
 calendar_bp = Blueprint('calendar', __name__)
 
 
+def parse_date_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    datetime.strptime(value, "%Y-%m-%d")
+    return value
+
+
+def parse_timestamp_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    return parsed.astimezone(timezone.utc).replace(tzinfo=None) if parsed.tzinfo else parsed
+
+
+def as_utc(value):
+    if value is None:
+        return None
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
 @calendar_bp.route('/events', methods=['GET'])
 @jwt_required()
 def get_events():
     current_user_id = get_jwt_identity()
-    events_from_db = Event.query.filter_by(user_id=current_user_id).all()
-    events_by_date = {}
+    sync_cursor = datetime.now(timezone.utc)
 
-    for event in events_from_db:
-        if event.date not in events_by_date:
-            events_by_date[event.date] = []
-        events_by_date[event.date].append({
-            "id": event.id,
-            "type": event.type,
-            "description": event.description
-        })
-
-    return jsonify(events_by_date)
+    try:
+        date_from = parse_date_arg("from")
+        date_to = parse_date_arg("to")
+        updated_since = parse_timestamp_arg("updated_since")
+    except ValueError:
+        return {"message": "Invalid date filter"}, 400
+
+    changed_at = func.coalesce(Event.updated_at, Event.created_at)
+    query = Event.query.filter(Event.user_id == current_user_id)
+    tombstones = EventTombstone.query.filter(EventTombstone.user_id == current_user_id)
+
+    if date_from:
+        query = query.filter(Event.date >= date_from)
+        tombstones = tombstones.filter(EventTombstone.date >= date_from)
+    if date_to:
+        query = query.filter(Event.date <= date_to)
+        tombstones = tombstones.filter(EventTombstone.date <= date_to)
+    if updated_since:
+        query = query.filter(changed_at > updated_since)
+        tombstones = tombstones.filter(EventTombstone.deleted_at > updated_since)
+
+    count, max_id, last_changed = query.with_entities(
+        func.count(Event.id), func.max(Event.id), func.max(changed_at)
+    ).one()
+    last_deleted = tombstones.with_entities(func.max(EventTombstone.deleted_at)).scalar()
+
+    fingerprint = f"{date_from}|{date_to}|{updated_since}|{count}|{max_id}|{last_changed}|{last_deleted}"
+    etag = hashlib.sha1(fingerprint.encode()).hexdigest()
+    last_modified = max((as_utc(t) for t in (last_changed, last_deleted) if t), default=None)
+
+    if etag in request.if_none_match or (
+        not request.if_none_match and last_modified and request.if_modified_since
+        and last_modified.replace(microsecond=0) <= request.if_modified_since
+    ):
+        response = Response(status=304)
+    else:
+        events_by_date = {}
+        for event in query.order_by(Event.date, Event.id).all():
+            if event.date not in events_by_date:
+                events_by_date[event.date] = []
+            events_by_date[event.date].append({
+                "id": event.id,
+                "type": event.type,
+                "description": event.description
+            })
+
+        if updated_since:
+            deleted = [t.event_id for t in tombstones.order_by(EventTombstone.id).all()]
+            response = jsonify({"events": events_by_date, "deleted": deleted})
+        else:
+            response = jsonify(events_by_date)
+
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers["Cache-Control"] = "private, no-cache"
+    response.headers["X-Sync-Cursor"] = sync_cursor.isoformat()
+    return response
 
 
 @calendar_bp.route('/events', methods=['POST'])
@@ -44,18 +118,16 @@ def create_event():
         user_id=current_user_id,
         date=date,
         type=event_type,
-        description=description
+        description=description,
+        subject_id=detect_subject(description, current_user_id)
     )
 
     try:
         db.session.add(new_event)
+        db.session.flush()
+        enqueue_event(new_event)
         db.session.commit()
-
-        collection.add(
-            ids=[str(new_event.id)],
-            documents=[f"Date: {new_event.date}, Task: {new_event.description}"],
-            metadatas=[{"user_id": str(current_user_id)}]
-        )
+        notify_indexer()
         print("Event added")
         return {
             "message": "Event created successfully",
@@ -105,10 +177,15 @@ def delete_event():
 
     try:
         print(f"Deleting event: {event_to_delete.id}")
+        enqueue_delete("user_events", [event_to_delete.id])
+        db.session.add(EventTombstone(
+            user_id=event_to_delete.user_id,
+            event_id=event_to_delete.id,
+            date=event_to_delete.date
+        ))
         db.session.delete(event_to_delete)
         db.session.commit()
-
-        collection.delete(ids=[str(event_to_delete.id)])
+        notify_indexer()
 
         return jsonify({"success": True, "message": "Event deleted"}), 200
     except Exception as e:
@@ -1,212 +1,326 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from google.genai import types
+from sqlalchemy import insert, func, or_, and_
+from sqlalchemy.orm import selectinload, aliased
 from datetime import datetime, timezone
-from extensions import db, collection, chat_collection, client
+from extensions import db, client, push_to_user, response_cache, blob_store
 from models import Event, ChatSession, ChatMessage
+from retrieval import retrieve_chat_context
+from chat_summary import schedule_summary
+from model_router import model_router, AllModelsFailed
+from image_pipeline import ImageError, load_images, request_payload
+from routes.blobs import blob_url
+from quiz_builder import build_quiz_map_reduce, needs_map_reduce
+from subjects import detect_subject
+from vector_outbox import enqueue_events, enqueue_chat_message, notify_indexer
 import base64
 import json
 import re
+import os
 
 chat_bp = Blueprint('chat', __name__)
 
+EVENT_TYPES = ("homework", "test", "project")
+# Study material that differs only by a chapter number embeds almost identically,
+# so quizzes are reused on exact matches unless a (high) similarity is configured.
+QUIZ_CACHE_SIMILARITY = float(os.environ.get("QUIZ_CACHE_SIMILARITY", "0"))
 
-def process_chat_message(user_id: str, data_in: dict, stream_callback=None):
+
+def prepare_chat_turn(user_id: str, data_in: dict):
     session_id = data_in.get("session_id")
-    image_b64 = data_in.get("image")
-    user_text = data_in.get("message", "").strip()
+    user_text = (data_in.get("message") or "").strip()
 
     now = datetime.now(timezone.utc)
     today_str = now.strftime("%Y-%m-%d")
     day_name = now.strftime("%A")
 
-    if not user_text and not image_b64:
-        return {"error": "Empty message"}, 400
+    try:
+        images = load_images(data_in.get("image"))[:1]
+    except ImageError as e:
+        return None, ({"error": str(e)}, 400)
+
+    if not user_text and not images:
+        return None, ({"error": "Empty message"}, 400)
 
     if not session_id:
-        return {"error": "Missing session_id"}, 400
+        return None, ({"error": "Missing session_id"}, 400)
 
     chat_session = db.session.get(ChatSession, session_id)
-    if not chat_session:
-        title_preview = user_text[:30] if user_text else "Image Shared"
-        chat_session = ChatSession(id=session_id, user_id=user_id, title=title_preview)
-        db.session.add(chat_session)
-        db.session.flush()
-
-    gemini_history = []
-
-    if user_text:
-        history_results = chat_collection.query(
-            query_texts=[user_text],
-            n_results=10,
-            where={"$and": [{"user_id": user_id}, {"session_id": str(chat_session.id)}]}
-        )
-        if history_results['documents'] and history_results['documents'][0]:
-            for doc, meta, dist in zip(history_results['documents'][0], history_results['metadatas'][0], history_results['distances'][0]):
-                if dist <= 1:
-                    role = "user" if meta['role'] == "user" else "model"
-                    gemini_history.append(types.Content(role=role, parts=[types.Part.from_text(text=doc)]))
-
+    if chat_session and chat_session.user_id != int(user_id):
+        return None, ({"error": "Session not found"}, 404)
+
+    summary = chat_session.summary if chat_session else None
+    summary_upto_id = chat_session.summary_upto_id if chat_session else None
+    gemini_history, context = retrieve_chat_context(user_id, str(session_id), user_text, summary_upto_id)
+    if summary:
+        context = f"\nSummary of the earlier conversation:\n{summary}\n" + context
     print(f"GEN history len: {len(gemini_history)}")
-    user_db_msg = ChatMessage(session_id=session_id, role='user', content=user_text)
-    db.session.add(user_db_msg)
-    db.session.flush()
-
-    chat_collection.add(
-        ids=[str(chat_session.id) + "_" + str(user_db_msg.id)],
-        documents=[user_text],
-        metadatas=[{"role": "user", "user_id": str(user_id), "session_id": str(chat_session.id)}]
-    )
-
-    context = ""
-    if user_text:
-        search_results = collection.query(
-            query_texts=[user_text],
-            n_results=10,
-            where={"user_id": str(user_id)}
-        )
-        relevant_docs = []
-        if search_results['documents'] and search_results['documents'][0]:
-            print(len(search_results['documents'][0]))
-            print(search_results['distances'])
-            for doc, distance in zip(search_results['documents'][0], search_results['distances'][0]):
-                if distance <= 1.5:
-                    relevant_docs.append(doc)
-
-            if relevant_docs:
-                context += "\nUse this relevant context from your calendar:\n" + "\n".join(relevant_docs)
-                print(context)
 
     current_parts = []
     if user_text:
         current_parts.append(types.Part.from_text(text=user_text))
 
-    if image_b64:
-        if "," in image_b64:
-            image_b64 = image_b64.split(",")[1]
-
-        image_data = base64.b64decode(image_b64.strip())
-        current_parts.append(types.Part.from_bytes(data=image_data, mime_type="image/jpeg"))
+    for image in images:
+        current_parts.append(types.Part.from_bytes(data=image.data, mime_type=image.mime_type))
 
-        if not user_text:
-            current_parts.insert(0, types.Part.from_text(text="Describe this image."))
+    if images and not user_text:
+        current_parts.insert(0, types.Part.from_text(text="Describe this image."))
 
-    models_to_try = [
-        "gemini-flash-latest",
-        "gemini-2.5-flash",
-        "gemini-2.5-flash-lite"
-    ]
+    config = types.GenerateContentConfig(
+        system_instruction=f"""
+        You are a helpful student assistant, focus on giving short and clear answers.
+        Note that today's date is : {today_str} ({day_name}).
+        {context}.
+        IMPORTANT: Always format mathematical formulas using standard Markdown code blocks or inline backticks.
+        Example: `x = y^2`. Strictly avoid LaTeX symbols like $, $$.
+        """
+    )
 
-    ai_reply = None
-    last_error = None
+    return {
+        "user_id": user_id,
+        "session_id": session_id,
+        "user_text": user_text,
+        "has_image": bool(images),
+        "image": images[0] if images else None,
+        "history": gemini_history,
+        "parts": current_parts,
+        "config": config
+    }, None
 
-    for model_name in models_to_try:
-        try:
-            print(f"Trying chat with model: {model_name}")
-            chat = client.chats.create(
-                model=model_name,
-                config=types.GenerateContentConfig(
-                    system_instruction=f"""
-                    You are a helpful student assistant, focus on giving short and clear answers.
-                    Note that today's date is : {today_str} ({day_name}).
-                    {context}.
-                    IMPORTANT: Always format mathematical formulas using standard Markdown code blocks or inline backticks.
-                    Example: `x = y^2`. Strictly avoid LaTeX symbols like $, $$.
-                    """
-                ),
-                history=gemini_history
-            )
 
-            if stream_callback is not None:
-                stream_chunks = []
-                try:
-                    stream = chat.send_message_stream(message=current_parts)
-                    for chunk in stream:
-                        chunk_text = getattr(chunk, "text", None)
-                        if chunk_text:
-                            stream_chunks.append(chunk_text)
-                            stream_callback(chunk_text)
-
-                    ai_reply = "".join(stream_chunks).strip()
-                    if not ai_reply:
-                        raise ValueError("Empty streamed response")
-                except Exception as stream_error:
-                    print(f"Streaming failed for {model_name}, falling back to non-streaming: {stream_error}")
-                    response = chat.send_message(message=current_parts)
-                    ai_reply = response.text
-            else:
-                response = chat.send_message(message=current_parts)
-                ai_reply = response.text
-            break
-
-        except Exception as e:
-            print(f"Model {model_name} failed: {e}")
-            last_error = e
-            continue
-
-    if not ai_reply:
-        return {"error": f"All AI models failed. Last error: {str(last_error)}"}, 500
+def save_chat_turn(turn: dict, ai_reply: str):
+    session_id = turn["session_id"]
+    user_id = turn["user_id"]
 
     try:
+        chat_session = db.session.get(ChatSession, session_id)
+        if not chat_session:
+            user_text = turn["user_text"]
+            title_preview = user_text[:30] if user_text else "Image Shared"
+            chat_session = ChatSession(id=session_id, user_id=user_id, title=title_preview)
+            db.session.add(chat_session)
+
+        image_hash = blob_store.put(turn["image"].data) if turn["image"] else None
+        user_db_msg = ChatMessage(
+            session_id=session_id, role='user', content=turn["user_text"],
+            has_image=turn["has_image"], image_hash=image_hash
+        )
+        db.session.add(user_db_msg)
+        db.session.flush()
+        enqueue_chat_message(user_db_msg, user_id)
+
         ai_db_msg = ChatMessage(session_id=session_id, role='assistant', content=ai_reply)
         db.session.add(ai_db_msg)
         db.session.flush()
-        chat_collection.add(
-            ids=[str(chat_session.id) + "_" + str(ai_db_msg.id) + "1"],
-            documents=[ai_db_msg.content],
-            metadatas=[{"role": "ai", "user_id": str(user_id), "session_id": str(chat_session.id)}]
-        )
+        enqueue_chat_message(ai_db_msg, user_id)
 
         db.session.commit()
-
-        return {
-            "status": "success",
-            "session_id": str(session_id),
-            "id": ai_db_msg.id,
-            "reply": ai_reply
-        }, 200
+        message_id = ai_db_msg.id
 
     except Exception as e:
         db.session.rollback()
         print(f"Error: {e}")
         return {"error": str(e)}, 500
 
+    # The turn is committed by now: a failure to kick off indexing or the
+    # summary must not turn a saved reply into a 500.
+    try:
+        notify_indexer()
+        schedule_summary(current_app._get_current_object(), session_id)
+    except Exception as e:
+        print(f"Chat {session_id}: post-save tasks failed: {e}")
+
+    return {
+        "status": "success",
+        "session_id": str(session_id),
+        "id": message_id,
+        "reply": ai_reply
+    }, 200
+
+
+def process_chat_message(user_id: str, data_in: dict, stream_callback=None):
+    turn, error = prepare_chat_turn(user_id, data_in)
+    if error:
+        return error
+
+    current_parts = turn["parts"]
+
+    def attempt(model_name):
+        chat = client.chats.create(
+            model=model_name,
+            config=turn["config"],
+            history=turn["history"]
+        )
+
+        if stream_callback is not None:
+            stream_chunks = []
+            try:
+                stream = chat.send_message_stream(message=current_parts)
+                for chunk in stream:
+                    chunk_text = getattr(chunk, "text", None)
+                    if chunk_text:
+                        stream_chunks.append(chunk_text)
+                        stream_callback(chunk_text)
+
+                ai_reply = "".join(stream_chunks).strip()
+                if not ai_reply:
+                    raise ValueError("Empty streamed response")
+                return ai_reply
+            except Exception as stream_error:
+                print(f"Streaming failed for {model_name}, falling back to non-streaming: {stream_error}")
+
+        response = chat.send_message(message=current_parts)
+        if not response.text:
+            raise ValueError("Empty response")
+        return response.text
+
+    try:
+        # Streams can't be raced, so chat never hedges.
+        ai_reply, _ = model_router.call(attempt, hedge=False, label="chat")
+    except AllModelsFailed as e:
+        return {"error": str(e)}, 500
+
+    return save_chat_turn(turn, ai_reply)
+
 
 @chat_bp.route('/chat/message', methods=['POST'])
 @jwt_required()
 def handle_chat():
     user_id = str(get_jwt_identity())
-    data_in = request.json or {}
+    data_in = request_payload(binary_field="image")
     response, status = process_chat_message(user_id, data_in)
     return jsonify(response), status
 
 
+def message_json(message):
+    return {
+        "id": message.id,
+        "role": message.role,
+        "content": message.content,
+        "image_url": blob_url(message.image_hash)
+    }
+
+
 @chat_bp.route('/chat/history', methods=['GET'])
 @jwt_required()
 def get_chat_history():
     user_id = get_jwt_identity()
-    sessions = ChatSession.query.filter_by(user_id=user_id).order_by(ChatSession.created_at.desc()).all()
+    sessions = ChatSession.query.options(selectinload(ChatSession.messages)).filter_by(
+        user_id=user_id
+    ).order_by(ChatSession.created_at.desc()).all()
 
     result = []
     for s in sessions:
-        msgs = [{"id": m.id, "role": m.role, "content": m.content} for m in s.messages]
+        msgs = [message_json(m) for m in s.messages]
         result.append({"id": s.id, "title": s.title, "date": s.created_at.strftime("%Y-%m-%d"), "messages": msgs})
     return jsonify(result)
 
 
-@chat_bp.post("/chat/extract-events")
+def page_limit(default: int, maximum: int = 100):
+    try:
+        limit = int(request.args.get("limit", default))
+    except ValueError:
+        limit = default
+    return max(1, min(limit, maximum))
+
+
+def encode_cursor(created_at, session_id):
+    raw = json.dumps([created_at.isoformat(), session_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    created_at, session_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    return datetime.fromisoformat(created_at), session_id
+
+
+@chat_bp.route('/chat/sessions', methods=['GET'])
 @jwt_required()
-def extract_events():
-    current_user_id = get_jwt_identity()
-    data_in = request.json
-    image_b64 = data_in.get("image")
+def list_chat_sessions():
+    user_id = get_jwt_identity()
+    limit = page_limit(20)
+
+    stats = db.session.query(
+        ChatMessage.session_id.label("session_id"),
+        func.count(ChatMessage.id).label("message_count"),
+        func.max(ChatMessage.id).label("last_message_id")
+    ).join(ChatSession, ChatSession.id == ChatMessage.session_id).filter(
+        ChatSession.user_id == user_id
+    ).group_by(ChatMessage.session_id).subquery()
+    last_message = aliased(ChatMessage)
+
+    query = db.session.query(
+        ChatSession.id,
+        ChatSession.title,
+        ChatSession.created_at,
+        func.coalesce(stats.c.message_count, 0),
+        func.substr(last_message.content, 1, 100)
+    ).outerjoin(stats, stats.c.session_id == ChatSession.id).outerjoin(
+        last_message, last_message.id == stats.c.last_message_id
+    ).filter(ChatSession.user_id == user_id)
+
+    cursor = request.args.get("cursor")
+    if cursor:
+        try:
+            cursor_created_at, cursor_id = decode_cursor(cursor)
+        except (ValueError, TypeError):
+            return jsonify({"error": "Invalid cursor"}), 400
+        query = query.filter(or_(
+            ChatSession.created_at < cursor_created_at,
+            and_(ChatSession.created_at == cursor_created_at, ChatSession.id < cursor_id)
+        ))
+
+    rows = query.order_by(ChatSession.created_at.desc(), ChatSession.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    sessions = [{
+        "id": session_id,
+        "title": title,
+        "date": created_at.strftime("%Y-%m-%d"),
+        "message_count": message_count,
+        "last_message": preview
+    } for session_id, title, created_at, message_count, preview in rows]
+
+    next_cursor = encode_cursor(rows[-1][2], rows[-1][0]) if has_more else None
+    return jsonify({"sessions": sessions, "next_cursor": next_cursor})
+
+
+@chat_bp.route('/chat/sessions/<session_id>/messages', methods=['GET'])
+@jwt_required()
+def get_session_messages(session_id):
+    user_id = get_jwt_identity()
+    chat_session = db.session.get(ChatSession, session_id)
+    if not chat_session or chat_session.user_id != int(user_id):
+        return jsonify({"error": "Not found"}), 404
+
+    limit = page_limit(50, maximum=200)
+    query = ChatMessage.query.filter(ChatMessage.session_id == session_id)
+
+    before = request.args.get("before", type=int)
+    if before:
+        query = query.filter(ChatMessage.id < before)
 
-    if not image_b64:
-        return jsonify({"error": "No image provided"}), 400
+    messages = query.order_by(ChatMessage.id.desc()).limit(limit + 1).all()
+    has_more = len(messages) > limit
+    messages = list(reversed(messages[:limit]))
+
+    return jsonify({
+        "session_id": session_id,
+        "messages": [message_json(m) for m in messages],
+        "next_before": messages[0].id if has_more else None
+    })
+
+
+def run_extract_events(current_user_id, data_in: dict):
+    try:
+        images = load_images(data_in.get("image"))
+    except ImageError as e:
+        return {"error": str(e)}, 400
 
-    if "," in image_b64:
-        image_b64 = image_b64.split(",")[1]
-    image_data = base64.b64decode(image_b64.strip())
+    if not images:
+        return {"error": "No image provided"}, 400
 
     prompt = (
         "Analyze this school-related image. Extract events and return them in a JSON format. If the image is NOT a school schedule or contains no relevant tasks, return an empty list for 'events'!!!"
@@ -217,86 +331,143 @@ def extract_events():
         "Format: {'events': [{'date': '...', 'type': '...', 'description': '...'}]}"
     )
 
-    extracted = None
-    last_error = None
-
-    models_to_try = ['gemini-flash-latest', 'gemini-2.5-flash', 'gemini-2.5-flash-lite']
-    for model_name in models_to_try:
-        try:
-            print(f"Trying extraction with model: {model_name}")
-            response = client.models.generate_content(
-                model=model_name,
-                contents=[
-                    types.Part.from_bytes(data=image_data, mime_type="image/jpeg"),
-                    prompt
-                ],
-                config=types.GenerateContentConfig(
-                    response_mime_type="application/json"
-                )
+    def attempt(model_name):
+        response = client.models.generate_content(
+            model=model_name,
+            contents=[
+                types.Part.from_bytes(data=images[0].data, mime_type=images[0].mime_type),
+                prompt
+            ],
+            config=types.GenerateContentConfig(
+                response_mime_type="application/json"
             )
+        )
 
-            raw_text = response.text.strip()
-            if raw_text.startswith("```"):
-                raw_text = raw_text.split("```")[1]
-                if raw_text.startswith("json"):
-                    raw_text = raw_text[4:]
+        raw_text = response.text.strip()
+        if raw_text.startswith("```"):
+            raw_text = raw_text.split("```")[1]
+            if raw_text.startswith("json"):
+                raw_text = raw_text[4:]
 
-            extracted = json.loads(raw_text)
-            break
+        return json.loads(raw_text)
 
-        except Exception as e:
-            print(f"Model {model_name} failed: {e}")
-            last_error = e
-            continue
+    try:
+        extracted, _ = model_router.call(attempt, label="extraction")
+    except AllModelsFailed as e:
+        return {"error": f"AI extraction failed on all models: {str(e.last_error)}"}, 500
 
     if not extracted:
-        return jsonify({"error": f"AI extraction failed on all models: {str(last_error)}"}), 500
+        return {"error": "AI extraction returned no data"}, 500
 
     try:
-        added_events = []
-        print(extracted)
-        for item in extracted.get("events", []):
-            new_event = Event(
-                user_id=current_user_id,
-                date=item['date'],
-                type=item['type'],
-                description=item['description']
-            )
-            db.session.add(new_event)
-            db.session.flush()
-
-            collection.add(
-                ids=[str(new_event.id)],
-                documents=[f"Date: {item['date']}, Type: {item['type']}, Task: {item['description']}"],
-                metadatas=[{"user_id": str(current_user_id)}]
-            )
-            added_events.append(item)
-            print("Event added")
-
+        result = insert_extracted_events(current_user_id, extracted.get("events", []))
         db.session.commit()
+        notify_indexer()
+        push_to_user(current_user_id, "events:extracted", {
+            "count": len(result["added"]),
+            "events": result["added"]
+        })
 
-        return jsonify({
+        return {
             "status": "success",
-            "message": f"Added {len(added_events)} events to your calendar",
-            "events": added_events
-        })
+            "message": f"Added {len(result['added'])} events to your calendar",
+            "events": result["added"],
+            "duplicates": result["duplicates"],
+            "skipped": result["skipped"]
+        }, 200
     except Exception as e:
         print(f"AI Extraction Error: {e}")
         db.session.rollback()
-        return jsonify({"error": "Could not process image"}), 500
+        return {"error": "Could not process image"}, 500
 
 
-@chat_bp.route('/chat/generate-test', methods=['POST'])
+@chat_bp.post("/chat/extract-events")
 @jwt_required()
-def generate_test():
-    data = request.json
+def extract_events():
+    response, status = run_extract_events(get_jwt_identity(), request_payload(binary_field="image"))
+    return jsonify(response), status
+
+
+def validate_extracted_event(item):
+    if not isinstance(item, dict):
+        return None, "Not an object"
+
+    date = str(item.get("date") or "").strip()
+    event_type = str(item.get("type") or "").strip().lower()
+    description = str(item.get("description") or "").strip()
+
+    try:
+        datetime.strptime(date, "%Y-%m-%d")
+    except ValueError:
+        return None, "Invalid date"
+    if event_type not in EVENT_TYPES:
+        return None, "Invalid event type"
+    if not description:
+        return None, "Missing description"
+
+    return {"date": date, "type": event_type, "description": description}, None
+
+
+def insert_extracted_events(user_id, items):
+    valid, skipped = [], []
+    for index, item in enumerate(items or []):
+        event, error = validate_extracted_event(item)
+        if error:
+            skipped.append({"index": index, "error": error})
+        else:
+            valid.append(event)
+
+    dates = {e["date"] for e in valid}
+    existing = set()
+    if dates:
+        existing = set(db.session.query(Event.date, Event.type, Event.description).filter(
+            Event.user_id == user_id,
+            Event.date.in_(dates)
+        ).all())
+
+    rows, duplicates = [], 0
+    for event in valid:
+        key = (event["date"], event["type"], event["description"])
+        if key in existing:
+            duplicates += 1
+            continue
+        existing.add(key)
+        rows.append({"user_id": int(user_id), "subject_id": detect_subject(event["description"], user_id), **event})
+
+    added = []
+    if rows:
+        inserted = db.session.execute(
+            insert(Event).returning(Event.id, sort_by_parameter_order=True),
+            rows
+        ).scalars().all()
+
+        indexed = []
+        for event_id, row in zip(inserted, rows):
+            indexed.append(Event(id=event_id, **row))
+            added.append({"id": event_id, "date": row["date"], "type": row["type"], "description": row["description"]})
+        enqueue_events(indexed)
+
+    print(f"Extracted events: {len(added)} added, {duplicates} duplicates, {len(skipped)} skipped")
+    return {"added": added, "duplicates": duplicates, "skipped": skipped}
+
+
+def run_generate_test(data: dict):
     subject = data.get('subject', 'General Topic')
     context = data.get('context', '')
-    questionsCount = data.get('questionsCount', 5)
-    images = data.get('images', [])
+
+    try:
+        questionsCount = int(data.get('questionsCount', 5))
+        images = load_images(data.get('images', []))
+    except ImageError as e:
+        return {"error": str(e)}, 400, None
+    except (TypeError, ValueError):
+        return {"error": "questionsCount must be a number"}, 400, None
+
+    if not 1 <= questionsCount <= 50:
+        return {"error": "questionsCount must be between 1 and 50"}, 400, None
 
     if not context and not images:
-        return jsonify({"error": "No study material provided"}), 400
+        return {"error": "No study material provided"}, 400, None
 
     prompt = f"""
     You are an expert teacher. Create a multiple-choice quiz based ONLY on the following study material.
@@ -327,34 +498,55 @@ def generate_test():
     """
 
     contents = [types.Part.from_text(text=prompt)]
+    contents.extend(types.Part.from_bytes(data=image.data, mime_type=image.mime_type) for image in images)
+    digests = [image.digest for image in images]
 
-    for img_base64 in images:
-        image_b64 = ''
-        if "," in img_base64:
-            image_b64 = img_base64.split(",")[1]
-        else:
-            image_b64 = img_base64
-
-        image_data = base64.b64decode(image_b64.strip())
-        contents.append(
-            types.Part.from_bytes(data=image_data, mime_type='image/jpeg')
-        )
+    cache_template = f"generate_test:v1:{questionsCount}"
+    cached, cache_status = response_cache.get(
+        cache_template, subject, context, digests,
+        semantic=QUIZ_CACHE_SIMILARITY > 0, threshold=QUIZ_CACHE_SIMILARITY
+    )
+    if cached is not None:
+        return cached, 200, cache_status
 
-    try:
+    def attempt(model_name):
         response = client.models.generate_content(
-            model="gemini-flash-latest",
+            model=model_name,
             contents=contents
         )
 
-        raw_text = response.text
-        json_match = re.search(r'\{.*\}', raw_text, re.DOTALL)
+        json_match = re.search(r'\{.*\}', response.text or "", re.DOTALL)
+        if not json_match:
+            raise ValueError("AI returned invalid format")
+        return json.loads(json_match.group())
 
-        if json_match:
-            quiz_data = json.loads(json_match.group())
-            return jsonify(quiz_data)
-        else:
-            return jsonify({"error": "AI returned invalid format"}), 500
+    # Several pages or a long text are mined in parallel and merged, instead
+    # of one large call that fails as a whole. "mode" overrides the choice.
+    mode = data.get('mode') or ("map_reduce" if needs_map_reduce(context, images) else "single")
 
-    except Exception as e:
+    try:
+        timings = None
+        if mode == "map_reduce":
+            quiz_data, timings = build_quiz_map_reduce(subject, context, images, questionsCount)
+        else:
+            quiz_data, _ = model_router.call(attempt, label="test generation")
+        response_cache.put(
+            cache_template, subject, context, digests, quiz_data,
+            prompt_text=prompt, semantic=QUIZ_CACHE_SIMILARITY > 0
+        )
+        return ({**quiz_data, "timings": timings} if timings else quiz_data), 200, "miss"
+    except AllModelsFailed as e:
         print(f"Error generating test: {e}")
-        return jsonify({"error": "Failed to connect to AI"}), 500
+        if isinstance(e.last_error, ValueError):
+            return {"error": "AI returned invalid format"}, 500, None
+        return {"error": "Failed to connect to AI"}, 500, None
+
+
+@chat_bp.route('/chat/generate-test', methods=['POST'])
+@jwt_required()
+def generate_test():
+    body, status, cache_status = run_generate_test(request_payload())
+    response = jsonify(body)
+    if cache_status:
+        response.headers["X-Cache"] = cache_status.upper()
+    return response, status
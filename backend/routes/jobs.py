@@ -0,0 +1,68 @@
+from flask import Blueprint, request, jsonify, url_for
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from extensions import db
+from models import Job
+from image_pipeline import ImageError, request_payload
+from jobs import JOB_KINDS, QueueFull, enqueue_job, notify_workers, cancel_queued_job, job_json, queue_position
+
+jobs_bp = Blueprint('jobs', __name__)
+
+
+@jobs_bp.route('/jobs/<kind>', methods=['POST'])
+@jwt_required()
+def create_job(kind):
+    if kind not in JOB_KINDS:
+        return jsonify({"error": f"Unknown job kind. Use one of: {', '.join(JOB_KINDS)}"}), 404
+
+    data = request_payload(binary_field=JOB_KINDS[kind]["images"])
+    try:
+        job = enqueue_job(get_jwt_identity(), kind, data)
+        db.session.commit()
+    except ImageError as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 400
+    except QueueFull as e:
+        db.session.rollback()
+        return jsonify({"error": str(e)}), 429
+
+    notify_workers()
+    status_url = url_for("jobs.get_job", job_id=job.id)
+    response = jsonify({**job_json(job), "position": queue_position(job), "status_url": status_url})
+    response.headers["Location"] = status_url
+    return response, 202
+
+
+@jobs_bp.route('/jobs/<int:job_id>', methods=['GET'])
+@jwt_required()
+def get_job(job_id):
+    job = db.session.get(Job, job_id)
+    if not job or job.user_id != int(get_jwt_identity()):
+        return jsonify({"error": "Not found"}), 404
+
+    return jsonify({**job_json(job, with_result=True), "position": queue_position(job)})
+
+
+@jobs_bp.route('/jobs/<int:job_id>', methods=['DELETE'])
+@jwt_required()
+def cancel_job(job_id):
+    job = db.session.get(Job, job_id)
+    if not job or job.user_id != int(get_jwt_identity()):
+        return jsonify({"error": "Not found"}), 404
+
+    if not cancel_queued_job(job_id):
+        db.session.refresh(job)
+        return jsonify({**job_json(job), "error": "Job is no longer queued"}), 409
+
+    db.session.refresh(job)
+    return jsonify(job_json(job))
+
+
+@jobs_bp.route('/jobs', methods=['GET'])
+@jwt_required()
+def list_jobs():
+    query = Job.query.filter_by(user_id=int(get_jwt_identity()))
+    status = request.args.get("status")
+    if status:
+        query = query.filter(Job.status == status)
+    jobs = query.order_by(Job.id.desc()).limit(min(max(request.args.get("limit", 20, type=int), 1), 100)).all()
+    return jsonify({"jobs": [job_json(job) for job in jobs]})
@@ -1,19 +1,27 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from google.genai import types
-from extensions import db, client
-from models import Score, SchoolworkAnalysis
-import base64
+from extensions import db, client, response_cache
+from models import SchoolworkAnalysis
+from score_analytics import find_aggregate, score_summary_text
+from subjects import resolve_subject
+from model_router import model_router
+from image_pipeline import load_images, request_payload
 
 schoolwork_bp = Blueprint('schoolwork', __name__)
 
 
-@schoolwork_bp.route('/chat/analyze-schoolwork', methods=['POST'])
-@jwt_required()
-def analyze_schoolwork():
-    user_id = get_jwt_identity()
-    data = request.json
+def utf16_len(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+def utf16_tail(text: str, offset: int) -> str:
+    # Stream offsets count UTF-16 code units, the unit JavaScript strings are indexed
+    # in, so clients can slice with them directly even when the text has emoji.
+    return text.encode("utf-16-le")[offset * 2:].decode("utf-16-le", errors="ignore")
 
+
+def prepare_analysis(user_id, data: dict):
     work_type = data.get('type')
     subject = data.get('subject')
 
@@ -21,24 +29,12 @@ def analyze_schoolwork():
     mistakes = data.get('mistakes')
     notes = data.get('notes')
     topic = data.get('topic')
-    images = data.get('images', [])
+    images = load_images(data.get('images', []), skip_invalid=True)
 
     if not work_type or not subject:
-        return jsonify({"error": "Missing type or subject"}), 400
-
-    subject_term = subject.lower().strip()
-    all_scores = Score.query.filter_by(user_id=user_id).all()
-
-    relevant_scores = []
-    for s in all_scores:
-        db_subj = s.subject.lower()
-        if subject_term in db_subj or db_subj in subject_term:
-            relevant_scores.append(s)
+        return None, ({"error": "Missing type or subject"}, 400)
 
-    relevant_scores.sort(key=lambda x: x.timestamp, reverse=True)
-    relevant_scores = relevant_scores[:5]
-
-    score_summary = "\n".join([f"- {s.subject}: {s.score_value}/{s.total}" for s in relevant_scores])
+    score_summary = score_summary_text(find_aggregate(int(user_id), subject))
 
     prompt = f"""
     You are an expert academic tutor. Analyze the following schoolwork and provide insights, resources, and advice.
@@ -90,47 +86,77 @@ def analyze_schoolwork():
     prompt += "4. If you suggest resources, provide REAL valid URLs or specific search queries formatted as `[Search for Topic](https://www.google.com/search?q=Topic)` if a direct link is unavailable.\n"
 
     contents = [types.Part.from_text(text=prompt)]
-
-    for img_base64 in images:
-        if not img_base64:
-            continue
-        image_b64 = ''
-        if "," in img_base64:
-            image_b64 = img_base64.split(",")[1]
-        else:
-            image_b64 = img_base64
-
-        try:
-            image_data = base64.b64decode(image_b64.strip())
-            contents.append(
-                types.Part.from_bytes(data=image_data, mime_type='image/jpeg')
-            )
-        except Exception as e:
-            print(f"Image decode error: {e}")
-
-    try:
+    contents.extend(types.Part.from_bytes(data=image.data, mime_type=image.mime_type) for image in images)
+    digests = [image.digest for image in images]
+
+    # Past scores are part of the prompt, so they are part of the key as well. The
+    # analysis is personal: entries are scoped to the user and only reused on an exact match.
+    cache_material = "\n".join(str(v or "") for v in (grade, mistakes, notes, topic, score_summary))
+    return {
+        "user_id": user_id,
+        "type": work_type,
+        "subject": subject,
+        "topic": topic or "",
+        "prompt": prompt,
+        "contents": contents,
+        "cache_key": (f"analyze_schoolwork:v2:{work_type}:{user_id}", subject, cache_material, digests)
+    }, None
+
+
+def create_analysis(job: dict, content: str, status: str = "complete"):
+    subject_row = resolve_subject(job["subject"], job["user_id"])
+    analysis = SchoolworkAnalysis(
+        user_id=job["user_id"],
+        type=job["type"],
+        subject=job["subject"],
+        subject_id=subject_row.id if subject_row else None,
+        topic=job["topic"],
+        content=content,
+        status=status
+    )
+    db.session.add(analysis)
+    db.session.commit()
+    return analysis.id
+
+
+def run_analysis(user_id, data: dict):
+    job, error = prepare_analysis(user_id, data)
+    if error:
+        return error[0], error[1], None
+
+    ai_text, cache_status = response_cache.get(*job["cache_key"], semantic=False)
+
+    def attempt(model_name):
         response = client.models.generate_content(
-            model="gemini-flash-latest",
-            contents=contents
-        )
-        ai_text = response.text
-
-        new_analysis = SchoolworkAnalysis(
-            user_id=user_id,
-            type=work_type,
-            subject=subject,
-            topic=topic or "",
-            content=ai_text
+            model=model_name,
+            contents=job["contents"]
         )
-        db.session.add(new_analysis)
-        db.session.commit()
+        if not response.text:
+            raise ValueError("Empty response")
+        return response.text
+
+    try:
+        if ai_text is None:
+            ai_text, _ = model_router.call(attempt, label="schoolwork analysis")
+            response_cache.put(*job["cache_key"], ai_text, prompt_text=job["prompt"], semantic=False)
 
-        return jsonify({"analysis": ai_text, "id": new_analysis.id})
+        analysis_id = create_analysis(job, ai_text)
+        return {"analysis": ai_text, "id": analysis_id}, 200, cache_status
 
     except Exception as e:
         print(f"Error analyzing schoolwork: {e}")
         db.session.rollback()
-        return jsonify({"error": "Failed to connect to AI"}), 500
+        return {"error": "Failed to connect to AI"}, 500, None
+
+
+@schoolwork_bp.route('/chat/analyze-schoolwork', methods=['POST'])
+@jwt_required()
+def analyze_schoolwork():
+    body, status, cache_status = run_analysis(get_jwt_identity(), request_payload())
+    response = jsonify(body)
+    if cache_status:
+        response.headers["X-Cache"] = cache_status.upper()
+    return response, status
 
 
 @schoolwork_bp.route('/schoolwork/recents', methods=['GET'])
@@ -149,7 +175,8 @@ def get_recent_schoolwork():
             "subject": r.subject,
             "topic": r.topic,
             "date": r.created_at.strftime("%Y-%m-%d"),
-            "preview": r.content[:100] + "..."
+            "preview": r.content[:100] + "...",
+            "status": r.status or "complete"
         })
     return jsonify(result)
 
@@ -162,11 +189,16 @@ def get_schoolwork_detail(id):
     if not item or item.user_id != int(user_id):
         return jsonify({"error": "Not found"}), 404
 
+    # ?offset= (UTF-16 code units) returns only what a reconnecting client hasn't seen yet.
+    offset = max(request.args.get("offset", 0, type=int), 0)
     return jsonify({
         "id": item.id,
         "type": item.type,
         "subject": item.subject,
         "topic": item.topic,
-        "content": item.content,
+        "content": utf16_tail(item.content, offset),
+        "offset": offset,
+        "length": utf16_len(item.content),
+        "status": item.status or "complete",
         "date": item.created_at.strftime("%Y-%m-%d")
     })
@@ -1,47 +1,203 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from sqlalchemy import func, cast, Float
+from sqlalchemy import func, insert
+from datetime import datetime, timedelta, timezone
 from extensions import db
-from models import Score
+from models import Score, ScoreAggregate
+from score_analytics import ensure_aggregates, record_scores, user_stats, window_stats
+from subjects import normalize_subject, search_subjects
+import csv
+import io
+import os
 
 scores_bp = Blueprint('scores', __name__)
 
+BULK_MAX_ROWS = int(os.environ.get("SCORES_BULK_MAX_ROWS", "1000"))
+
+
+def parse_score_date(value):
+    if value in (None, ""):
+        return None
+    parsed = datetime.fromisoformat(str(value).strip().replace("Z", "+00:00"))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    if parsed > datetime.now(timezone.utc).replace(tzinfo=None) + timedelta(days=1):
+        raise ValueError("Date is in the future")
+    return parsed
+
+
+def validate_score_row(item):
+    if not isinstance(item, dict):
+        return None, "Not an object"
+
+    subject = str(item.get("subject") or "").strip()
+    # Punctuation-only names ("---", "%") normalize to nothing and can't be matched to a subject.
+    if not normalize_subject(subject):
+        return None, "Missing subject"
+    if len(subject) > 100:
+        return None, "Subject is too long"
+
+    try:
+        score_value = int(str(item.get("score")).strip())
+        total = int(str(item.get("total")).strip())
+    except (TypeError, ValueError):
+        return None, "Score and total must be whole numbers"
+    if total <= 0:
+        return None, "Total must be greater than zero"
+    if not 0 <= score_value <= total:
+        return None, "Score must be between 0 and total"
+
+    try:
+        timestamp = parse_score_date(item.get("date"))
+    except ValueError:
+        return None, "Invalid date"
+
+    row = {"subject": subject, "score_value": score_value, "total": total}
+    if timestamp is not None:
+        row["timestamp"] = timestamp
+    return row, None
+
 
 @scores_bp.route('/save-score', methods=['POST'])
 @jwt_required()
 def save_score():
     user_id = get_jwt_identity()
-    data = request.json
-
-    subject = data.get('subject')
-    score_value = data.get('score')
-    total = data.get('total')
-    print(total)
-    new_entry = Score(
-        user_id=user_id,
-        subject=subject,
-        score_value=score_value,
-        total=total
-    )
+    row, error = validate_score_row(request.get_json(silent=True))
+    if error:
+        return jsonify({"error": error}), 400
 
+    new_entry = Score(user_id=user_id, **row)
+    record_scores(user_id, [new_entry])
     db.session.add(new_entry)
     db.session.commit()
     return jsonify({"message": "Score saved!", "id": new_entry.id}), 201
 
 
+def bulk_score_items():
+    # CSV arrives as a text/csv body or a multipart "file"; it is parsed as a stream.
+    upload = request.files.get("file")
+    if upload is not None or request.mimetype == "text/csv":
+        stream = upload.stream if upload is not None else request.stream
+        reader = csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
+        for item in reader:
+            yield {(k or "").strip().lower(): v for k, v in item.items()}
+        return
+
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get("scores")
+    if not isinstance(data, list):
+        raise ValueError("Expected a JSON array of scores or a CSV upload")
+    yield from data
+
+
+@scores_bp.route('/scores/bulk', methods=['POST'])
+@jwt_required()
+def save_scores_bulk():
+    user_id = int(get_jwt_identity())
+    atomic = request.args.get("atomic") == "1"
+
+    results, rows = [], []
+    try:
+        for index, item in enumerate(bulk_score_items()):
+            if index >= BULK_MAX_ROWS:
+                return jsonify({"error": f"At most {BULK_MAX_ROWS} rows per request"}), 413
+            row, error = validate_score_row(item)
+            if error:
+                results.append({"index": index, "status": "error", "error": error})
+            else:
+                results.append({"index": index, "status": "ok"})
+                rows.append(row)
+    except (ValueError, csv.Error, UnicodeDecodeError) as e:
+        return jsonify({"error": f"Could not read scores: {e}"}), 400
+
+    failed = len(results) - len(rows)
+    if not rows or (atomic and failed):
+        return jsonify({"inserted": 0, "failed": failed, "results": results}), 400
+
+    now = datetime.now(timezone.utc)
+    scores = [Score(user_id=user_id, **{"timestamp": now, **row}) for row in rows]
+
+    try:
+        # Aggregates first: it resolves subject ids, then every row goes out in one INSERT.
+        record_scores(user_id, scores)
+        inserted = db.session.execute(
+            insert(Score).returning(Score.id, sort_by_parameter_order=True),
+            [{
+                "user_id": user_id,
+                "subject": s.subject,
+                "subject_id": s.subject_id,
+                "score_value": s.score_value,
+                "total": s.total,
+                "timestamp": s.timestamp
+            } for s in scores]
+        ).scalars().all()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Bulk score import failed: {e}")
+        return jsonify({"error": "Could not save scores"}), 500
+
+    ids = iter(inserted)
+    for result in results:
+        if result["status"] == "ok":
+            result["id"] = next(ids)
+
+    return jsonify({"inserted": len(inserted), "failed": failed, "results": results}), 201
+
+
 @scores_bp.route('/recent-scores', methods=['GET'])
 @jwt_required()
 def get_user_stats():
-    user_id = get_jwt_identity()
+    user_id = int(get_jwt_identity())
+    ensure_aggregates(user_id)
 
-    stats = db.session.query(
-        func.count(Score.id).label('total_tests'),
-        func.avg(cast(Score.score_value, Float) / Score.total).label('avg_score')
-    ).filter(Score.user_id == user_id).first()
+    # Read from the per-subject aggregates instead of scanning every score.
+    total_tests, sum_pct = db.session.query(
+        func.coalesce(func.sum(ScoreAggregate.count), 0),
+        func.coalesce(func.sum(ScoreAggregate.sum_pct), 0)
+    ).filter(ScoreAggregate.user_id == user_id).one()
 
-    avg_perc = round((stats.avg_score or 0) * 100, 1)
+    avg_perc = round(sum_pct / total_tests, 1) if total_tests else 0
 
     return jsonify({
-        "total_tests": stats.total_tests or 0,
+        "total_tests": total_tests,
         "avg_percentage": avg_perc
     })
+
+
+@scores_bp.route('/scores/stats', methods=['GET'])
+@jwt_required()
+def get_score_stats():
+    user_id = int(get_jwt_identity())
+    subject = request.args.get('subject')
+    date_from = request.args.get('from')
+    date_to = request.args.get('to')
+
+    try:
+        for value in (date_from, date_to):
+            if value:
+                datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        return jsonify({"error": "Invalid date filter"}), 400
+
+    if date_from or date_to:
+        subjects = window_stats(user_id, subject, date_from, date_to)
+    else:
+        ensure_aggregates(user_id)
+        subjects = user_stats(user_id, subject)
+
+    count = sum(s["count"] for s in subjects)
+    weighted = sum(s["average"] * s["count"] for s in subjects if s["average"] is not None)
+    return jsonify({
+        "subjects": subjects,
+        "overall": {"count": count, "average": round(weighted / count, 1) if count else None},
+        "window": {"from": date_from, "to": date_to}
+    })
+
+
+@scores_bp.route('/subjects', methods=['GET'])
+@jwt_required()
+def list_subjects():
+    subjects = search_subjects(request.args.get('q', ''), get_jwt_identity(), limit=min(request.args.get('limit', 10, type=int), 50))
+    return jsonify([{"id": s.id, "key": s.key, "name": s.name} for s in subjects])
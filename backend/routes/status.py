@@ -0,0 +1,67 @@
+from flask import Blueprint, jsonify, request
+from flask_jwt_extended import verify_jwt_in_request
+from extensions import db, embedding_cache, embedding_service, response_cache, readiness
+from db_pool import pool_status
+from stream_writer import stream_metrics
+from model_router import model_router
+from image_pipeline import image_stats
+from jobs import queue_stats
+import hmac
+import os
+
+status_bp = Blueprint('status', __name__)
+
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+
+@status_bp.before_request
+def require_metrics_auth():
+    # /ready stays open for load balancer health checks; scrapers can use METRICS_TOKEN.
+    if not request.path.startswith("/metrics/"):
+        return None
+    if METRICS_TOKEN and hmac.compare_digest(
+        request.headers.get("Authorization", "").encode(), f"Bearer {METRICS_TOKEN}".encode()
+    ):
+        return None
+    verify_jwt_in_request()
+
+
+@status_bp.route('/metrics/embeddings', methods=['GET'])
+def embedding_metrics():
+    return jsonify({"cache": embedding_cache.stats(), "batching": embedding_service.stats()})
+
+
+@status_bp.route('/ready', methods=['GET'])
+def ready():
+    status = readiness()
+    return jsonify(status), 200 if status["ready"] else 503
+
+
+@status_bp.route('/metrics/db-pool', methods=['GET'])
+def db_pool_metrics():
+    return jsonify(pool_status(db.engine))
+
+
+@status_bp.route('/metrics/streams', methods=['GET'])
+def stream_stats():
+    return jsonify(stream_metrics)
+
+
+@status_bp.route('/metrics/models', methods=['GET'])
+def model_metrics():
+    return jsonify(model_router.stats())
+
+
+@status_bp.route('/metrics/response-cache', methods=['GET'])
+def response_cache_metrics():
+    return jsonify(response_cache.stats())
+
+
+@status_bp.route('/metrics/images', methods=['GET'])
+def image_metrics():
+    return jsonify(image_stats())
+
+
+@status_bp.route('/metrics/jobs', methods=['GET'])
+def job_metrics():
+    return jsonify(queue_stats())
@@ -0,0 +1,208 @@
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from models import Score, ScoreAggregate
+from subjects import resolve_subject, lookup_subject
+import json
+import os
+
+RECENT_WINDOW = int(os.environ.get("SCORE_RECENT_WINDOW", "10"))
+
+
+def percentage(score_value, total):
+    if not total or total <= 0:
+        return None
+    return 100.0 * score_value / total
+
+
+def naive_utc(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def trend_slope(values):
+    # Least-squares slope in percentage points per test, oldest first.
+    n = len(values)
+    if n < 2:
+        return None
+    mean_x = (n - 1) / 2
+    mean_y = sum(values) / n
+    numerator = sum((x - mean_x) * (y - mean_y) for x, y in enumerate(values))
+    denominator = sum((x - mean_x) ** 2 for x in range(n))
+    return numerator / denominator
+
+
+def stats_json(subject, count, sum_pct, best, worst, recent):
+    recent_pcts = [percentage(score, total) for score, total, _ in recent]
+    recent_pcts = [p for p in recent_pcts if p is not None]
+    slope = trend_slope(recent_pcts)
+    return {
+        "subject": subject,
+        "count": count,
+        "average": round(sum_pct / count, 1) if count else None,
+        "best": round(best, 1) if best is not None else None,
+        "worst": round(worst, 1) if worst is not None else None,
+        "recent": [{"score": score, "total": total, "date": ts[:10]} for score, total, ts in recent],
+        "recent_average": round(sum(recent_pcts) / len(recent_pcts), 1) if recent_pcts else None,
+        "trend": round(slope, 2) if slope is not None else None
+    }
+
+
+def aggregate_json(aggregate):
+    return stats_json(
+        aggregate.subject, aggregate.count, aggregate.sum_pct,
+        aggregate.best_pct, aggregate.worst_pct, json.loads(aggregate.recent or "[]")
+    )
+
+
+def locked_aggregate(user_id, subject):
+    query = ScoreAggregate.query.filter_by(user_id=user_id, subject_key=subject.key).with_for_update()
+    aggregate = query.first()
+    if aggregate is not None:
+        return aggregate
+
+    try:
+        with db.session.begin_nested():
+            aggregate = ScoreAggregate(
+                user_id=user_id, subject_key=subject.key, subject_id=subject.id, subject=subject.name,
+                count=0, sum_pct=0.0, recent="[]"
+            )
+            db.session.add(aggregate)
+    except IntegrityError:
+        # Another request created it first; lock theirs instead.
+        aggregate = query.first()
+    return aggregate
+
+
+def apply_score(aggregate, score):
+    pct = percentage(score.score_value, score.total)
+    if pct is None:
+        return
+
+    timestamp = naive_utc(score.timestamp or datetime.now(timezone.utc))
+    aggregate.count += 1
+    aggregate.sum_pct += pct
+    aggregate.best_pct = pct if aggregate.best_pct is None else max(aggregate.best_pct, pct)
+    aggregate.worst_pct = pct if aggregate.worst_pct is None else min(aggregate.worst_pct, pct)
+
+    # Back-dated imports can land before existing entries, so keep the window in date order.
+    recent = json.loads(aggregate.recent or "[]")
+    recent.append([score.score_value, score.total, timestamp.isoformat()])
+    recent.sort(key=lambda entry: entry[2])
+    aggregate.recent = json.dumps(recent[-RECENT_WINDOW:])
+
+    last_score_at = naive_utc(aggregate.last_score_at) if aggregate.last_score_at else None
+    if last_score_at is None or timestamp >= last_score_at:
+        aggregate.subject = score.subject.strip()
+        aggregate.last_score_at = timestamp
+    aggregate.updated_at = datetime.now(timezone.utc)
+
+
+def record_scores(user_id, scores):
+    # Runs inside the caller's transaction so rows and aggregates commit together.
+    subjects, by_subject = {}, {}
+    for score in scores:
+        subject = subjects.get(score.subject)
+        if subject is None:
+            subject = subjects[score.subject] = resolve_subject(score.subject, user_id)
+        if subject is None:
+            continue
+        score.subject_id = subject.id
+        by_subject.setdefault(subject.key, (subject, []))[1].append(score)
+
+    for key in sorted(by_subject):
+        subject, entries = by_subject[key]
+        aggregate = locked_aggregate(int(user_id), subject)
+        for score in sorted(entries, key=lambda s: naive_utc(s.timestamp or datetime.now(timezone.utc))):
+            apply_score(aggregate, score)
+
+
+def find_aggregate(user_id, subject_name):
+    # Aliases and spelling variants resolve to one subject, so this is a single indexed lookup.
+    subject = lookup_subject(subject_name, user_id)
+    if subject is None:
+        return None
+    return ScoreAggregate.query.filter_by(user_id=user_id, subject_key=subject.key).first()
+
+
+def score_summary_text(aggregate, limit: int = 5):
+    if aggregate is None or not aggregate.count:
+        return ""
+
+    stats = aggregate_json(aggregate)
+    lines = [f"- {aggregate.subject}: {r['score']}/{r['total']}" for r in reversed(stats["recent"][-limit:])]
+    line = f"- Average over {stats['count']} tests: {stats['average']}% (best {stats['best']}%, worst {stats['worst']}%)"
+    if stats["trend"] is not None:
+        line += f", trend {stats['trend']:+} points per test"
+    lines.append(line)
+    return "\n".join(lines)
+
+
+def ensure_aggregates(user_id):
+    # Users with scores from before aggregates existed get theirs built on first
+    # read, so stats don't show zero until the backfill has run.
+    if ScoreAggregate.query.filter_by(user_id=user_id).first() is not None:
+        return
+    if Score.query.filter_by(user_id=user_id).first() is not None:
+        rebuild_aggregates(user_id)
+
+
+def user_stats(user_id, subject_name=None):
+    query = ScoreAggregate.query.filter_by(user_id=user_id)
+    if subject_name:
+        subject = lookup_subject(subject_name, user_id)
+        if subject is None:
+            return []
+        query = query.filter(ScoreAggregate.subject_key == subject.key)
+    return [aggregate_json(a) for a in query.order_by(ScoreAggregate.subject_key).all()]
+
+
+def window_stats(user_id, subject_name=None, date_from=None, date_to=None):
+    # Aggregates are all-time; a date window is answered from the indexed score rows.
+    query = Score.query.filter(Score.user_id == user_id, Score.subject_id.isnot(None))
+    if subject_name:
+        subject = lookup_subject(subject_name, user_id)
+        if subject is None:
+            return []
+        query = query.filter(Score.subject_id == subject.id)
+    if date_from:
+        query = query.filter(Score.timestamp >= datetime.strptime(date_from, "%Y-%m-%d"))
+    if date_to:
+        query = query.filter(Score.timestamp < datetime.strptime(date_to, "%Y-%m-%d") + timedelta(days=1))
+
+    groups = {}
+    for score in query.order_by(Score.timestamp, Score.id).all():
+        pct = percentage(score.score_value, score.total)
+        if pct is None:
+            continue
+        group = groups.setdefault(score.subject_id, {"pcts": [], "recent": []})
+        group["subject"] = score.subject.strip()
+        group["pcts"].append(pct)
+        group["recent"].append([score.score_value, score.total, score.timestamp.isoformat()])
+
+    return [
+        stats_json(g["subject"], len(g["pcts"]), sum(g["pcts"]), max(g["pcts"]), min(g["pcts"]), g["recent"][-RECENT_WINDOW:])
+        for g in sorted(groups.values(), key=lambda g: g["subject"].casefold())
+    ]
+
+
+def rebuild_aggregates(user_id=None):
+    # One user at a time, each in its own transaction, so memory is bounded by the
+    # largest single history rather than the whole score table.
+    if user_id is not None:
+        user_ids = [int(user_id)]
+    else:
+        user_ids = [uid for (uid,) in db.session.query(Score.user_id).distinct().order_by(Score.user_id).all()]
+        ScoreAggregate.query.filter(ScoreAggregate.user_id.notin_(user_ids)).delete(synchronize_session=False)
+
+    rebuilt = 0
+    for uid in user_ids:
+        ScoreAggregate.query.filter_by(user_id=uid).delete(synchronize_session=False)
+        scores = Score.query.filter_by(user_id=uid).order_by(Score.timestamp, Score.id).all()
+        record_scores(uid, scores)
+        db.session.commit()
+        db.session.expunge_all()
+        rebuilt += len(scores)
+    db.session.commit()
+    return rebuilt
@@ -0,0 +1,182 @@
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import Column, DateTime, MetaData, String, Table, create_engine, delete, insert, or_, select, update
+from migrate_db import upgrade_schema
+import socket
+import threading
+import time
+import os
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# Each worker refreshes last_seen on its rows; rows of a worker that stopped
+# refreshing them (killed, OOM) are ignored after the TTL and then deleted.
+SOCKET_REGISTRY_HEARTBEAT_SECONDS = float(os.environ.get("SOCKET_REGISTRY_HEARTBEAT_SECONDS", "30"))
+SOCKET_REGISTRY_TTL_SECONDS = float(os.environ.get("SOCKET_REGISTRY_TTL_SECONDS", "90"))
+
+# Kept outside models.py: the registry may live in its own database
+# (SOCKET_REGISTRY_URL) shared by every worker.
+registry_metadata = MetaData()
+socket_connections = Table(
+    "socket_connection",
+    registry_metadata,
+    Column("sid", String(64), primary_key=True),
+    Column("user_id", String(50), nullable=False, index=True),
+    Column("worker_id", String(100), nullable=False, index=True),
+    Column("connected_at", DateTime),
+    Column("last_seen", DateTime, index=True)
+)
+
+
+def user_room(user_id) -> str:
+    return f"user:{user_id}"
+
+
+class SocketRegistry(ABC):
+    @abstractmethod
+    def add(self, sid, user_id):
+        ...
+
+    @abstractmethod
+    def remove(self, sid):
+        ...
+
+    @abstractmethod
+    def get(self, sid, default=None):
+        ...
+
+    @abstractmethod
+    def sids_for_user(self, user_id):
+        ...
+
+    def is_online(self, user_id) -> bool:
+        return bool(self.sids_for_user(user_id))
+
+    def __contains__(self, sid):
+        return self.get(sid) is not None
+
+
+class InMemorySocketRegistry(SocketRegistry):
+    def __init__(self):
+        self._users = {}
+        self._lock = threading.Lock()
+
+    def add(self, sid, user_id):
+        with self._lock:
+            self._users[sid] = str(user_id)
+
+    def remove(self, sid):
+        with self._lock:
+            return self._users.pop(sid, None)
+
+    def get(self, sid, default=None):
+        return self._users.get(sid, default)
+
+    def sids_for_user(self, user_id):
+        with self._lock:
+            return [sid for sid, uid in self._users.items() if uid == str(user_id)]
+
+
+class SqlSocketRegistry(SocketRegistry):
+    # Sockets owned by this worker are answered from memory (sticky sessions keep a
+    # sid on one worker); the table lets every worker see who is connected where.
+    def __init__(
+        self,
+        url: str,
+        worker_id: str = WORKER_ID,
+        heartbeat: float = SOCKET_REGISTRY_HEARTBEAT_SECONDS,
+        ttl: float = SOCKET_REGISTRY_TTL_SECONDS
+    ):
+        self.table = socket_connections
+        self.worker_id = worker_id
+        self.ttl = ttl
+        self.engine = create_engine(url, pool_pre_ping=True)
+        registry_metadata.create_all(self.engine)
+        upgrade_schema(self.engine, registry_metadata)
+        self._local = InMemorySocketRegistry()
+
+        with self.engine.begin() as conn:
+            conn.execute(delete(self.table).where(self.table.c.worker_id == self.worker_id))
+
+        if heartbeat > 0:
+            threading.Thread(target=self._heartbeat_loop, args=(heartbeat,), name="socket-registry-heartbeat", daemon=True).start()
+
+    def _alive_since(self):
+        return datetime.now(timezone.utc) - timedelta(seconds=self.ttl)
+
+    def heartbeat(self):
+        with self.engine.begin() as conn:
+            conn.execute(update(self.table).where(self.table.c.worker_id == self.worker_id).values(
+                last_seen=datetime.now(timezone.utc)
+            ))
+            expired = conn.execute(delete(self.table).where(
+                or_(self.table.c.last_seen < self._alive_since(), self.table.c.last_seen.is_(None))
+            ))
+        if expired.rowcount:
+            print(f"Socket registry: removed {expired.rowcount} connections of workers that stopped responding")
+
+    def _heartbeat_loop(self, interval: float):
+        while True:
+            time.sleep(interval)
+            try:
+                self.heartbeat()
+            except Exception as e:
+                print(f"Socket registry heartbeat failed: {e}")
+
+    def add(self, sid, user_id):
+        self._local.add(sid, user_id)
+        now = datetime.now(timezone.utc)
+        with self.engine.begin() as conn:
+            conn.execute(delete(self.table).where(self.table.c.sid == sid))
+            conn.execute(insert(self.table).values(
+                sid=sid,
+                user_id=str(user_id),
+                worker_id=self.worker_id,
+                connected_at=now,
+                last_seen=now
+            ))
+
+    def remove(self, sid):
+        user_id = self._local.remove(sid)
+        with self.engine.begin() as conn:
+            conn.execute(delete(self.table).where(self.table.c.sid == sid))
+        return user_id
+
+    def get(self, sid, default=None):
+        user_id = self._local.get(sid)
+        if user_id is not None:
+            return user_id
+        with self.engine.connect() as conn:
+            user_id = conn.execute(select(self.table.c.user_id).where(
+                self.table.c.sid == sid, self.table.c.last_seen >= self._alive_since()
+            )).scalar()
+        return user_id if user_id is not None else default
+
+    def __contains__(self, sid):
+        return self._local.get(sid) is not None
+
+    def sids_for_user(self, user_id):
+        with self.engine.connect() as conn:
+            return list(conn.execute(
+                select(self.table.c.sid).where(
+                    self.table.c.user_id == str(user_id), self.table.c.last_seen >= self._alive_since()
+                )
+            ).scalars())
+
+    def workers_for_user(self, user_id):
+        with self.engine.connect() as conn:
+            return list(conn.execute(
+                select(self.table.c.worker_id).where(
+                    self.table.c.user_id == str(user_id), self.table.c.last_seen >= self._alive_since()
+                ).distinct()
+            ).scalars())
+
+
+def build_socket_registry():
+    backend = os.environ.get("SOCKET_REGISTRY", "memory")
+    if backend == "memory":
+        return InMemorySocketRegistry()
+    if backend == "sql":
+        url = os.environ.get("SOCKET_REGISTRY_URL") or os.environ.get("DATABASE_URL")
+        return SqlSocketRegistry(url)
+    raise ValueError(f"Unknown SOCKET_REGISTRY backend: {backend}")
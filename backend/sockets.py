@@ -1,8 +1,11 @@
-from flask import request
+from flask import request, current_app
 from flask_jwt_extended import decode_token
-from flask_socketio import emit, disconnect
-from extensions import socketio, active_socket_users
-from routes.chat import process_chat_message
+from flask_socketio import emit, disconnect, join_room
+from extensions import socketio, socket_registry
+from socket_registry import user_room
+from async_chat import chat_loop, process_chat_message_async
+from stream_writer import SocketStreamWriter, release_sid
+from analysis_stream import stream_analysis, resume_analysis
 
 
 @socketio.on("connect")
@@ -24,7 +27,8 @@ def socket_connect(auth):
         if not user_id:
             return False
 
-        active_socket_users[request.sid] = user_id
+        socket_registry.add(request.sid, user_id)
+        join_room(user_room(user_id))
         print(f"Socket connected sid={request.sid} user={user_id}")
         emit("chat:connected", {"status": "ok"})
     except Exception as e:
@@ -34,12 +38,13 @@ def socket_connect(auth):
 
 @socketio.on("disconnect")
 def socket_disconnect():
-    active_socket_users.pop(request.sid, None)
+    socket_registry.remove(request.sid)
+    release_sid(request.sid)
 
 
 @socketio.on("chat:send")
 def socket_chat_send(payload):
-    user_id = active_socket_users.get(request.sid)
+    user_id = socket_registry.get(request.sid)
     if not user_id:
         emit("chat:error", {"error": "Unauthorized"})
         disconnect()
@@ -51,15 +56,52 @@ def socket_chat_send(payload):
     if session_id:
         emit("chat:stream:start", {"session_id": str(session_id)})
 
-    def stream_to_client(chunk_text):
-        emit("chat:stream:chunk", {
-            "session_id": str(session_id) if session_id else None,
-            "chunk": chunk_text
-        })
+    # The handler thread returns right away; the turn runs on the shared chat loop.
+    chat_loop.submit(stream_chat_turn(current_app._get_current_object(), request.sid, user_id, data_in))
 
-    response, status = process_chat_message(user_id, data_in, stream_callback=stream_to_client)
+
+async def stream_chat_turn(app, sid, user_id, data_in):
+    writer = SocketStreamWriter(sid, data_in.get("session_id"), use_acks=bool(data_in.get("ack")))
+
+    try:
+        response, status = await process_chat_message_async(app, user_id, data_in, stream_callback=writer.write)
+        await writer.close()
+    except Exception as e:
+        print(f"Chat stream failed for sid={sid}: {e}")
+        response, status = {"error": "Chat failed"}, 500
+
+    if status == 499:
+        return
     if status >= 400:
-        emit("chat:error", response)
+        socketio.emit("chat:error", response, to=sid)
         return
 
-    emit("chat:stream:end", response)
+    socketio.emit("chat:stream:end", response, to=sid)
+
+
+@socketio.on("schoolwork:analyze")
+def socket_schoolwork_analyze(payload):
+    user_id = socket_registry.get(request.sid)
+    if not user_id:
+        emit("schoolwork:analysis:error", {"error": "Unauthorized"})
+        disconnect()
+        return
+
+    chat_loop.submit(stream_analysis(current_app._get_current_object(), request.sid, user_id, payload or {}))
+
+
+@socketio.on("schoolwork:analysis:resume")
+def socket_schoolwork_resume(payload):
+    user_id = socket_registry.get(request.sid)
+    if not user_id:
+        return {"error": "Unauthorized"}
+
+    data_in = payload or {}
+    try:
+        analysis_id = int(data_in.get("id"))
+        offset = int(data_in.get("offset") or 0)
+    except (TypeError, ValueError):
+        return {"error": "Missing id"}
+
+    # The return value is the ack: everything past the client's offset, then live frames follow.
+    return resume_analysis(current_app._get_current_object(), request.sid, user_id, analysis_id, offset)
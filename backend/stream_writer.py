@@ -0,0 +1,126 @@
+from extensions import socketio, socket_registry
+import asyncio
+import threading
+import time
+import os
+
+FLUSH_BYTES = int(os.environ.get("STREAM_FLUSH_BYTES", "256"))
+FLUSH_INTERVAL = float(os.environ.get("STREAM_FLUSH_INTERVAL_MS", "80")) / 1000
+MAX_OUTSTANDING_BYTES = int(os.environ.get("STREAM_MAX_OUTSTANDING_BYTES", "65536"))
+ACK_TIMEOUT = float(os.environ.get("STREAM_ACK_TIMEOUT", "15"))
+
+_outstanding = {}
+_outstanding_lock = threading.Lock()
+
+stream_metrics = {
+    "streams": 0,
+    "cancelled": 0,
+    "chunks_in": 0,
+    "frames_out": 0,
+    "bytes_out": 0,
+    "backpressure_waits": 0
+}
+
+
+class StreamCancelled(Exception):
+    pass
+
+
+def outstanding_bytes(sid):
+    with _outstanding_lock:
+        return _outstanding.get(sid, 0)
+
+
+def _adjust_outstanding(sid, delta):
+    with _outstanding_lock:
+        value = _outstanding.get(sid, 0) + delta
+        if value > 0:
+            _outstanding[sid] = value
+        else:
+            _outstanding.pop(sid, None)
+
+
+def release_sid(sid):
+    with _outstanding_lock:
+        _outstanding.pop(sid, None)
+
+
+class SocketStreamWriter:
+    def __init__(self, sid, session_id, use_acks: bool = False,
+                 flush_bytes: int = FLUSH_BYTES, flush_interval: float = FLUSH_INTERVAL,
+                 max_outstanding: int = MAX_OUTSTANDING_BYTES):
+        self.sid = sid
+        self.session_id = str(session_id) if session_id else None
+        self.use_acks = use_acks
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.max_outstanding = max_outstanding
+
+        self._buffer = []
+        self._buffered = 0
+        self._last_flush = time.monotonic()
+        self.chunks_in = 0
+        self.frames_out = 0
+        stream_metrics["streams"] += 1
+
+    def _check_connected(self):
+        if self.sid not in socket_registry:
+            stream_metrics["cancelled"] += 1
+            raise StreamCancelled(f"Client {self.sid} disconnected")
+
+    async def write(self, chunk_text: str):
+        self._check_connected()
+        self._buffer.append(chunk_text)
+        self._buffered += len(chunk_text.encode("utf-8"))
+        self.chunks_in += 1
+        stream_metrics["chunks_in"] += 1
+
+        if self._buffered >= self.flush_bytes or time.monotonic() - self._last_flush >= self.flush_interval:
+            await self.flush()
+
+    async def _wait_for_capacity(self):
+        # Without acks there is nothing to wait on; coalescing alone bounds the frames.
+        if not self.use_acks:
+            return
+
+        waited_since = None
+        while outstanding_bytes(self.sid) > self.max_outstanding:
+            self._check_connected()
+            if waited_since is None:
+                waited_since = time.monotonic()
+                stream_metrics["backpressure_waits"] += 1
+            elif time.monotonic() - waited_since > ACK_TIMEOUT:
+                stream_metrics["cancelled"] += 1
+                raise StreamCancelled(f"Client {self.sid} stopped acknowledging chunks")
+            await asyncio.sleep(0.02)
+
+    async def flush(self):
+        if not self._buffer:
+            return
+
+        await self._wait_for_capacity()
+
+        text = "".join(self._buffer)
+        size = self._buffered
+        self._buffer = []
+        self._buffered = 0
+        self._last_flush = time.monotonic()
+
+        callback = None
+        if self.use_acks:
+            _adjust_outstanding(self.sid, size)
+            callback = lambda *args: _adjust_outstanding(self.sid, -size)
+
+        socketio.emit("chat:stream:chunk", {
+            "session_id": self.session_id,
+            "chunk": text
+        }, to=self.sid, callback=callback)
+
+        self.frames_out += 1
+        stream_metrics["frames_out"] += 1
+        stream_metrics["bytes_out"] += size
+
+    async def close(self):
+        if self.sid in socket_registry:
+            await self.flush()
+        print(f"Stream to {self.sid}: {self.chunks_in} chunks in, {self.frames_out} frames out")
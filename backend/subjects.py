@@ -0,0 +1,184 @@
+from sqlalchemy import func, text, or_
+from sqlalchemy.exc import IntegrityError
+from extensions import db
+from models import Subject, SubjectAlias
+import difflib
+import re
+
+FUZZY_CUTOFF = 0.8
+TRIGRAM_THRESHOLD = 0.45
+# Free text is full of short words that collide with short aliases ("finish it"
+# is not IT), so detection only trusts single words of at least this length.
+DETECT_MIN_WORD_LENGTH = 3
+
+# Canonical key -> (display name, aliases). Aliases are matched after normalize_subject().
+SEED_SUBJECTS = {
+    "math": ("Math", ["maths", "mathematics", "математика", "мат", "матем"]),
+    "bulgarian": ("Bulgarian", ["bulgarian language", "български", "български език", "бел",
+                                "български език и литература"]),
+    "literature": ("Literature", ["литература"]),
+    "english": ("English", ["english language", "английски", "английски език", "ае"]),
+    "german": ("German", ["немски", "немски език"]),
+    "french": ("French", ["френски", "френски език"]),
+    "russian": ("Russian", ["руски", "руски език"]),
+    "spanish": ("Spanish", ["испански", "испански език"]),
+    "physics": ("Physics", ["физика", "физика и астрономия"]),
+    "chemistry": ("Chemistry", ["химия", "химия и опазване на околната среда"]),
+    "biology": ("Biology", ["биология", "биология и здравно образование"]),
+    "history": ("History", ["история", "история и цивилизации"]),
+    "geography": ("Geography", ["география", "география и икономика"]),
+    "informatics": ("Informatics", ["computer science", "информатика"]),
+    "it": ("IT", ["information technology", "информационни технологии", "ит"]),
+    "philosophy": ("Philosophy", ["философия"]),
+    "music": ("Music", ["музика"]),
+    "art": ("Art", ["fine arts", "изобразително изкуство", "изо"]),
+    "pe": ("Physical Education", ["physical education", "sport", "sports", "физическо възпитание",
+                                  "физическо възпитание и спорт", "физкултура", "фвс"]),
+}
+
+
+def normalize_subject(subject) -> str:
+    value = str(subject or "").casefold()
+    value = re.sub(r"[\s.,;:_%/\\\-]+", " ", value)
+    return value.strip()
+
+
+def seed_subjects():
+    existing = {alias for (alias,) in db.session.query(SubjectAlias.alias_key).all()}
+    added = 0
+    for key, (name, aliases) in SEED_SUBJECTS.items():
+        subject = Subject.query.filter_by(key=key).first()
+        if subject is None:
+            subject = Subject(key=key, name=name)
+            db.session.add(subject)
+            db.session.flush()
+        for alias in [key, normalize_subject(name)] + [normalize_subject(a) for a in aliases]:
+            if alias not in existing:
+                db.session.add(SubjectAlias(subject_id=subject.id, alias_key=alias))
+                existing.add(alias)
+                added += 1
+    db.session.commit()
+    return added
+
+
+def owned_key(key: str, user_id=None) -> str:
+    # normalize_subject() strips ':', so a prefixed key can never collide with a shared one.
+    return f"{int(user_id)}:{key}" if user_id is not None else key
+
+
+def shared_key(alias_key: str) -> str:
+    return alias_key.split(":", 1)[-1]
+
+
+def visible_to(model, user_id=None):
+    # The seeded dictionary is shared; subjects a user typed in are only theirs.
+    if user_id is None:
+        return model.owner_id.is_(None)
+    return or_(model.owner_id.is_(None), model.owner_id == int(user_id))
+
+
+def _trigram_match(key):
+    # Only the shared dictionary: similarity against "<owner>:..." keys is meaningless
+    # and other users' spellings must not become anyone's fuzzy target.
+    if db.engine.dialect.name != "postgresql":
+        return None
+    try:
+        with db.session.begin_nested():
+            row = db.session.execute(text(
+                "SELECT subject_id FROM subject_alias "
+                "WHERE owner_id IS NULL AND alias_key % :key AND similarity(alias_key, :key) >= :threshold "
+                "ORDER BY similarity(alias_key, :key) DESC LIMIT 1"
+            ), {"key": key, "threshold": TRIGRAM_THRESHOLD}).first()
+    except Exception:
+        # pg_trgm isn't installed; the prefix scan below still works.
+        return None
+    return row[0] if row else None
+
+
+def _prefix_match(key, user_id=None):
+    # Aliases sharing the first two characters come from the prefix index, then
+    # difflib picks a close spelling among that handful ("mathematcs", "maths.").
+    prefixes = [SubjectAlias.alias_key.like(f"{key[:2]}%")]
+    if user_id is not None:
+        prefixes.append(SubjectAlias.alias_key.like(f"{owned_key(key[:2], user_id)}%"))
+    candidates = db.session.query(SubjectAlias.alias_key, SubjectAlias.subject_id).filter(
+        or_(*prefixes), visible_to(SubjectAlias, user_id)
+    ).all()
+    candidates = [(shared_key(alias), subject_id) for alias, subject_id in candidates]
+    by_alias = dict(candidates)
+
+    starts = {subject_id for alias, subject_id in candidates if alias.startswith(key) or key.startswith(alias + " ")}
+    if len(starts) == 1:
+        return starts.pop()
+
+    close = difflib.get_close_matches(key, list(by_alias), n=1, cutoff=FUZZY_CUTOFF)
+    return by_alias[close[0]] if close else None
+
+
+def lookup_subject(name, user_id=None):
+    key = normalize_subject(name)
+    if not key:
+        return None
+
+    rows = db.session.query(SubjectAlias.alias_key, SubjectAlias.subject_id).filter(
+        SubjectAlias.alias_key.in_({key, owned_key(key, user_id)})
+    ).all()
+    # The shared spelling wins over a user's own copy of it.
+    subject_id = min(rows, key=lambda row: ":" in row[0])[1] if rows else None
+    if subject_id is None and len(key) >= 3:
+        subject_id = _trigram_match(key) or _prefix_match(key, user_id)
+    return db.session.get(Subject, subject_id) if subject_id is not None else None
+
+
+def resolve_subject(name, user_id=None, create: bool = True):
+    subject = lookup_subject(name, user_id)
+    if subject is not None or not create:
+        return subject
+
+    key = normalize_subject(name)
+    if not key:
+        return None
+    subject_key = owned_key(key, user_id)
+    owner_id = int(user_id) if user_id is not None else None
+    try:
+        with db.session.begin_nested():
+            subject = Subject(key=subject_key, name=str(name).strip()[:100], owner_id=owner_id)
+            db.session.add(subject)
+            db.session.flush()
+            db.session.add(SubjectAlias(subject_id=subject.id, alias_key=subject_key, owner_id=owner_id))
+    except IntegrityError:
+        # Created concurrently under the same key.
+        subject = Subject.query.filter_by(key=subject_key).first()
+    return subject
+
+
+def detect_subject(text_value, user_id=None):
+    # Events carry no subject field; look for a known alias among the first words.
+    words = normalize_subject(text_value).split()[:12]
+    phrases = {" ".join(words[i:i + n]) for n in (1, 2, 3) for i in range(len(words) - n + 1)}
+    phrases = {p for p in phrases if " " in p or len(p) >= DETECT_MIN_WORD_LENGTH}
+    if not phrases:
+        return None
+    if user_id is not None:
+        phrases |= {owned_key(p, user_id) for p in phrases}
+
+    rows = db.session.query(SubjectAlias.alias_key, SubjectAlias.subject_id).filter(
+        SubjectAlias.alias_key.in_(phrases)
+    ).all()
+    if not rows:
+        return None
+    # Prefer the longest alias ("физическо възпитание" over "физика"-like fragments).
+    return max(rows, key=lambda row: len(shared_key(row[0])))[1]
+
+
+def search_subjects(prefix, user_id=None, limit: int = 10):
+    key = normalize_subject(prefix)
+    query = db.session.query(Subject).join(SubjectAlias, SubjectAlias.subject_id == Subject.id).filter(
+        visible_to(Subject, user_id)
+    )
+    if key:
+        prefixes = [SubjectAlias.alias_key.like(f"{key}%")]
+        if user_id is not None:
+            prefixes.append(SubjectAlias.alias_key.like(f"{owned_key(key, user_id)}%"))
+        query = query.filter(or_(*prefixes))
+    return query.group_by(Subject.id).order_by(func.min(func.length(SubjectAlias.alias_key)), Subject.name).limit(limit).all()
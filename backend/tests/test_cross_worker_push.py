@@ -0,0 +1,118 @@
+import os
+import socket
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+
+import pytest
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND)
+
+pytest.importorskip("kombu")
+
+# Worker B: a web process holding the user's socket. Flask-SocketIO's test client
+# refuses to run with a message queue, so it is a real server on a free port.
+SERVER = textwrap.dedent("""
+    import sys
+    from app_factory import create_app
+    from extensions import socketio
+    import sockets
+
+    app = create_app()
+    socketio.run(app, host="127.0.0.1", port=int(sys.argv[1]), allow_unsafe_werkzeug=True)
+""")
+
+# Worker A: a separate process that only builds the app and pushes to the user.
+PUSHER = textwrap.dedent("""
+    import sys
+    from app_factory import create_app
+    from extensions import push_to_user, socket_registry
+
+    app = create_app()
+    print("workers", ",".join(socket_registry.workers_for_user(sys.argv[1])))
+    push_to_user(sys.argv[1], "jobs:done", {"id": 1, "status": "complete"})
+""")
+
+
+@pytest.fixture
+def worker_env(tmp_path, monkeypatch):
+    env = {
+        "DATABASE_URL": f"sqlite:///{tmp_path / 'app.sqlite3'}",
+        "JWT_SECRET_KEY": "test-secret-key-that-is-long-enough-for-hs256",
+        "BLOB_STORE_PATH": str(tmp_path / "blobs"),
+        "SOCKETIO_MESSAGE_QUEUE": "filesystem://",
+        "SOCKETIO_QUEUE_PATH": str(tmp_path / "queue"),
+        "SOCKET_REGISTRY": "sql",
+        "SOCKET_REGISTRY_URL": f"sqlite:///{tmp_path / 'registry.sqlite3'}",
+        "SOCKET_REGISTRY_HEARTBEAT_SECONDS": "0",
+    }
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    return env
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def access_token(user_id, secret):
+    from flask import Flask
+    from flask_jwt_extended import JWTManager, create_access_token
+
+    app = Flask(__name__)
+    app.config["JWT_SECRET_KEY"] = secret
+    JWTManager(app)
+    with app.app_context():
+        return create_access_token(identity=user_id)
+
+
+def test_push_from_one_worker_reaches_a_socket_on_another(worker_env):
+    import socketio
+
+    env = {**os.environ, **worker_env}
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-c", SERVER, str(port)],
+        cwd=BACKEND, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    client = socketio.Client()
+    received = threading.Event()
+    pushes = []
+
+    @client.on("jobs:done")
+    def on_done(data):
+        pushes.append(data)
+        received.set()
+
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                client.connect(
+                    f"http://127.0.0.1:{port}", transports=["polling"],
+                    auth={"token": access_token("7", worker_env["JWT_SECRET_KEY"])}
+                )
+                break
+            except socketio.exceptions.ConnectionError:
+                if time.monotonic() > deadline or server.poll() is not None:
+                    raise
+                time.sleep(0.3)
+
+        pusher = subprocess.run(
+            [sys.executable, "-c", PUSHER, "7"], cwd=BACKEND, env=env, capture_output=True, text=True, timeout=60
+        )
+        assert pusher.returncode == 0, pusher.stderr
+        # The shared registry shows worker A that the user is connected elsewhere.
+        assert pusher.stdout.split("workers ", 1)[1].strip()
+
+        assert received.wait(15)
+        assert pushes[0] == {"id": 1, "status": "complete"}
+    finally:
+        client.disconnect()
+        server.terminate()
+        server.wait(10)
@@ -0,0 +1,144 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_router import AllModelsFailed, ModelRouter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeModels:
+    # Stands in for client.models: each model name maps to a reply or an exception.
+    def __init__(self, replies):
+        self.replies = replies
+        self.calls = []
+
+    def generate_content(self, model, contents):
+        self.calls.append(model)
+        reply = self.replies[model]
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+
+def make_router(clock, models=("primary", "backup"), failure_threshold=2):
+    return ModelRouter(list(models), failure_threshold=failure_threshold, cooldown=30, clock=clock)
+
+
+def parse_reply(models):
+    return lambda model: json.loads(models.generate_content(model=model, contents="prompt"))
+
+
+def test_falls_back_and_opens_the_breaker():
+    clock = FakeClock()
+    router = make_router(clock, failure_threshold=1)
+    models = FakeModels({"primary": ConnectionError("503"), "backup": '{"ok": true}'})
+
+    assert router.call(parse_reply(models)) == ({"ok": True}, "backup")
+    assert models.calls == ["primary", "backup"]
+
+    assert router.stats()["models"]["primary"]["state"] == "open"
+    assert router.ordered_models() == ["backup"]
+
+
+def test_parse_errors_do_not_trip_the_breaker():
+    clock = FakeClock()
+    router = make_router(clock)
+    models = FakeModels({"primary": "not json", "backup": '{"ok": true}'})
+
+    for _ in range(5):
+        assert router.call(parse_reply(models)) == ({"ok": True}, "backup")
+
+    primary = router.stats()["models"]["primary"]
+    assert primary["state"] == "closed"
+    assert primary["errors"] == 0
+
+
+def test_half_open_lets_a_single_trial_through():
+    clock = FakeClock()
+    router = make_router(clock, models=["primary"])
+    router.record("primary", 0.1, False)
+    router.record("primary", 0.1, False)
+    clock.now = 31
+
+    release = threading.Event()
+    entered = threading.Event()
+
+    def slow_trial(model):
+        entered.set()
+        release.wait(5)
+        return model
+
+    trial = threading.Thread(target=router.call, args=(slow_trial,))
+    trial.start()
+    assert entered.wait(5)
+
+    # While the trial is in flight, other requests don't reach the recovering model.
+    models = FakeModels({"primary": "{}"})
+    with pytest.raises(AllModelsFailed):
+        router.call(parse_reply(models))
+    assert models.calls == []
+
+    release.set()
+    trial.join(5)
+    assert router.stats()["models"]["primary"]["state"] == "closed"
+
+
+def test_acall_skips_parse_errors_and_raises_when_all_fail():
+    clock = FakeClock()
+    router = make_router(clock)
+
+    async def attempt(model):
+        raise ValueError("Empty response")
+
+    with pytest.raises(AllModelsFailed):
+        asyncio.run(router.acall(attempt))
+    assert all(m["state"] == "closed" for m in router.stats()["models"].values())
+
+
+def test_parse_errors_keep_the_failure_streak():
+    clock = FakeClock()
+    router = make_router(clock, models=["primary"])
+    replies = iter([TimeoutError("slow"), "not json", TimeoutError("slow")])
+
+    def flaky(model):
+        reply = next(replies)
+        if isinstance(reply, Exception):
+            raise reply
+        return json.loads(reply)
+
+    for _ in range(3):
+        with pytest.raises(AllModelsFailed):
+            router.call(flaky)
+
+    assert router.stats()["models"]["primary"]["state"] == "open"
+
+
+class Fatal(Exception):
+    pass
+
+
+def test_fatal_primary_error_does_not_start_the_hedge():
+    clock = FakeClock()
+    router = ModelRouter(["primary", "backup"], hedge=True, hedge_default_delay=5, clock=clock)
+    calls = []
+
+    def attempt(model):
+        calls.append(model)
+        raise Fatal("stream broke")
+
+    with pytest.raises(Fatal):
+        router.call(attempt, fatal=(Fatal,))
+    assert calls == ["primary"]
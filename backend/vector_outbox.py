@@ -0,0 +1,172 @@
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import insert
+from extensions import db, collection, chat_collection, embedding_cache
+from models import VectorOutbox
+from vector_sync import event_document, event_metadata
+import threading
+import json
+import os
+
+OUTBOX_BATCH_SIZE = int(os.environ.get("VECTOR_OUTBOX_BATCH_SIZE", "100"))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("VECTOR_OUTBOX_MAX_ATTEMPTS", "8"))
+MAX_BACKOFF_SECONDS = 300
+
+collections = {
+    "user_events": collection,
+    "chat_history": chat_collection
+}
+
+_wake = threading.Event()
+
+
+def enqueue_upsert(collection_name: str, doc_id: str, document: str, metadata: dict):
+    db.session.add(VectorOutbox(
+        collection=collection_name,
+        operation="upsert",
+        doc_id=str(doc_id),
+        document=document,
+        doc_metadata=json.dumps(metadata)
+    ))
+
+
+def enqueue_delete(collection_name: str, doc_ids):
+    for doc_id in doc_ids:
+        db.session.add(VectorOutbox(
+            collection=collection_name,
+            operation="delete",
+            doc_id=str(doc_id)
+        ))
+
+
+def enqueue_event(event):
+    enqueue_upsert("user_events", event.id, event_document(event), event_metadata(event))
+
+
+def enqueue_events(events):
+    if not events:
+        return
+    db.session.execute(insert(VectorOutbox), [
+        {
+            "collection": "user_events",
+            "operation": "upsert",
+            "doc_id": str(event.id),
+            "document": event_document(event),
+            "doc_metadata": json.dumps(event_metadata(event))
+        }
+        for event in events
+    ])
+
+
+def chat_message_doc_id(message):
+    # Assistant ids keep the historical "1" suffix so replays hit the same entries.
+    suffix = "" if message.role == "user" else "1"
+    return f"{message.session_id}_{message.id}{suffix}"
+
+
+def enqueue_chat_message(message, user_id: str):
+    enqueue_upsert("chat_history", chat_message_doc_id(message), message.content, {
+        "role": "user" if message.role == "user" else "ai",
+        "user_id": str(user_id),
+        "session_id": str(message.session_id),
+        "message_id": message.id
+    })
+
+
+def notify_indexer():
+    _wake.set()
+
+
+def apply_entries(collection_name: str, entries):
+    target = collections[collection_name]
+
+    # Only the newest operation per document matters; ids make replays idempotent.
+    latest = {}
+    for entry in entries:
+        latest[entry.doc_id] = entry
+
+    upserts = [e for e in latest.values() if e.operation == "upsert"]
+    deletes = [e.doc_id for e in latest.values() if e.operation == "delete"]
+
+    if upserts:
+        documents = [e.document for e in upserts]
+        target.upsert(
+            ids=[e.doc_id for e in upserts],
+            embeddings=embedding_cache(documents),
+            documents=documents,
+            metadatas=[json.loads(e.doc_metadata) for e in upserts]
+        )
+    if deletes:
+        target.delete(ids=deletes)
+
+
+def drain_outbox(batch_size: int = OUTBOX_BATCH_SIZE):
+    now = datetime.now(timezone.utc)
+    entries = VectorOutbox.query.filter(
+        VectorOutbox.available_at <= now,
+        VectorOutbox.dead_at.is_(None)
+    ).order_by(VectorOutbox.id).limit(batch_size).with_for_update(skip_locked=True).all()
+
+    if not entries:
+        db.session.commit()
+        return 0
+
+    grouped = {}
+    for entry in entries:
+        grouped.setdefault(entry.collection, []).append(entry)
+
+    processed = 0
+    for collection_name, group in grouped.items():
+        try:
+            apply_entries(collection_name, group)
+        except Exception as e:
+            print(f"Vector outbox: {collection_name} batch of {len(group)} failed: {e}")
+            if len(group) == 1:
+                fail_entry(group[0], e, now)
+                continue
+            # Retry one by one so a single bad entry doesn't hold back (or dead-letter) the rest.
+            for entry in group:
+                try:
+                    apply_entries(collection_name, [entry])
+                except Exception as entry_error:
+                    fail_entry(entry, entry_error, now)
+                    continue
+                db.session.delete(entry)
+                processed += 1
+            continue
+
+        for entry in group:
+            db.session.delete(entry)
+        processed += len(group)
+
+    db.session.commit()
+    return processed
+
+
+def fail_entry(entry, error, now):
+    entry.attempts += 1
+    entry.last_error = str(error)
+    if entry.attempts >= OUTBOX_MAX_ATTEMPTS:
+        entry.dead_at = now
+        print(f"Vector outbox: entry {entry.id} ({entry.collection}/{entry.doc_id}) gave up after {entry.attempts} attempts")
+        return
+    entry.available_at = now + timedelta(seconds=min(2 ** entry.attempts, MAX_BACKOFF_SECONDS))
+
+
+def start_indexer(app, interval: float):
+    def loop():
+        while True:
+            _wake.wait(interval)
+            _wake.clear()
+            with app.app_context():
+                try:
+                    while drain_outbox() >= OUTBOX_BATCH_SIZE:
+                        pass
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Vector indexer failed: {e}")
+                finally:
+                    db.session.remove()
+
+    thread = threading.Thread(target=loop, name="vector-indexer", daemon=True)
+    thread.start()
+    return thread
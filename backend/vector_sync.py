@@ -0,0 +1,186 @@
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from extensions import db, collection, embedding_cache
+from models import Event, EventTombstone, SyncCheckpoint
+import threading
+import os
+
+EVENTS_CHECKPOINT = "user_events"
+SYNC_BATCH_SIZE = int(os.environ.get("EVENT_SYNC_BATCH_SIZE", "500"))
+# Edits are looked up a little before the last mark: a transaction that committed
+# late can carry an updated_at older than rows already seen.
+CHANGE_GRACE = timedelta(seconds=int(os.environ.get("EVENT_SYNC_GRACE_SECONDS", "60")))
+
+changed_at = func.coalesce(Event.updated_at, Event.created_at)
+
+
+def event_document(event):
+    return f"Date: {event.date}, Type: {event.type}, Task: {event.description}"
+
+
+def event_metadata(event):
+    return {"user_id": str(event.user_id)}
+
+
+def iter_event_chunks(after_id: int, batch_size: int, upto_id=None, changed_since=None):
+    last_id = after_id
+    while True:
+        query = db.session.query(
+            Event.id, Event.user_id, Event.date, Event.type, Event.description, Event.created_at
+        ).filter(Event.id > last_id)
+        if upto_id is not None:
+            query = query.filter(Event.id <= upto_id)
+        if changed_since is not None:
+            query = query.filter(changed_at > changed_since - CHANGE_GRACE)
+        chunk = query.order_by(Event.id).limit(batch_size).all()
+
+        if not chunk:
+            return
+        yield chunk
+        last_id = chunk[-1].id
+
+
+def upsert_changed(chunk, stats):
+    ids = [str(row.id) for row in chunk]
+    existing = collection.get(ids=ids, include=["documents", "metadatas"])
+    indexed = {
+        doc_id: (doc, meta)
+        for doc_id, doc, meta in zip(existing["ids"], existing["documents"], existing["metadatas"])
+    }
+
+    changed = []
+    for doc_id, row in zip(ids, chunk):
+        document, metadata = event_document(row), event_metadata(row)
+        current = indexed.get(doc_id)
+        if current is None:
+            stats["added"] += 1
+        elif current != (document, metadata):
+            stats["updated"] += 1
+        else:
+            continue
+        changed.append((doc_id, document, metadata))
+
+    if changed:
+        documents = [doc for _, doc, _ in changed]
+        collection.upsert(
+            ids=[doc_id for doc_id, _, _ in changed],
+            embeddings=embedding_cache(documents),
+            documents=documents,
+            metadatas=[meta for _, _, meta in changed]
+        )
+
+
+def delete_orphans(batch_size: int, stats):
+    offset = 0
+    while True:
+        page = collection.get(include=[], limit=batch_size, offset=offset)["ids"]
+        if not page:
+            return
+
+        numeric_ids = [int(doc_id) for doc_id in page if doc_id.isdigit()]
+        alive = {
+            str(row.id) for row in
+            db.session.query(Event.id).filter(Event.id.in_(numeric_ids)).all()
+        } if numeric_ids else set()
+
+        orphans = [doc_id for doc_id in page if doc_id not in alive]
+        if orphans:
+            collection.delete(ids=orphans)
+            stats["deleted"] += len(orphans)
+
+        offset += len(page) - len(orphans)
+
+
+def apply_tombstones(checkpoint, upto_id, batch_size: int, stats):
+    last_id = checkpoint.last_tombstone_id or 0
+    while last_id < upto_id:
+        rows = db.session.query(EventTombstone.id, EventTombstone.event_id).filter(
+            EventTombstone.id > last_id, EventTombstone.id <= upto_id
+        ).order_by(EventTombstone.id).limit(batch_size).all()
+        if not rows:
+            break
+
+        collection.delete(ids=[str(row.event_id) for row in rows])
+        stats["deleted"] += len(rows)
+        last_id = rows[-1].id
+        checkpoint.last_tombstone_id = last_id
+        db.session.commit()
+
+
+def load_checkpoint(name: str):
+    checkpoint = db.session.get(SyncCheckpoint, name)
+    if checkpoint is not None:
+        return checkpoint
+
+    try:
+        with db.session.begin_nested():
+            checkpoint = SyncCheckpoint(name=name, last_id=0)
+            db.session.add(checkpoint)
+    except IntegrityError:
+        # Every worker reconciles on startup; another one created it first.
+        checkpoint = db.session.get(SyncCheckpoint, name, populate_existing=True)
+    return checkpoint
+
+
+def reconcile_events(full: bool = False, batch_size: int = SYNC_BATCH_SIZE):
+    checkpoint = load_checkpoint(EVENTS_CHECKPOINT)
+
+    # An empty index means the checkpoint no longer describes what Chroma holds.
+    if collection.count() == 0:
+        full = True
+
+    stats = {"full": full, "scanned": 0, "added": 0, "updated": 0, "deleted": 0}
+    after_id = 0 if full else checkpoint.last_id
+    previous_last_id = checkpoint.last_id or 0
+
+    # Marks are taken before scanning, so anything changed during the run is seen next time.
+    changed_mark = db.session.query(func.max(changed_at)).scalar()
+    tombstone_mark = db.session.query(func.max(EventTombstone.id)).scalar() or 0
+
+    for chunk in iter_event_chunks(after_id, batch_size):
+        upsert_changed(chunk, stats)
+        stats["scanned"] += len(chunk)
+
+        checkpoint.last_id = max(checkpoint.last_id or 0, chunk[-1].id)
+        newest = max((row.created_at for row in chunk if row.created_at), default=None)
+        if newest and (checkpoint.last_created_at is None or newest > checkpoint.last_created_at):
+            checkpoint.last_created_at = newest
+        checkpoint.updated_at = datetime.now(timezone.utc)
+        db.session.commit()
+
+    if full:
+        delete_orphans(batch_size, stats)
+        checkpoint.last_tombstone_id = tombstone_mark
+    else:
+        # Rows below the id checkpoint that were edited, or deleted, since the last run.
+        if previous_last_id:
+            for chunk in iter_event_chunks(0, batch_size, upto_id=previous_last_id, changed_since=checkpoint.last_changed_at):
+                upsert_changed(chunk, stats)
+                stats["scanned"] += len(chunk)
+        apply_tombstones(checkpoint, tombstone_mark, batch_size, stats)
+
+    if changed_mark is not None:
+        checkpoint.last_changed_at = changed_mark
+    db.session.commit()
+    stats["last_id"] = checkpoint.last_id
+    print(f"Event sync finished: {stats}")
+    return stats
+
+
+def start_periodic_sync(app, interval: float):
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(interval):
+            with app.app_context():
+                try:
+                    reconcile_events()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Event sync failed: {e}")
+                finally:
+                    db.session.remove()
+
+    threading.Thread(target=loop, name="event-sync", daemon=True).start()
+    return stop
@@ -0,0 +1,21 @@
+from app_factory import create_app
+from jobs import start_job_workers, JOB_WORKERS
+import os
+
+
+def main():
+    if not os.environ.get("SOCKETIO_MESSAGE_QUEUE"):
+        # Without a shared queue, completion pushes from this process reach no socket; clients can still poll.
+        print("Job worker: SOCKETIO_MESSAGE_QUEUE is not set, jobs:done pushes will not be delivered")
+
+    # Only the app and its database: schema upgrades, warm-up and the indexer
+    # belong to the web process, which is deployed alongside.
+    app = create_app()
+    threads = start_job_workers(app, JOB_WORKERS)
+    print(f"Job worker started with {len(threads)} threads")
+    for thread in threads:
+        thread.join()
+
+
+if __name__ == "__main__":
+    main()
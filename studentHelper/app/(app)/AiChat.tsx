@@ -96,7 +96,8 @@ export default function ExamTutorScreen() {
       });
     });
 
-    socket.on('chat:stream:chunk', (data: { session_id?: string; chunk?: string }) => {
+    socket.on('chat:stream:chunk', (data: { session_id?: string; chunk?: string }, ack?: () => void) => {
+      ack?.();
       const targetSessionId = data.session_id || pendingSessionIdRef.current;
       const pendingAssistantMessageId = pendingAssistantMessageIdRef.current;
       const chunkText = data.chunk || '';
@@ -261,7 +262,7 @@ export default function ExamTutorScreen() {
     pendingSessionIdRef.current = sessionId;
     pendingAssistantMessageIdRef.current = null;
     setLoading(true);
-    socket.emit('chat:send', { session_id: sessionId, image: imageB64, message: text });
+    socket.emit('chat:send', { session_id: sessionId, image: imageB64, message: text, ack: true });
   };
 
   const updateLocalMessages = (sessionId: string, newMessage: Message) => {
@@ -1,9 +1,10 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { View, Text, TextInput, TouchableOpacity, ScrollView, StyleSheet, Alert, ActivityIndicator, Platform, StatusBar, Dimensions } from 'react-native';
 import * as ImagePicker from 'expo-image-picker';
 import { Calendar } from 'react-native-calendars';
 import { API_URL } from '../../config/api';
 import { useSession } from '../../ctx';
+import { runJob, JobAuthError } from '../../jobs';
 import { Ionicons } from '@expo/vector-icons';
 import Animated, { Layout, FadeIn } from 'react-native-reanimated';
 
@@ -33,11 +34,14 @@ export default function CalendarScreen() {
   const [showSuccessPopup, setShowSuccessPopup] = useState(false);
   const [showDeleteConfirm, setShowDeleteConfirm] = useState(false);
   const [pendingDeleteEvent, setPendingDeleteEvent] = useState<CalendarEvent | null>(null);
+  const scanAbortRef = useRef<AbortController | null>(null);
 
   useEffect(() => {
     fetchEvents();
   }, [session]);
 
+  useEffect(() => () => scanAbortRef.current?.abort(), []);
+
   const fetchEvents = async () => {
     if (!session) return;
     try {
@@ -91,29 +95,28 @@ export default function CalendarScreen() {
 
     if (!result.canceled && result.assets[0].base64) {
       setIsScanning(true);
+      scanAbortRef.current?.abort();
+      const controller = new AbortController();
+      scanAbortRef.current = controller;
       try {
-        const response = await fetch(`${API_URL}/chat/extract-events`, {
-          method: 'POST',
-          headers: {
-            'Content-Type': 'application/json',
-            'Authorization': `Bearer ${session}`,
-          },
-          body: JSON.stringify({ image: result.assets[0].base64 }),
+        const { ok, data } = await runJob('extract-events', { image: result.assets[0].base64 }, session, {
+          signal: controller.signal,
         });
-        if (response.status === 401 || response.status === 422) {
-          signOut();
-          return;
-        }
-        const data = await response.json();
-        if (response.ok) {
+        if (ok) {
           setExtractedResults(data.events || []);
           setShowSuccessPopup(true);
           fetchEvents();
         } else {
           Alert.alert("Грешка", "Не успяхме да разчетем снимката.");
         }
-      } catch (err) {
+      } catch (err: any) {
+        if (err instanceof JobAuthError) {
+          signOut();
+          return;
+        }
+        if (err?.name === 'AbortError') return;
         console.error(err);
+        Alert.alert("Грешка", "Не успяхме да разчетем снимката.");
       } finally {
         setIsScanning(false);
       }
@@ -50,7 +50,7 @@ export default function Profile() {
       const infoData = await infoRes.json();
       if (infoRes.ok) {
         setEmail(infoData.email);
-        setProfilePic(infoData.profile_pic);
+        setProfilePic(infoData.profile_pic_thumb);
       }
 
       // 2. Fetch Stats
@@ -157,7 +157,8 @@ export default function Profile() {
         }
 
         if (res.ok) {
-          setProfilePic(base64Image);
+          const data = await res.json();
+          setProfilePic(data.profile_pic_thumb ?? base64Image);
           Alert.alert('Success', 'Profile picture updated successfully');
         } else {
           throw new Error('Upload failed');
@@ -190,7 +191,10 @@ export default function Profile() {
             {uploading ? (
               <ActivityIndicator color="#a0bfb9" />
             ) : profilePic ? (
-              <Image source={{ uri: profilePic! }} style={styles.avatarImage} />
+              <Image
+                source={{ uri: profilePic!, headers: { Authorization: `Bearer ${session}` } }}
+                style={styles.avatarImage}
+              />
             ) : (
               <Ionicons name="person" size={40} color="#c0cfd0" />
             )}
@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useCallback } from 'react';
+import React, { useState, useEffect, useCallback, useRef } from 'react';
 import {
     View, Text, StyleSheet, ScrollView, TouchableOpacity, TextInput, Image, ActivityIndicator, Alert, Platform, KeyboardAvoidingView
 } from 'react-native';
@@ -10,6 +10,10 @@ import Markdown from 'react-native-markdown-display';
 import { useLocalSearchParams, useRouter } from 'expo-router';
 import { LinearGradient } from 'expo-linear-gradient';
 import Animated, { FadeIn } from 'react-native-reanimated';
+import { io, Socket } from 'socket.io-client';
+
+type AnalysisFrame = { id: number; offset: number; end: number; chunk: string };
+type StreamState = { id: number | null; end: number; done: boolean; pending: AnalysisFrame[]; resyncing: boolean };
 
 export default function SchoolworkAnalysisScreen() {
     const { session, signOut } = useSession();
@@ -34,6 +38,102 @@ export default function SchoolworkAnalysisScreen() {
     const [viewSubtitle, setViewSubtitle] = useState('');
     const [loadingView, setLoadingView] = useState(false);
 
+    // Streamed analysis: id of the analysis being received and how much of it we have.
+    // Offsets and ends are UTF-16 code units, the same unit JavaScript strings are sliced in.
+    const socketRef = useRef<Socket | null>(null);
+    const streamRef = useRef<StreamState>({ id: null, end: 0, done: true, pending: [], resyncing: false });
+    const applyChunkRef = useRef<(data: AnalysisFrame) => void>(() => {});
+
+    const resync = useCallback(() => {
+        const stream = streamRef.current;
+        const socket = socketRef.current;
+        if (stream.id === null || stream.resyncing || !socket || !socket.connected) return;
+        stream.resyncing = true;
+        socket.emit('schoolwork:analysis:resume', { id: stream.id, offset: stream.end },
+            (data: AnalysisFrame & { status: string; error?: string }) => {
+                stream.resyncing = false;
+                if (data.error) return;
+                applyChunkRef.current(data);
+                if (data.status !== 'streaming') stream.done = true;
+            });
+    }, []);
+
+    const applyChunk = useCallback((data: AnalysisFrame) => {
+        const stream = streamRef.current;
+        if (data.id !== stream.id || data.end <= stream.end) return;
+        if (data.offset > stream.end) {
+            // Text between our copy and this frame is missing (e.g. the resume came from
+            // an older saved copy). Hold the frame and fetch the gap instead of skipping it.
+            stream.pending.push(data);
+            resync();
+            return;
+        }
+
+        let fresh = data.chunk.slice(stream.end - data.offset);
+        stream.end = data.end;
+        // Frames held back behind a gap may line up now.
+        let next = stream.pending.find(f => f.offset <= stream.end && f.end > stream.end);
+        while (next) {
+            fresh += next.chunk.slice(stream.end - next.offset);
+            stream.end = next.end;
+            next = stream.pending.find(f => f.offset <= stream.end && f.end > stream.end);
+        }
+        stream.pending = stream.pending.filter(f => f.end > stream.end);
+        setAnalysisContent(prev => (prev || '') + fresh);
+    }, [resync]);
+    applyChunkRef.current = applyChunk;
+
+    useEffect(() => {
+        if (!session) return;
+
+        const socket = io(API_URL, {
+            transports: ['websocket'],
+            auth: { token: session },
+            autoConnect: true,
+            reconnection: true,
+        });
+
+        socket.on('connect', () => {
+            // After a reconnect, ask for whatever was generated while we were away.
+            if (!streamRef.current.done) resync();
+        });
+
+        socket.on('schoolwork:analysis:start', (data: { id: number }) => {
+            streamRef.current = { id: data.id, end: 0, done: false, pending: [], resyncing: false };
+            setAnalysisContent('');
+            setMode('view');
+            setLoading(false);
+        });
+
+        socket.on('schoolwork:analysis:chunk', applyChunk);
+
+        socket.on('schoolwork:analysis:end', (data: { id: number; length: number }) => {
+            const stream = streamRef.current;
+            if (data.id !== stream.id) return;
+            stream.done = true;
+            // The final text is saved before "end" is sent, so a resume now fills any gap.
+            if (stream.end < data.length) resync();
+        });
+
+        socket.on('schoolwork:analysis:error', (data: { id?: number; error?: string }) => {
+            streamRef.current.done = true;
+            setLoading(false);
+            Alert.alert("Грешка", data.error || "Анализа беше неуспешен.");
+        });
+
+        socketRef.current = socket;
+
+        return () => {
+            socket.off('connect');
+            socket.off('schoolwork:analysis:start');
+            socket.off('schoolwork:analysis:chunk');
+            socket.off('schoolwork:analysis:end');
+            socket.off('schoolwork:analysis:error');
+            socket.disconnect();
+            socketRef.current = null;
+        };
+    }, [session, applyChunk, resync]);
+
     const resetForm = useCallback(() => {
         setMode('create');
         setAnalysisContent(null);
@@ -62,6 +162,11 @@ export default function SchoolworkAnalysisScreen() {
                 const data = await res.json();
                 if (res.ok) {
                     setAnalysisContent(data.content);
+                    if (data.status === 'streaming') {
+                        // Still being written: pick up the live stream from where the saved copy ends.
+                        streamRef.current = { id: data.id, end: data.length, done: false, pending: [], resyncing: false };
+                        resync();
+                    }
                     setViewTitle(data.subject);
                     setViewSubtitle(data.topic || (data.type === 'past_exam' ? 'Преглед на изпит' : 'Помощ за домашно'));
                 } else {
@@ -85,7 +190,7 @@ export default function SchoolworkAnalysisScreen() {
                 resetForm();
             }
         }
-    }, [params.analysisId, resetForm, session, params.mode]);
+    }, [params.analysisId, resetForm, session, params.mode, resync]);
 
     const takePhoto = async () => {
         const permission = await ImagePicker.requestCameraPermissionsAsync();
@@ -107,8 +212,17 @@ export default function SchoolworkAnalysisScreen() {
         if (!subject) return Alert.alert("Липсваща информация", "Моля въведете предмет.");
 
         setLoading(true);
+        const payload = { type, subject, grade, mistakes, notes, topic, images };
+        setViewTitle(subject);
+        setViewSubtitle("Резултат от анализа");
+
+        const socket = socketRef.current;
+        if (socket && socket.connected) {
+            socket.emit('schoolwork:analyze', payload);
+            return;
+        }
+
         try {
-            const payload = { type, subject, grade, mistakes, notes, topic, images };
             const response = await fetch(`${API_URL}/chat/analyze-schoolwork`, {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json', 'Authorization': `Bearer ${session}` },
@@ -123,8 +237,6 @@ export default function SchoolworkAnalysisScreen() {
             const data = await response.json();
             if (response.ok) {
                 setAnalysisContent(data.analysis);
-                setViewTitle(subject);
-                setViewSubtitle("Резултат от анализа");
                 setMode('view');
             } else {
                 Alert.alert("Грешка", data.error || "Анализа беше неуспешен.");
@@ -1,10 +1,11 @@
-import React, { useState, useCallback } from 'react';
+import React, { useState, useCallback, useEffect, useRef } from 'react';
 import * as ImagePicker from 'expo-image-picker'
 import {
   View, Text, StyleSheet, ScrollView, TouchableOpacity, Image,
   TextInput, ActivityIndicator, Alert, Platform, StatusBar, KeyboardAvoidingView
 } from 'react-native';
 import { useSession } from '../../ctx';
+import { runJob, JobAuthError } from '../../jobs';
 import { useFocusEffect } from 'expo-router';
 import { API_URL } from '../../config/api';
 import { Ionicons } from '@expo/vector-icons';
@@ -29,6 +30,9 @@ export default function TestGeneratorScreen() {
   const [quiz, setQuiz] = useState<any[] | null>(null);
   const [userAnswers, setUserAnswers] = useState<Record<number, string>>({});
   const [score, setScore] = useState<number | null>(null);
+  const generateAbortRef = useRef<AbortController | null>(null);
+
+  useEffect(() => () => generateAbortRef.current?.abort(), []);
 
   useFocusEffect(
     useCallback(() => {
@@ -91,29 +95,25 @@ export default function TestGeneratorScreen() {
     if (!context.trim() && images.length === 0) return Alert.alert("Нужен контекст", "Моля поставете вашите бележки първо.");
 
     setIsGenerating(true);
+    generateAbortRef.current?.abort();
+    const controller = new AbortController();
+    generateAbortRef.current = controller;
     try {
-      const response = await fetch(`${API_URL}/chat/generate-test`, {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-          'Authorization': `Bearer ${session}`
-        },
-        body: JSON.stringify({
-          subject: selectedTest.description,
-          context: context,
-          questionsCount: numQuestions,
-          images: images
-        }),
-      });
+      const { ok, data } = await runJob('generate-test', {
+        subject: selectedTest.description,
+        context: context,
+        questionsCount: numQuestions,
+        images: images
+      }, session, { signal: controller.signal });
+      if (!ok) throw new Error(data?.error);
 
-      if (response.status === 401 || response.status === 422) {
+      setQuiz(data.questions);
+    } catch (e: any) {
+      if (e instanceof JobAuthError) {
         signOut();
         return;
       }
-
-      const data = await response.json();
-      setQuiz(data.questions);
-    } catch (e) {
+      if (e?.name === 'AbortError') return;
       Alert.alert("ИА Грешка", "Не успяхме да генерираме теста. Проверете връзката си.");
     } finally {
       setIsGenerating(false);
@@ -0,0 +1,112 @@
+import { API_URL } from './config/api';
+
+const POLL_INTERVAL_MS = 1500;
+// A job nobody has claimed by then most likely has no worker to run it
+// (web-only or local deployment): it is cancelled and run synchronously instead.
+const QUEUE_TIMEOUT_MS = 20000;
+const JOB_TIMEOUT_MS = 5 * 60 * 1000;
+
+// The endpoints each job kind used to be served by, kept for the fallback.
+const SYNC_ENDPOINTS: Record<string, string> = {
+  'extract-events': '/chat/extract-events',
+  'analyze-schoolwork': '/chat/analyze-schoolwork',
+  'generate-test': '/chat/generate-test',
+};
+
+export class JobAuthError extends Error {}
+
+export class JobTimeoutError extends Error {}
+
+export type JobResult = {
+  ok: boolean;
+  status: number;
+  data: any;
+};
+
+type RunJobOptions = {
+  signal?: AbortSignal;
+  timeoutMs?: number;
+};
+
+const abortError = () => {
+  const error = new Error('Aborted');
+  error.name = 'AbortError';
+  return error;
+};
+
+const sleep = (ms: number, signal?: AbortSignal) => new Promise<void>((resolve, reject) => {
+  if (signal?.aborted) return reject(abortError());
+  const timer = setTimeout(() => {
+    signal?.removeEventListener('abort', onAbort);
+    resolve();
+  }, ms);
+  const onAbort = () => {
+    clearTimeout(timer);
+    reject(abortError());
+  };
+  signal?.addEventListener('abort', onAbort, { once: true });
+});
+
+async function runSync(kind: string, body: object, headers: Record<string, string>, signal?: AbortSignal): Promise<JobResult> {
+  const response = await fetch(`${API_URL}${SYNC_ENDPOINTS[kind]}`, {
+    method: 'POST',
+    headers,
+    body: JSON.stringify(body),
+    signal,
+  });
+  if (response.status === 401 || response.status === 422) throw new JobAuthError();
+  return { ok: response.ok, status: response.status, data: await response.json() };
+}
+
+// Queues a background job and polls it until a worker has finished it. The
+// result has the same status and body the synchronous endpoint returns.
+export async function runJob(
+  kind: string,
+  body: object,
+  session?: string | null,
+  { signal, timeoutMs = JOB_TIMEOUT_MS }: RunJobOptions = {}
+): Promise<JobResult> {
+  const headers = {
+    'Content-Type': 'application/json',
+    'Authorization': `Bearer ${session}`,
+  };
+
+  const created = await fetch(`${API_URL}/jobs/${kind}`, {
+    method: 'POST',
+    headers,
+    body: JSON.stringify(body),
+    signal,
+  });
+  if (created.status === 401 || created.status === 422) throw new JobAuthError();
+
+  const job = await created.json();
+  if (created.status !== 202) return { ok: false, status: created.status, data: job };
+
+  const startedAt = Date.now();
+  let claimed = false;
+
+  while (Date.now() - startedAt < timeoutMs) {
+    await sleep(POLL_INTERVAL_MS, signal);
+
+    const response = await fetch(`${API_URL}/jobs/${job.id}`, { headers, signal });
+    if (response.status === 401 || response.status === 422) throw new JobAuthError();
+
+    const current = await response.json();
+    if (!response.ok) return { ok: false, status: response.status, data: current };
+
+    if (current.status === 'complete' || current.status === 'failed') {
+      const status = current.result_status ?? 500;
+      return { ok: status < 400, status, data: current.result };
+    }
+
+    claimed = claimed || current.status !== 'queued';
+    if (!claimed && Date.now() - startedAt >= QUEUE_TIMEOUT_MS && SYNC_ENDPOINTS[kind]) {
+      // Cancelling only succeeds while the job is still queued, so it can't run twice.
+      const cancel = await fetch(`${API_URL}/jobs/${job.id}`, { method: 'DELETE', headers, signal });
+      if (cancel.ok) return runSync(kind, body, headers, signal);
+      claimed = true;
+    }
+  }
+
+  throw new JobTimeoutError(`Job ${job.id} did not finish in time`);
+}